@@ -0,0 +1,84 @@
+"""
+Compact index of the active (not closed) nodes of a grid
+Masked DEMs close large areas (nodata_code == 999, z > 1.8) where the flow velocity and so
+the erosion are zero; the node kernels gather their inputs at the active nodes only, work on
+the packed arrays and scatter the results back, leaving the closed nodes at zero
+The index is built from grid.status_at_node and rebuilt only when the boundaries change
+"""
+
+# imports
+import weakref
+import numpy as np
+from grid_mappers import get_mappers
+
+_ACTIVE = weakref.WeakKeyDictionary()
+
+
+class ActiveNodes:
+    """Packed index of the nodes of a grid that are not closed.
+
+    Inputs :
+        grid : `obj`
+            A landlab grid
+
+    nodes holds the active node ids (sorted); pack() gathers node values at
+    them and scatter() writes packed values back. The link -> node minimum of
+    GridMappers is evaluated at the active nodes only.
+    """
+
+    def __init__(self, grid):
+        self._grid = weakref.ref(grid)  # not a strong reference: the cache is keyed by the grid
+        self._mappers = get_mappers(grid)
+        self.rebuild()
+
+    @property
+    def grid(self):
+        """The grid of the index (None once it has been deleted)."""
+        return self._grid()
+
+    def rebuild(self):
+        """Rebuild the index from the current node status."""
+        grid = self._grid()
+        self._status = np.array(grid.status_at_node)  # plain copy: the landlab array refers to the grid
+        self.nodes = np.flatnonzero(grid.status_at_node != grid.BC_NODE_IS_CLOSED)
+        self.size = self.nodes.size
+        self.fraction = self.size / grid.number_of_nodes
+        self._links_at_node = np.ascontiguousarray(self._mappers._links_at_node[:, self.nodes])
+        self._gather = np.empty(self._links_at_node.shape)
+        self._packed = np.empty(self.size)
+
+    def refresh(self):
+        """Rebuild the index if the node status changed since it was built; returns self."""
+        if not np.array_equal(self._status, self._grid().status_at_node):
+            self.rebuild()
+        return self
+
+    def pack(self, values_at_node, out=None):
+        """Values at the active nodes."""
+        if out is None:
+            out = np.empty(self.size)
+        self._mappers._check_size(values_at_node, self._mappers.number_of_nodes, 'node')
+        return np.take(values_at_node, self.nodes, out=out, mode='clip')
+
+    def scatter(self, packed, out):
+        """Write packed values into the active nodes of out (closed nodes are not touched)."""
+        out[self.nodes] = packed
+        return out
+
+    def min_of_node_links_to_node(self, values_at_link, out=None):
+        """GridMappers.min_of_node_links_to_node at the active nodes, closed nodes of out untouched."""
+        m = self._mappers
+        if out is None:
+            out = np.zeros(m.number_of_nodes)
+        np.take(m._padded(values_at_link), self._links_at_node, out=self._gather, mode='clip')
+        out[self.nodes] = m._min_of_rows(self._gather, self._packed)
+        return out
+
+
+def get_active_nodes(grid):
+    """Return the ActiveNodes of a grid, built the first time and rebuilt when its boundaries change."""
+    try:
+        return _ACTIVE[grid].refresh()
+    except KeyError:
+        active = _ACTIVE[grid] = ActiveNodes(grid)
+        return active
@@ -0,0 +1,116 @@
+"""
+Benchmark of the coarse-to-fine initialization of the first tidal flow solve
+The first WarmStartTidalFlowCalculator.run_one_step, which has no previous solution, is run
+from a zero initial guess and with each set of coarsening factors, on zSW3.asc and on the
+StraightChannel set-up scaled up by the given factors; the landlab TidalFlowCalculator
+(direct solve) is the reference
+Wall time (best of --repeat runs), the part of it spent on the coarse levels, the fine-grid
+solver iterations and the largest velocity difference to the zero-guess solve are printed
+and saved as JSON
+
+Command line example:
+    python benchmarks/bench_flow_init.py --scales 1 2 --coarsen 2 4 4,2 --out flow_init.json
+"""
+
+# imports
+import argparse
+import json
+import os
+import platform
+import time
+import numpy as np
+from bench_pipeline import ROOT, straight_channel, zsw3_setups
+
+import landlab
+from landlab.components import TidalFlowCalculator
+from morphodynamics import DEFAULT_PARAMETERS
+from tidal_flow_solver import WarmStartTidalFlowCalculator
+
+P = DEFAULT_PARAMETERS
+
+
+def first_solve(grid, flow_kwds, repeat, **kwds):
+    """Best time of repeat first solves with fresh calculators; returns (time, last calculator)."""
+    times = []
+    for _ in range(repeat):
+        if kwds:
+            tfc = WarmStartTidalFlowCalculator(grid, **flow_kwds, **kwds)
+        else:
+            tfc = TidalFlowCalculator(grid, **flow_kwds)
+        t0 = time.perf_counter()
+        tfc.run_one_step()
+        times.append(time.perf_counter() - t0)
+    return min(times), tfc
+
+
+def run_setup(name, grid, flow_kwds, args):
+    """Benchmark records of the reference, zero-guess and coarse-to-fine first solves."""
+    records = []
+
+    def record(mode, t, tfc, velocity=None):
+        r = {'setup': name, 'nodes': int(grid.number_of_nodes), 'mode': mode, 'time_s': t,
+             'coarse_s': getattr(tfc, 'coarse_time', 0.0),
+             'iterations': getattr(tfc, 'last_iterations', None),
+             'coarse_iterations': list(getattr(tfc, 'coarse_iterations', [])),
+             'max_velocity_diff': None}
+        if velocity is not None:
+            r['max_velocity_diff'] = float(np.abs(grid.at_link['ebb_tide_flow__velocity'] - velocity).max())
+        records.append(r)
+        print('%-16s %-12s %9d %9.3f %9.3f %9.3f %6s %-10s %s' % (
+            name, mode, r['nodes'], t, r['coarse_s'], t - r['coarse_s'],
+            '-' if r['iterations'] is None else r['iterations'],
+            ','.join(str(i) for i in r['coarse_iterations']) or '-',
+            '-' if r['max_velocity_diff'] is None else '%.1e' % r['max_velocity_diff']))
+
+    t, tfc = first_solve(grid, flow_kwds, args.repeat)
+    record('landlab', t, tfc)
+    t, tfc = first_solve(grid, flow_kwds, args.repeat, solver=args.solver)
+    record('zero guess', t, tfc)
+    velocity = grid.at_link['ebb_tide_flow__velocity'].copy()
+    for factors in args.coarsen:
+        coarsen = [int(f) for f in factors.split(',')]
+        t, tfc = first_solve(grid, flow_kwds, args.repeat, solver=args.solver, coarsen=coarsen)
+        record('coarsen ' + factors, t, tfc, velocity)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the coarse-to-fine flow initialization.')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 2],
+                        help='size factors of the StraightChannel set-up (rows and columns)')
+    parser.add_argument('--setups', nargs='+', default=['channel', 'zsw3'], choices=['channel', 'zsw3'])
+    parser.add_argument('--dem', default=os.path.join(ROOT, 'zSW3.asc'), help='ESRI ASCII DEM of the zsw3 set-up')
+    parser.add_argument('--coarsen', nargs='+', default=['2', '4', '4,2'],
+                        help='coarsening factors to compare, comma separated per run')
+    parser.add_argument('--solver', default='cg', help='iterative solver of the fine grid')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode (best time is kept)')
+    parser.add_argument('--out', default='flow_init.json', help='output JSON file')
+    args = parser.parse_args(argv)
+
+    print('%-16s %-12s %9s %9s %9s %9s %6s %-10s %s' % ('setup', 'mode', 'nodes', 'time (s)', 'coarse',
+                                                       'fine', 'iters', 'coarse it', 'max dv'))
+    records = []
+    if 'zsw3' in args.setups:
+        load, setup = zsw3_setups(args.dem)
+        grid = setup(load())
+        records += run_setup('zsw3', grid, {'tidal_range': P['tidal_range'], 'tidal_period': P['tidal_period'],
+                                            'roughness': 'roughness', 'min_water_depth': P['mwd']}, args)
+    if 'channel' in args.setups:
+        for scale in args.scales:
+            records += run_setup('channel x' + str(scale), straight_channel(scale),
+                                 {'tidal_range': 3.1, 'tidal_period': 12.5*3600, 'roughness': 'roughness',
+                                  'min_water_depth': P['mwd']}, args)
+
+    results = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'landlab': landlab.__version__, 'machine': platform.machine(),
+                 'cpu_count': os.cpu_count(), 'args': vars(args)},
+        'results': records,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('saved ' + str(len(records)) + ' results to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
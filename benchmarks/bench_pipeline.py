@@ -0,0 +1,255 @@
+"""
+Benchmarks of the tidal erosion and particle pipelines
+Every stage (DEM loading, parsed and from the binary cache of dem_cache,
+TidalFlowCalculator.run_one_step, populateGrids, updategrids, totalsedimenterosion_mudsine,
+gridded_vars, particletransport.tidal_particles with dorado and with the native engine) is run
+on the StraightChannel and RandField2D set-ups scaled up by the given factors, and on zSW3.asc
+Wall time (best of --repeat runs) and the tracemalloc peak of each stage are printed and
+saved as JSON; --compare prints the time ratios against an earlier results file
+
+Command line example:
+    python benchmarks/bench_pipeline.py --scales 1 2 4 --out bench.json --compare old_bench.json
+"""
+
+# imports
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'passive_particles')]
+
+import landlab
+from landlab import RasterModelGrid
+from landlab.components import TidalFlowCalculator
+from landlab.grid.mappers import map_max_of_link_nodes_to_link
+from landlab.io import read_esri_ascii
+import tidal_erosion_calculator as tec
+from dem_cache import read_esri_ascii_cached
+from morphodynamics import DEFAULT_PARAMETERS, setup_marsh_grid
+from map_fun import gridded_vars
+from particletransport import init_particles, tidal_particles
+
+P = DEFAULT_PARAMETERS
+
+
+def add_vegetation(grid):
+    """Vegetation below mean sea level, as in setup_marsh_grid."""
+    z = grid.at_node['topographic__elevation']
+    veg = grid.add_zeros('vegetation', at='node')
+    veg[z < 0] = 1
+    grid.add_field('veg_atlink', grid.map_max_of_link_nodes_to_link('vegetation'), at='link')
+
+
+def straight_channel(scale=1):
+    """demo_StraightChannel.py set-up with scale times as many rows and columns."""
+    nrows, ncols = int(400*scale), int(200*scale)
+    grid = RasterModelGrid((nrows, ncols), xy_spacing=2.0)
+    z = grid.add_zeros('topographic__elevation', at='node')
+    z[grid.core_nodes] = 1.0
+    xc = 2.0*(ncols//2) - 2.0
+    z[np.abs(grid.x_of_node - xc) <= 10.0] = -2.0
+    grid.set_closed_boundaries_at_grid_edges(True, True, True, True)
+    grid.status_at_node[np.arange(ncols//2 - 6, ncols//2 + 5)] = grid.BC_NODE_IS_FIXED_VALUE
+    roughness_at_nodes = 0.2 + np.zeros(z.size)
+    roughness_at_nodes[z < 0.0] = 0.01
+    roughness = grid.add_zeros('roughness', at='link')
+    map_max_of_link_nodes_to_link(grid, roughness_at_nodes, out=roughness)
+    add_vegetation(grid)
+    return grid
+
+
+def random_field(scale=1):
+    """demo_RandField2D.py set-up with scale times as many rows and columns (needs gstools)."""
+    import gstools as gs
+    n = int(250*scale)
+    model = gs.Gaussian(dim=2, var=1, len_scale=10)
+    srf = gs.SRF(model, seed=1)
+    srf.structured([range(n), range(n)])
+    gs.transform.binary(srf)
+    grid = RasterModelGrid((n, n), xy_spacing=1.0)
+    z = grid.add_zeros('topographic__elevation', at='node')
+    z -= 1.5
+    grid.set_closed_boundaries_at_grid_edges(True, False, True, False)
+    roughness_at_nodes = np.where(srf.field.flatten() > 0, 0.1, 0.01)
+    roughness = grid.add_zeros('roughness', at='link')
+    map_max_of_link_nodes_to_link(grid, roughness_at_nodes, out=roughness)
+    add_vegetation(grid)
+    return grid
+
+
+def measure(func, repeat=1, memory=True):
+    """Best wall time of repeat calls of func and the tracemalloc peak (MB) of the first."""
+    peak = None
+    times = []
+    for i in range(repeat):
+        if memory and i == 0:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+        if memory and i == 0:
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    return min(times), peak
+
+
+def pipeline_stages(grid, tidal_range, tidal_period, nparticles, ntides):
+    """(name, function) of the pipeline stages on a set-up grid, in order."""
+    state = {}
+
+    def flow():
+        if 'tfc' not in state:
+            state['tfc'] = TidalFlowCalculator(grid, tidal_range=tidal_range, tidal_period=tidal_period,
+                                               roughness='roughness', min_water_depth=P['mwd'])
+        state['tfc'].run_one_step()
+
+    def populate():
+        tec.populateGrids(grid, state['tfc'], P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'])
+
+    def update():
+        tec.updategrids(grid, state['tfc'])
+
+    def erosion():
+        tec.totalsedimenterosion_mudsine(grid, P['mud_erodability'], tidal_range, P['tcrgradeint'])
+
+    def gridded():
+        state['gvals'] = gridded_vars(grid)
+
+    def particles(native):
+        def route():
+            gvals = state['gvals']
+            wet = np.argwhere(gvals.depth > 0.5)
+            seeds = wet[np.linspace(0, len(wet) - 1, 20).astype(int)]
+            # init_particles takes the columns as x and the rows as y
+            params = init_particles(list(seeds[:, 1]), list(seeds[:, 0]), nparticles, grid.dx, gvals)
+            tidal_particles(params, tidal_period, ntides, native=native, seed=0, render=None)
+        return route
+
+    return [('flow', flow), ('populateGrids', populate), ('updategrids', update),
+            ('erosion', erosion), ('gridded_vars', gridded),
+            ('particles_dorado', particles(False)), ('particles_native', particles(True))]
+
+
+def run_setup(name, make_grid, tidal_range, tidal_period, args, loads=()):
+    """Benchmark records of all stages for one set-up.
+
+    loads are (stage, function) pairs returning the grid, timed in order; the
+    grid of the first one is set up with make_grid(grid).
+    """
+    records = []
+
+    def record(stage, grid, t, peak, error=None):
+        records.append({'setup': name, 'nodes': None if grid is None else int(grid.number_of_nodes),
+                        'stage': stage, 'time_s': t, 'peak_mb': peak, 'error': error})
+        print('%-22s %-16s %10s %10s %9s %s' % (name, stage, '' if grid is None else grid.number_of_nodes,
+                                                '-' if t is None else '%.4f' % t,
+                                                '-' if peak is None else '%.1f' % peak, error or ''))
+
+    grid = None
+    for stage, load in loads:
+        box = {}
+        t, peak = measure(lambda: box.update(grid=load()), 1, args.memory)
+        record(stage, box['grid'], t, peak)
+        grid = box['grid'] if grid is None else grid
+    try:
+        grid = make_grid() if grid is None else make_grid(grid)
+    except ImportError as error:
+        record('setup', None, None, None, 'skipped: ' + str(error))
+        return records
+
+    for stage, func in pipeline_stages(grid, tidal_range, tidal_period, args.particles, args.tides):
+        try:
+            t, peak = measure(func, args.repeat, args.memory)
+            record(stage, grid, t, peak)
+        except Exception as error:
+            record(stage, grid, None, None, repr(error))
+            if stage in ('flow', 'populateGrids'):
+                break
+    return records
+
+
+def zsw3_setups(path, cache_dir=None):
+    """Loader and set-up of the zSW3.asc marsh of TidalFlowErosion.ipynb.
+
+    With a cache_dir the loader reads the DEM with dem_cache.read_esri_ascii_cached,
+    keeping the binary sidecar in cache_dir.
+    """
+    def load():
+        if cache_dir is not None:
+            return read_esri_ascii_cached(path, name='topographic__elevation', cache_dir=cache_dir)[0]
+        return read_esri_ascii(path, name='topographic__elevation')[0]
+
+    def setup(grid):
+        setup_marsh_grid(grid, grid.at_node['topographic__elevation'])
+        return grid
+
+    return load, setup
+
+
+def compare(records, baseline):
+    """Print the time ratios (new/old) of the stages found in both result sets."""
+    old = {(r['setup'], r['stage']): r['time_s'] for r in baseline['results']}
+    print('\n%-22s %-16s %10s %10s %8s' % ('setup', 'stage', 'old (s)', 'new (s)', 'ratio'))
+    for r in records:
+        t_old = old.get((r['setup'], r['stage']))
+        if t_old and r['time_s']:
+            print('%-22s %-16s %10.4f %10.4f %8.2f' % (r['setup'], r['stage'], t_old, r['time_s'],
+                                                       r['time_s']/t_old))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the tidal erosion and particle pipelines.')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 2],
+                        help='size factors of the synthetic set-ups (rows and columns)')
+    parser.add_argument('--setups', nargs='+', default=['channel', 'randfield', 'zsw3'],
+                        choices=['channel', 'randfield', 'zsw3'])
+    parser.add_argument('--dem', default=os.path.join(ROOT, 'zSW3.asc'), help='ESRI ASCII DEM of the zsw3 set-up')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage (best time is kept)')
+    parser.add_argument('--particles', type=int, default=1000, help='number of particles')
+    parser.add_argument('--tides', type=int, default=2, help='tidal periods of particle routing')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip tracemalloc peaks')
+    parser.add_argument('--out', default='bench.json', help='output JSON file')
+    parser.add_argument('--compare', default=None, help='earlier JSON results to compare with')
+    args = parser.parse_args(argv)
+
+    print('%-22s %-16s %10s %10s %9s' % ('setup', 'stage', 'nodes', 'time (s)', 'peak (MB)'))
+    records = []
+    for scale in args.scales:
+        if 'channel' in args.setups:
+            records += run_setup('channel x' + str(scale), lambda: straight_channel(scale),
+                                 3.1, 12.5*3600, args)
+        if 'randfield' in args.setups:
+            records += run_setup('randfield x' + str(scale), lambda: random_field(scale),
+                                 0.5, 2*3600, args)
+    if 'zsw3' in args.setups:
+        load, setup = zsw3_setups(args.dem)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            load_cached = zsw3_setups(args.dem, cache_dir)[0]
+            load_cached()  # writes the sidecar, the timed load reads it
+            records += run_setup('zsw3', setup, P['tidal_range'], P['tidal_period'], args,
+                                 loads=[('load', load), ('load_cached', load_cached)])
+
+    results = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'landlab': landlab.__version__, 'machine': platform.machine(),
+                 'cpu_count': os.cpu_count(), 'args': vars(args)},
+        'results': records,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('saved ' + str(len(records)) + ' results to ' + args.out)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(records, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
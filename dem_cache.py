@@ -0,0 +1,132 @@
+"""
+Binary cached loader for ESRI ASCII DEMs
+The ASCII grid is parsed once with landlab's read_esri_ascii and written next to the source
+as a binary sidecar: a small JSON header (grid geometry plus the size and modification time
+of the source file) and the node elevations as a .npy array that can be memory-mapped
+Later runs build the RasterModelGrid straight from the mmap while the source is unchanged
+"""
+
+# imports
+import json
+import os
+import numpy as np
+from landlab import RasterModelGrid
+from landlab.io import read_esri_ascii
+try:
+    from atomic_io import write_atomic
+except ImportError:
+    from passive_particles.atomic_io import write_atomic
+
+CACHE_VERSION = 1
+
+
+def _sidecar_paths(path, cache_dir=None):
+    """Paths of the header and array sidecar files for an ASCII grid."""
+    base = os.path.basename(path)
+    folder = os.path.dirname(os.path.abspath(path)) if cache_dir is None else cache_dir
+    stem = os.path.join(folder, base)
+    return stem + '.cache.json', stem + '.cache.npy'
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def write_dem_cache(path, grid, values, cache_dir=None):
+    """Write the binary sidecar for the ASCII grid at path.
+
+    Inputs :
+        path : `str`
+            Path of the source ESRI ASCII file
+
+        grid : `obj`
+            RasterModelGrid read from path
+
+        values : `numpy.ndarray`
+            Node values read from path
+
+        cache_dir : `str` (Optional)
+            Folder for the sidecar files, defaults to the folder of path
+    """
+    header_path, array_path = _sidecar_paths(path, cache_dir)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    header = {
+        'version': CACHE_VERSION,
+        'source': _source_signature(path),
+        'shape': list(grid.shape),
+        'xy_spacing': [float(grid.dx), float(grid.dy)],
+        'xy_of_lower_left': [float(v) for v in grid.xy_of_lower_left],
+        'dtype': np.dtype(values.dtype).str,
+    }
+
+    def save_array(tmp):
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(values))
+
+    def save_header(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(header, f)
+
+    # array first, so a header always describes a complete array
+    write_atomic(array_path, save_array)
+    write_atomic(header_path, save_header)
+
+
+def read_dem_cache(path, cache_dir=None, mmap_mode='c'):
+    """Read the binary sidecar of the ASCII grid at path.
+
+    Returns (header, values) with values memory-mapped (copy-on-write by default,
+    so the array is writable but the sidecar is never modified), or None if there
+    is no valid sidecar for the current version of the source file.
+    """
+    header_path, array_path = _sidecar_paths(path, cache_dir)
+    try:
+        with open(header_path) as f:
+            header = json.load(f)
+        if header.get('version') != CACHE_VERSION or header['source'] != _source_signature(path):
+            return None
+        values = np.load(array_path, mmap_mode=mmap_mode)
+    except (OSError, ValueError, KeyError):
+        return None
+    if values.size != header['shape'][0] * header['shape'][1]:
+        return None
+    return header, values
+
+
+def read_esri_ascii_cached(path, name='topographic__elevation', cache_dir=None, mmap_mode='c'):
+    """Drop-in replacement for read_esri_ascii(path, name=name) using a binary cache.
+
+    Inputs :
+        path : `str`
+            Path of the ESRI ASCII file (e.g. zSW3.asc)
+
+        name : `str`
+            Name of the node field to add the values to
+
+        cache_dir : `str` (Optional)
+            Folder for the sidecar files, defaults to the folder of path
+
+        mmap_mode : `str`
+            numpy.load mmap_mode of the cached array, 'c' (copy-on-write) keeps
+            the field writable, 'r' makes it read-only
+
+    Returns :
+        grid : `obj`
+            A RasterModelGrid
+
+        values : `numpy.ndarray`
+            The node field (backed by the memory-mapped sidecar when cached)
+    """
+    cached = read_dem_cache(path, cache_dir, mmap_mode)
+    if cached is None:
+        (grid, values) = read_esri_ascii(path, name=name)
+        write_dem_cache(path, grid, values, cache_dir)
+        return grid, values
+
+    header, values = cached
+    grid = RasterModelGrid(tuple(header['shape']), xy_spacing=tuple(header['xy_spacing']),
+                           xy_of_lower_left=tuple(header['xy_of_lower_left']))
+    values = grid.add_field(name, values, at='node')
+    return grid, values
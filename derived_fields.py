@@ -0,0 +1,194 @@
+"""
+Lazy, on-demand registry of the derived fields of populateGrids
+Every field is declared with the fields it depends on and is computed only when first
+accessed; marking an input as changed (e.g. topographic__elevation after erosion) invalidates
+only the fields that depend on it, so unused cell fields cost nothing in the erosion loop
+Computed values are stored as ordinary grid fields, written in place after the first time
+"""
+
+# imports
+import numpy as np
+from grid_mappers import get_mappers
+from active_nodes import get_active_nodes
+from tidal_erosion_calculator import _field_buffer
+try:
+    from map_fun import invalidate_velocity_products
+except ImportError:
+    from passive_particles.map_fun import invalidate_velocity_products
+
+# fields of the grid / flow calculator that the derived fields are built from
+BASE_FIELDS = ('topographic__elevation', 'mean_water__depth', 'ebb_tide_flow__velocity',
+               'roughness', 'veg_atlink')
+
+# outputs of TidalFlowCalculator.run_one_step
+FLOW_FIELDS = ('mean_water__depth', 'ebb_tide_flow__velocity')
+
+
+class DerivedFieldRegistry:
+    """Fields of populateGrids computed on first access and cached until an input changes.
+
+    Inputs :
+        grid : `obj`
+            A landlab grid with the fields of BASE_FIELDS
+
+        tfc : `obj`
+            The TidalFlowCalculator of the grid (already run once)
+
+        tau_cr, tau_crv : `float`
+            Critical stress for unvegetated and vegetated areas
+
+        active : `bool`
+            Evaluate the link -> node minima at the active (not closed) nodes
+            only, see active_nodes.ActiveNodes
+
+    Use registry[name] (or registry.require(*names)) to get up-to-date fields and
+    registry.changed(*names) / registry.flow_solved() after modifying inputs.
+    """
+
+    def __init__(self, grid, tfc, tau_cr, tau_crv, active=False):
+        self.grid = grid
+        self.tfc = tfc
+        self.tau_cr = tau_cr
+        self.tau_crv = tau_crv
+        self.active = active
+        self._mappers = get_mappers(grid)
+        self._declared = {}
+        self._dependents = {}
+        self._valid = set()
+        self._mapped_all = set()
+        self.computed = 0  # number of field evaluations, for diagnostics
+        _declare_populate_fields(self)
+
+    def declare(self, name, at, inputs, compute, units='-'):
+        """Declare field name at location at, computed by compute(registry, out) from inputs."""
+        self._declared[name] = (at, tuple(inputs), compute, units)
+        for i in inputs:
+            self._dependents.setdefault(i, set()).add(name)
+
+    def __contains__(self, name):
+        return name in self._declared
+
+    def __getitem__(self, name):
+        if name not in self._declared:
+            return self._base(name)
+        if name not in self._valid:
+            at, inputs, compute, units = self._declared[name]
+            for i in inputs:
+                self[i]
+            compute(self, _field_buffer(self.grid, name, at, units=units))
+            self._valid.add(name)
+            self.computed += 1
+        return getattr(self.grid, 'at_' + self._declared[name][0])[name]
+
+    def _base(self, name):
+        for at in ('node', 'link'):
+            fields = getattr(self.grid, 'at_' + at)
+            if name in fields:
+                return fields[name]
+        raise KeyError(name)
+
+    def require(self, *names):
+        """Bring the given fields up to date."""
+        for name in names:
+            self[name]
+
+    def changed(self, *names):
+        """Mark fields as changed, invalidating everything derived from them."""
+        stack = list(names)
+        while stack:
+            for dep in self._dependents.get(stack.pop(), ()):
+                if dep in self._valid:
+                    self._valid.discard(dep)
+                    stack.append(dep)
+
+    def flow_solved(self):
+        """Invalidate the fields derived from the flow solution after tfc.run_one_step()."""
+        self.changed(*FLOW_FIELDS)
+        invalidate_velocity_products(self.grid)
+
+    def is_valid(self, name):
+        return name in self._valid
+
+
+def _declare_populate_fields(reg):
+    """The node, link and cell fields of tec.populateGrids, with their dependencies."""
+    m = reg._mappers
+
+    def node2cell(src):
+        return lambda r, out: m.node_to_cell(r[src], out=out)
+
+    def min2node(src):
+        if not reg.active:
+            return lambda r, out: m.min_of_node_links_to_node(r[src], out=out)
+
+        # the first evaluation maps every node, so the closed nodes (left untouched
+        # by the active mapping) hold the same values as with the full mapping
+        def compute(r, out):
+            if src in r._mapped_all:
+                get_active_nodes(r.grid).min_of_node_links_to_node(r[src], out=out)
+            else:
+                m.min_of_node_links_to_node(r[src], out=out)
+                r._mapped_all.add(src)
+        return compute
+
+    def rate(r, out):
+        out[:] = r.tfc.calc_tidal_inundation_rate()
+
+    def copy_of(src):
+        def compute(r, out):
+            out[:] = r[src]
+        return compute
+
+    def dHW(r, out):
+        topo = r['topographic__elevation']
+        np.add(topo, r.tfc._mean_sea_level, out=out)
+        out += r.tfc._tidal_half_range
+        np.maximum(out, 0, out=out)
+        out[topo==999] = 0
+
+    def ftide(r, out):
+        np.divide(r['water_depth_at_MHW'], r.tfc._tidal_range, out=out)
+        np.maximum(out, 10^-3, out=out)
+        np.minimum(out, 1, out=out)
+
+    def lev(r, out):
+        np.negative(r['topographic__elevation'], out=out)
+        out -= r.tfc._mean_sea_level
+
+    def taucr(r, out):
+        out[:] = r.tau_cr
+        out[r['veg_atlink']==1] = r.tau_crv
+
+    def negative(src):
+        return lambda r, out: np.negative(r[src], out=out)
+
+    def wd_link(r, out):
+        r['mean_water__depth']
+        out[:] = r.tfc._water_depth_at_links
+
+    topo = 'topographic__elevation'
+    reg.declare('tidal_innundation_rate', 'node', [topo], rate, units='m/s')
+    reg.declare('tidal_innundation_rate_cell', 'cell', ['tidal_innundation_rate'], node2cell('tidal_innundation_rate'))
+    reg.declare('effective_water_depth', 'node', ['mean_water__depth'], copy_of('mean_water__depth'), units='m')
+    reg.declare('effective_water_depth_cell', 'cell', ['effective_water_depth'], node2cell('effective_water_depth'))
+    reg.declare('topographic_elevation_cell', 'cell', [topo], node2cell(topo))
+    reg.declare('water_depth_at_MHW', 'node', [topo], dHW, units='m')
+    reg.declare('hydroperiod', 'node', ['water_depth_at_MHW'], ftide, units='m')
+    reg.declare('hydroperiod_cell', 'cell', ['hydroperiod'], node2cell('hydroperiod'))
+    reg.declare('water_depth_at_MHW_cell', 'cell', ['water_depth_at_MHW'], node2cell('water_depth_at_MHW'))
+    reg.declare('lev_at_node', 'node', [topo], lev)
+    reg.declare('lev_at_cell', 'cell', ['lev_at_node'], node2cell('lev_at_node'))
+    reg.declare('tau_cr', 'link', ['veg_atlink'], taucr)
+    reg.declare('tau_cr_node', 'node', ['tau_cr'], min2node('tau_cr'))
+    reg.declare('tau_cr_cell', 'cell', ['tau_cr_node'], node2cell('tau_cr_node'))
+    reg.declare('ebb_tide_flow__velocity_node', 'node', ['ebb_tide_flow__velocity'], min2node('ebb_tide_flow__velocity'))
+    reg.declare('flood_tide_flow__velocity_node', 'node', ['ebb_tide_flow__velocity_node'], negative('ebb_tide_flow__velocity_node'))
+    # as in populateGrids, the link velocities are indexed by the node of each cell
+    reg.declare('ebb_tide_flow__velocity_cell', 'cell', ['ebb_tide_flow__velocity'],
+                lambda r, out: m.node_to_cell(r['ebb_tide_flow__velocity'][:r.grid.number_of_nodes], out=out))
+    reg.declare('flood_tide_flow__velocity_cell', 'cell', ['ebb_tide_flow__velocity_cell'], negative('ebb_tide_flow__velocity_cell'))
+    reg.declare('roughness_node', 'node', ['roughness'], min2node('roughness'))
+    reg.declare('roughness_cell', 'cell', ['roughness_node'], node2cell('roughness_node'))
+    reg.declare('water_depth_at_link', 'link', ['mean_water__depth'], wd_link, units='m')
+    reg.declare('water_depth_at_node', 'node', ['water_depth_at_link'], min2node('water_depth_at_link'))
+    reg.declare('water_depth_at_cell', 'cell', ['water_depth_at_node'], node2cell('water_depth_at_node'))
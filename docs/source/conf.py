@@ -130,4 +130,4 @@ latex_documents = [
 autodoc_mock_imports = ['numpy', 'scikit-image', 'opencv-python', 'pandas',
                         'networkx', 'geopandas', 'pyproj', 'shapely', 'fiona',
                         'matplotlib', 'gdal', 'scipy', 'skimage', 'cv2',
-                        'landlab', 'dorado']
+                        'landlab', 'dorado', 'imageio', 'gstools']
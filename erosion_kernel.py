@@ -0,0 +1,138 @@
+"""
+Fused bed shear stress and mud erosion kernel
+tauC = 1025*9.81*rough**2*utide**2*h**(-1/3) and E = M*(sqrt(1 + (tauC/taucr)**2) - 1) evaluated
+in one pass: with numba installed as a compiled loop, otherwise as a chain of in-place numpy
+operations writing into the output arrays plus one reusable scratch buffer (the plain
+expressions allocate about ten full-size temporaries per call)
+The numpy path applies the operations in the same order as the plain expressions, so the results
+are bit-identical; dry points (depth <= 0, where h**(-1/3) is infinite) get zero stress and erosion
+"""
+
+# imports
+import weakref
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+RHO_G = 1025*9.81  # specific weight of sea water
+
+# fields read by the kernel at each grid location: roughness, peak flood velocity, water depth
+# and critical shear stress
+LAYOUTS = {
+    'node': ('roughness_node', 'flood_tide_flow__velocity_node', 'mean_water__depth', 'tau_cr_node'),
+    'link': ('roughness', 'flood_tide_flow__velocity', 'water_depth_at_link', 'tau_cr'),
+    'cell': ('roughness_cell', 'flood_tide_flow__velocity_cell', 'water_depth_at_cell', 'tau_cr_cell'),
+}
+
+_WORKSPACES = weakref.WeakKeyDictionary()
+
+
+class ErosionWorkspace:
+    """Scratch buffers of mud_erosion for arrays of a given size."""
+
+    def __init__(self, size):
+        self.size = size
+        self.scratch = np.empty(size)
+        self.dry = np.empty(size, dtype=bool)
+
+
+def get_workspace(owner, key, size):
+    """ErosionWorkspace of size points kept for owner (e.g. a grid) under key, built on first use."""
+    spaces = _WORKSPACES.setdefault(owner, {})
+    ws = spaces.get(key)
+    if ws is None or ws.size != size:
+        ws = spaces[key] = ErosionWorkspace(size)
+    return ws
+
+
+if HAVE_NUMBA:
+    @numba.njit(cache=True)
+    def _mud_erosion_jit(rough, utide, h, taucr, mud_erodability, min_depth, out, tauC):
+        for i in range(out.size):
+            d = max(h[i], min_depth)
+            if d > 0:
+                t = RHO_G * rough[i]**2 * utide[i]**2 * d**(-1/3)
+                r = t / taucr[i]
+                tauC[i] = t
+                out[i] = mud_erodability*(np.sqrt(1 + r*r) - 1)
+            else:
+                tauC[i] = 0.0
+                out[i] = 0.0
+
+
+def _use_jit(jit):
+    if jit is None:
+        return HAVE_NUMBA
+    if jit and not HAVE_NUMBA:
+        raise ImportError('Required library could not be found: \n'
+                          'numba')
+    return bool(jit)
+
+
+def mud_erosion(rough, utide, h, taucr, mud_erodability, out=None, tauC=None, workspace=None,
+                min_depth=0.0, jit=None):
+    """Bed shear stress and mud erosion rate from flat arrays of one layout.
+
+    Inputs :
+        rough, utide, h, taucr : `numpy.ndarray`
+            Manning's n, intra-tidal velocity (m/s), water depth (m) and
+            critical shear stress (Pa); not modified
+
+        mud_erodability : `float`
+            mud erodability kg/m2/s
+
+        out, tauC : `numpy.ndarray` (Optional)
+            arrays receiving the erosion rate and the shear stress; out may be
+            h itself, tauC may be rough itself
+
+        workspace : `obj` (Optional)
+            ErosionWorkspace of the same size, allocated if not given
+
+        min_depth : `float`
+            depths are raised to at least min_depth before h**(-1/3); points
+            still at depth <= 0 are dry, with zero stress and erosion
+
+        jit : `bool` (Optional)
+            use the numba kernel (None: if numba is installed); its results
+            may differ from the numpy path in the last bits
+
+    Returns :
+        out : `numpy.ndarray`
+            erosion rate (kg/m2/s)
+    """
+    if out is None:
+        out = np.empty(h.shape)
+    if tauC is None:
+        tauC = np.empty(h.shape)
+    if _use_jit(jit):
+        _mud_erosion_jit(rough, utide, h, taucr, float(mud_erodability), float(min_depth), out, tauC)
+        return out
+    if workspace is None:
+        workspace = ErosionWorkspace(h.size)
+    dry = workspace.dry
+    usq = workspace.scratch
+
+    # depth term first, so that out can share memory with h
+    np.maximum(h, min_depth, out=out)
+    np.less_equal(out, 0, out=dry)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.power(out, -1/3, out=out)
+        np.square(rough, out=tauC)
+        np.multiply(RHO_G, tauC, out=tauC)
+        np.square(utide, out=usq)
+        tauC *= usq
+        tauC *= out
+        np.divide(tauC, taucr, out=out)
+    np.square(out, out=out)
+    np.add(1, out, out=out)
+    np.sqrt(out, out=out)
+    out -= 1
+    out *= mud_erodability
+    if dry.any():
+        tauC[dry] = 0
+        out[dry] = 0
+    return out
@@ -0,0 +1,140 @@
+"""
+Parallel parameter sweeps of the erosion model
+Runs DEM load -> TidalFlowCalculator -> populateGrids -> erosion loop for every combination
+of a parameter grid on a process pool and returns compact per-run summaries
+The DEM is parsed once into the binary cache of dem_cache; every worker memory-maps the same
+sidecar copy-on-write, so the elevations are shared read-only between processes
+
+Command line example:
+    python erosion_sweep.py zSW3.asc --steps 100 --set tau_cr=0.1,0.2,0.3 --set mud_erodability=1e-5,2e-5 --out sweep.npz
+"""
+
+# imports
+import argparse
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from landlab.components import TidalFlowCalculator
+from dem_cache import read_esri_ascii_cached
+from morphodynamics import DEFAULT_PARAMETERS, ErosionModel, setup_marsh_grid
+from tidal_flow_solver import WarmStartTidalFlowCalculator
+
+
+def parameter_grid(**values):
+    """All combinations of the given parameter values, as a list of dicts.
+
+    Example: parameter_grid(tau_cr=[0.1, 0.2], mud_erodability=[1e-5]) gives
+    [{'tau_cr': 0.1, 'mud_erodability': 1e-5}, {'tau_cr': 0.2, 'mud_erodability': 1e-5}]
+    """
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[n] for n in names))]
+
+
+def run_scenario(dem_path, params, nsteps, cache_dir=None, keep_bed_change=False, warm_start=False):
+    """Run the erosion loop for one parameter set and summarise it.
+
+    Returns a dict with the parameters and float32 arrays of length nsteps:
+    mean_erosion and max_erosion (bed lowering per step, m) and min_elevation (m),
+    plus the final mean water depth and, if keep_bed_change, the total bed change
+    at every node. warm_start uses WarmStartTidalFlowCalculator for the flow solves.
+    """
+    (grid, z) = read_esri_ascii_cached(dem_path, cache_dir=cache_dir)
+    p = dict(DEFAULT_PARAMETERS, **params)
+    setup_marsh_grid(grid, z, p['roughness_w'], p['roughness_v'])
+    z0 = z.copy() if keep_bed_change else None
+    flow_calculator = WarmStartTidalFlowCalculator if warm_start else TidalFlowCalculator
+    model = ErosionModel(grid, flow_calculator=flow_calculator, **params)
+
+    core = grid.core_nodes
+    summary = {
+        'mean_erosion': np.zeros(nsteps, dtype=np.float32),
+        'max_erosion': np.zeros(nsteps, dtype=np.float32),
+        'min_elevation': np.zeros(nsteps, dtype=np.float32),
+    }
+
+    def record(model, ero):
+        i = model.step_count - 1
+        summary['mean_erosion'][i] = ero[core].mean()
+        summary['max_erosion'][i] = ero[core].max()
+        summary['min_elevation'][i] = z[core].min()
+
+    model.run(nsteps, callback=record)
+    summary['params'] = dict(params)
+    summary['final_mean_depth'] = float(grid.at_node['mean_water__depth'][core].mean())
+    if keep_bed_change:
+        summary['bed_change'] = (z - z0).astype(np.float32)
+    return summary
+
+
+def _run_one(args):
+    return run_scenario(*args)
+
+
+def run_sweep(dem_path, scenarios, nsteps=100, processes=None, cache_dir=None, keep_bed_change=False,
+              warm_start=False):
+    """Run run_scenario for every parameter set in scenarios on a process pool.
+
+    Inputs :
+        dem_path : `str`
+            ESRI ASCII DEM (e.g. zSW3.asc)
+
+        scenarios : `list`
+            List of parameter dicts, e.g. from parameter_grid()
+
+        nsteps : `int`
+            Number of erosion steps per scenario
+
+        processes : `int` (Optional)
+            Size of the process pool, defaults to the number of cores
+
+    Returns :
+        summaries : `list`
+            run_scenario() results, in the order of scenarios
+    """
+    # parse the DEM once; workers then only memory-map the binary sidecar
+    read_esri_ascii_cached(dem_path, cache_dir=cache_dir)
+    jobs = [(dem_path, params, nsteps, cache_dir, keep_bed_change, warm_start) for params in scenarios]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_run_one, jobs))
+
+
+def save_sweep(fname, summaries):
+    """Save sweep summaries to a single .npz file (arrays stacked by scenario)."""
+    out = {'params': json.dumps([s['params'] for s in summaries]),
+           'final_mean_depth': np.array([s['final_mean_depth'] for s in summaries])}
+    for key in ('mean_erosion', 'max_erosion', 'min_elevation', 'bed_change'):
+        if key in summaries[0]:
+            out[key] = np.stack([s[key] for s in summaries])
+    np.savez(fname, **out)
+
+
+def _parse_set(text):
+    name, values = text.split('=', 1)
+    if name not in DEFAULT_PARAMETERS:
+        raise argparse.ArgumentTypeError('unknown parameter ' + name)
+    return name, [float(v) for v in values.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel parameter sweep of the tidal erosion model.')
+    parser.add_argument('dem', help='ESRI ASCII DEM')
+    parser.add_argument('--set', dest='sets', action='append', type=_parse_set, default=[],
+                        metavar='NAME=V1,V2,...', help='parameter values to sweep (repeatable)')
+    parser.add_argument('--steps', type=int, default=100, help='erosion steps per scenario')
+    parser.add_argument('--processes', type=int, default=None, help='size of the process pool')
+    parser.add_argument('--cache-dir', default=None, help='folder for the binary DEM cache')
+    parser.add_argument('--bed-change', action='store_true', help='keep the final bed change of every run')
+    parser.add_argument('--warm-start', action='store_true', help='warm-started iterative flow solves')
+    parser.add_argument('--out', default='sweep.npz', help='output .npz file')
+    args = parser.parse_args(argv)
+
+    scenarios = parameter_grid(**dict(args.sets))
+    summaries = run_sweep(args.dem, scenarios, args.steps, args.processes, args.cache_dir, args.bed_change,
+                          args.warm_start)
+    save_sweep(args.out, summaries)
+    print('saved ' + str(len(summaries)) + ' scenarios to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Precompiled node/link/cell mappers
+The connectivity of a landlab grid never changes during a run, so the index arrays used by
+map_min_of_node_links_to_node, map_node_to_cell and map_mean_of_link_nodes_to_link are
+built once per grid and applied as single gather/reduce calls into preallocated buffers
+Results are identical to the landlab mappers
+"""
+
+# imports
+import weakref
+import numpy as np
+
+_MAPPERS = weakref.WeakKeyDictionary()
+
+
+class GridMappers:
+    """Cached index arrays and scratch buffers for the node/link/cell mappers of one grid."""
+
+    def __init__(self, grid):
+        self.number_of_nodes = grid.number_of_nodes
+        self.number_of_links = grid.number_of_links
+        self.number_of_cells = grid.number_of_cells
+
+        # missing links (-1) point at an extra slot holding the largest float, as in landlab
+        # stored link-slot major, so each slot is a contiguous row for the reduction
+        links_at_node = np.array(grid.links_at_node)
+        links_at_node[links_at_node == -1] = self.number_of_links
+        self._node_at_cell = np.array(grid.node_at_cell)
+        self._links_at_node = np.ascontiguousarray(links_at_node.T)
+        self._links_at_cell = np.ascontiguousarray(links_at_node[self._node_at_cell].T)
+        self._node_at_link_head = np.array(grid.node_at_link_head)
+        self._node_at_link_tail = np.array(grid.node_at_link_tail)
+
+        # scratch space reused on every call (np.take uses mode='clip' so that it
+        # writes straight into out instead of buffering; the indices are always valid
+        # once the size of the values has been checked, see _check_size)
+        self._values_at_linksX = np.empty(self.number_of_links + 1)
+        self._values_at_linksX[-1] = np.finfo(dtype=float).max
+        self._gather_node = np.empty(self._links_at_node.shape)
+        self._gather_cell = np.empty(self._links_at_cell.shape)
+        self._head = np.empty(self.number_of_links)
+        self._tail = np.empty(self.number_of_links)
+
+    @staticmethod
+    def _check_size(values, size, at):
+        """Raise ValueError unless values holds one value per element (size) of at."""
+        if np.shape(values) != (size,):
+            raise ValueError('expected ' + str(size) + ' values at ' + at + ', got shape '
+                             + str(np.shape(values)))
+
+    def _padded(self, values_at_link):
+        self._check_size(values_at_link, self.number_of_links, 'link')
+        linksX = self._values_at_linksX
+        linksX[:-1] = values_at_link
+        return linksX
+
+    @staticmethod
+    def _min_of_rows(gathered, out):
+        np.minimum(gathered[0], gathered[1], out=out)
+        for row in gathered[2:]:
+            np.minimum(out, row, out=out)
+        return out
+
+    def min_of_node_links_to_node(self, values_at_link, out=None):
+        """Minimum of the link values around each node (map_min_of_node_links_to_node)."""
+        if out is None:
+            out = np.empty(self.number_of_nodes)
+        np.take(self._padded(values_at_link), self._links_at_node, out=self._gather_node, mode='clip')
+        return self._min_of_rows(self._gather_node, out)
+
+    def node_to_cell(self, values_at_node, out=None):
+        """Value of the node at each cell (map_node_to_cell)."""
+        if out is None:
+            out = np.empty(self.number_of_cells)
+        self._check_size(values_at_node, self.number_of_nodes, 'node')
+        return np.take(values_at_node, self._node_at_cell, out=out, mode='clip')
+
+    def min_of_node_links_to_cell(self, values_at_link, out=None):
+        """Minimum of the link values around the node of each cell (min to node, then node to cell)."""
+        if out is None:
+            out = np.empty(self.number_of_cells)
+        np.take(self._padded(values_at_link), self._links_at_cell, out=self._gather_cell, mode='clip')
+        return self._min_of_rows(self._gather_cell, out)
+
+    def mean_of_link_nodes_to_link(self, values_at_node, out=None):
+        """Mean of the node values at the head and tail of each link (map_mean_of_link_nodes_to_link)."""
+        if out is None:
+            out = np.empty(self.number_of_links)
+        self._check_size(values_at_node, self.number_of_nodes, 'node')
+        np.take(values_at_node, self._node_at_link_head, out=self._head, mode='clip')
+        np.take(values_at_node, self._node_at_link_tail, out=self._tail, mode='clip')
+        np.add(self._head, self._tail, out=out)
+        out *= 0.5
+        return out
+
+
+def get_mappers(grid):
+    """Return the GridMappers of a grid, building them the first time the grid is seen."""
+    try:
+        return _MAPPERS[grid]
+    except KeyError:
+        mappers = _MAPPERS[grid] = GridMappers(grid)
+        return mappers
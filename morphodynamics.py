@@ -0,0 +1,445 @@
+"""
+Pseudo-morphodynamic erosion driver
+The erode -> TidalFlowCalculator.run_one_step -> updategrids loop of TidalFlowErosion.ipynb
+(erosion only, no sediment transport or deposition) as a reusable model
+"""
+
+# imports
+import json
+import numpy as np
+from landlab import RasterModelGrid
+from landlab.components import TidalFlowCalculator
+from landlab.grid.mappers import map_mean_of_link_nodes_to_link
+import tidal_erosion_calculator as tec
+from derived_fields import DerivedFieldRegistry
+from active_nodes import get_active_nodes
+from tiling import row_tiles
+from tidal_flow_solver import WarmStartTidalFlowCalculator
+try:
+    from atomic_io import write_atomic
+    from instrumentation import NULL_PROFILER
+except ImportError:
+    from passive_particles.atomic_io import write_atomic
+    from passive_particles.instrumentation import NULL_PROFILER
+
+CHECKPOINT_VERSION = 1
+
+# grid fields stored in checkpoints (the derived fields are recomputed on restore)
+CHECKPOINT_FIELDS = {
+    'node': ('topographic__elevation', 'mean_water__depth', 'tau_cr_node'),
+    'link': ('roughness', 'veg_atlink', 'ebb_tide_flow__velocity', 'flood_tide_flow__velocity'),
+}
+
+# rows per tile of the resolve_scope='tile' test when the model has no tiler
+RESOLVE_TILE_ROWS = 16
+
+# flow calculators that checkpoints can name
+FLOW_CALCULATORS = {cls.__name__: cls for cls in (TidalFlowCalculator, WarmStartTidalFlowCalculator)}
+
+# parameters of TidalFlowErosion.ipynb (from the MarshMorpho2D source code)
+DEFAULT_PARAMETERS = {
+    'tidal_period': 12.5 * 3600.0,  # tidal period in seconds
+    'tidal_range': 3.1,  # tidal range in meters
+    'roughness_w': 0.02,  # Manning's n water
+    'roughness_v': 0.1,  # Manning's n for veg
+    'mean_sea_level': 0.0,  # mean sea level in meters
+    'mwd': 0.01,  # minimum depth for water on areas higher than low tide water surface, meters
+    'tcrgradeint': 0.2,  # linear increase in tcr below MLW [pa/m]
+    'tau_cr': 0.2,  # critical stress for unvegetated areas
+    'tau_crv': 0.5,  # critical stress for vegetated areas
+    'mud_erodability': 10**-5,  # mud erodability kg/m2/s
+    'morfac': 1.0,  # morphological acceleration factor: half tidal cycles of erosion per flow solve
+    'max_bed_change': None,  # adaptive morfac: bed change per flow solve as a fraction of high-tide depth
+    'morfac_min': 1.0,  # bounds of the adaptive morfac
+    'morfac_max': 1000.0,
+    'morfac_growth': 2.0,  # largest factor by which the adaptive morfac grows from one step to the next
+    'resolve_threshold': None,  # mean bed change (m) since the last flow solve that triggers a new one
+    'resolve_scope': 'tile',  # mean over any row tile ('tile') or over all core nodes ('global')
+}
+
+
+def setup_marsh_grid(grid, z, roughness_w=0.02, roughness_v=0.1, nodata_code=999, max_elevation=1.8):
+    """Vegetation, boundaries and roughness of the TidalFlowErosion.ipynb set-up.
+
+    Inputs :
+        grid : `obj`
+            RasterModelGrid read from the DEM
+
+        z : `numpy.ndarray`
+            topographic__elevation at nodes
+
+        roughness_w, roughness_v : `float`
+            Manning's n of water and vegetation
+
+        nodata_code : `float`
+            DEM value of nodes with no valid data (closed)
+
+        max_elevation : `float`
+            nodes higher than this (mean high tide) are closed
+    """
+    # vegetation placed on all "land cells"
+    veg = grid.add_zeros('vegetation', at='node')
+    veg[z < 0] = 1
+    veg_atlink = grid.map_max_of_link_nodes_to_link('vegetation')
+    grid.add_field('veg_atlink', veg_atlink, at='link')
+
+    # any nodata nodes, plus any nodes higher than mean high tide are closed
+    grid.status_at_node[z == nodata_code] = grid.BC_NODE_IS_CLOSED
+    grid.status_at_node[z > max_elevation] = grid.BC_NODE_IS_CLOSED
+    boundaries_above_msl = np.logical_and(grid.status_at_node == grid.BC_NODE_IS_FIXED_VALUE, z > 0.0)
+    grid.status_at_node[boundaries_above_msl] = grid.BC_NODE_IS_CLOSED
+
+    # variable roughness as field in grid
+    roughness_at_nodes = roughness_w + np.zeros(z.size)
+    roughness_at_nodes[z < 0.0] = roughness_v
+    roughness = grid.add_zeros('roughness', at='link')
+    map_mean_of_link_nodes_to_link(grid, roughness_at_nodes, out=roughness)
+    return veg_atlink
+
+
+class ErosionModel:
+    """Erosion-only morphodynamics on a landlab grid.
+
+    Each step computes the erosion rate, applies it over morfac half tidal
+    cycles, lowers the bed, re-solves the tidal flow and updates the derived fields.
+
+    With max_bed_change set, morfac is chosen every step (CFL-like) so that the
+    largest bed lowering is max_bed_change times the local high-tide depth
+    (mean_water__depth + tidal_range/2), within [morfac_min, morfac_max] and
+    growing at most morfac_growth-fold per step: long steps while the bed is
+    quiet, short ones while it changes quickly. self.time is the
+    morphological time simulated (s) and self.morfac the factor of the last step.
+
+    With resolve_threshold set, the flow is only re-solved (and the derived
+    fields updated) once the mean absolute bed change since the last solve
+    exceeds resolve_threshold over all core nodes (resolve_scope='global') or
+    over the core nodes of any row tile ('tile'; the tiles of tiler, or of
+    RESOLVE_TILE_ROWS rows); until then the erosion uses the cached velocity,
+    depth and roughness fields. self.flow_solves and self.skipped_solves count
+    the steps that did and did not re-solve.
+
+    Inputs :
+        grid : `obj`
+            RasterModelGrid with topographic__elevation, roughness and veg_atlink
+            (see setup_marsh_grid)
+
+        flow_calculator : `class`
+            TidalFlowCalculator or a drop-in such as
+            tidal_flow_solver.WarmStartTidalFlowCalculator
+
+        inplace : `bool`
+            Update the derived fields in place (see tec.updategrids)
+
+        tiler : `obj` (Optional)
+            tiling.TiledExecutor for the node kernels
+
+        lazy : `bool`
+            Compute the derived fields on demand with a
+            derived_fields.DerivedFieldRegistry (self.fields) instead of
+            populateGrids/updategrids; only the fields read by the erosion
+            kernel are then evaluated each step
+
+        flow_kwds : `dict` (Optional)
+            Extra keyword arguments for the flow calculator
+
+        active_nodes : `bool`
+            Evaluate the erosion and the link -> node minima of the derived
+            fields on the packed active (not closed) nodes only, see
+            active_nodes.ActiveNodes; saves work and memory on masked DEMs
+
+        jit : `bool`
+            Evaluate the erosion with the numba loop of erosion_kernel
+            (requires numba; results may differ in the last bits)
+
+        profiler : `obj` (Optional)
+            instrumentation.Profiler timing the stages of every step
+            (erosion, bed_update, flow, update_fields, callback, checkpoint)
+            and recording the solver iterations of warm-started solves
+
+        Remaining keywords are the DEFAULT_PARAMETERS entries (roughness_w and
+        roughness_v are only used by setup_marsh_grid).
+    """
+
+    def __init__(self, grid, flow_calculator=TidalFlowCalculator, inplace=True, tiler=None,
+                 lazy=False, flow_kwds=None, active_nodes=False, jit=False, profiler=None, **params):
+        self._setup(grid, flow_calculator, inplace, tiler, flow_kwds, profiler, params, active_nodes, jit)
+        with self.profiler.stage('flow'):
+            self.tfc.run_one_step()
+        with self.profiler.stage('init_fields'):
+            self._init_fields(lazy)
+
+    def _setup(self, grid, flow_calculator, inplace, tiler, flow_kwds, profiler, params,
+               active_nodes=False, jit=False):
+        unknown = set(params) - set(DEFAULT_PARAMETERS)
+        if unknown:
+            raise TypeError('Unknown parameters: ' + ', '.join(sorted(unknown)))
+        self.params = dict(DEFAULT_PARAMETERS, **params)
+        self.morfac = self.params['morfac']
+        self.grid = grid
+        self.inplace = inplace
+        self.tiler = tiler
+        self.active_nodes = active_nodes
+        self.jit = jit
+        self.step_count = 0
+        self.time = 0.0
+        self.flow_solves = 0
+        self.skipped_solves = 0
+        self.flow_kwds = dict(flow_kwds or {})
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+
+        p = self.params
+        self._z_solved = None
+        if p['resolve_threshold'] is not None:
+            if p['resolve_scope'] not in ('tile', 'global'):
+                raise ValueError("resolve_scope must be 'tile' or 'global'")
+            # bed at the last flow solve, and core node counts of the tiles
+            self._z_solved = grid.at_node['topographic__elevation'].copy()
+            tiles = tiler.tiles if tiler is not None else row_tiles(grid, RESOLVE_TILE_ROWS)
+            self._tile_starts = np.array([t.start for t in tiles])
+            self._is_core = grid.status_at_node == grid.BC_NODE_IS_CORE
+            self._core_per_tile = np.maximum(np.add.reduceat(self._is_core, self._tile_starts), 1)
+        self.tfc = flow_calculator(
+            grid,
+            tidal_period=p['tidal_period'],
+            tidal_range=p['tidal_range'],
+            roughness='roughness',
+            mean_sea_level=p['mean_sea_level'],
+            min_water_depth=p['mwd'],
+            **self.flow_kwds
+        )
+
+    def _init_fields(self, lazy):
+        p = self.params
+        grid = self.grid
+        if lazy:
+            self.fields = DerivedFieldRegistry(grid, self.tfc, p['tau_cr'], p['tau_crv'],
+                                               active=self.active_nodes)
+        else:
+            self.fields = None
+            tec.populateGrids(grid, self.tfc, p['tau_cr'], p['tau_crv'], grid.at_link['veg_atlink'],
+                              inplace=self.inplace, tiler=self.tiler, active=self._active())
+
+    def _active(self):
+        # index of the active nodes, rebuilt if the boundaries changed
+        return get_active_nodes(self.grid) if self.active_nodes else None
+
+    def erosion_rate(self):
+        """Erosion rate at nodes for the current flow field (kg/m2/s)."""
+        p = self.params
+        if self.fields is not None:
+            self.fields.require(*tec.EROSION_FIELDS)
+        return tec.totalsedimenterosion_mudsine(self.grid, p['mud_erodability'], p['tidal_range'],
+                                                p['tcrgradeint'], tiler=self.tiler, active=self._active(),
+                                                jit=self.jit)
+
+    def run_one_step(self, max_time=None):
+        """Erode over morfac half tidal cycles, then re-solve the flow; returns the bed lowering (m).
+
+        max_time caps the morphological time of the step (s), e.g. to end a run
+        at a given time.
+        """
+        p = self.params
+        prof = self.profiler
+        with prof.stage('erosion'):
+            ero = self.erosion_rate()
+        with prof.stage('bed_update'):
+            ero *= p['tidal_period']/2 * 1/2650  # erosion over half the tidal cycle
+            morfac = self.next_morfac(ero)
+            if max_time is not None:
+                morfac = min(morfac, max_time / (p['tidal_period']/2))
+            if morfac != 1.0:
+                ero *= morfac
+            z = self.grid.at_node['topographic__elevation']
+            z -= ero  # update bed elevation
+        prof.record('morfac', morfac)
+        if self.flow_outdated():
+            with prof.stage('flow'):
+                self.tfc.run_one_step()
+            if hasattr(self.tfc, 'last_iterations'):
+                prof.record('solver_iterations', self.tfc.last_iterations)
+            with prof.stage('update_fields'):
+                self.update_fields()
+            if self._z_solved is not None:
+                self._z_solved[:] = z
+            self.flow_solves += 1
+        else:
+            self.skipped_solves += 1
+            prof.count('skipped_solves')
+        self.morfac = morfac
+        self.time += morfac * p['tidal_period']/2
+        self.step_count += 1
+        return ero
+
+    def flow_outdated(self):
+        """True if the bed has changed enough since the last flow solve to re-solve it."""
+        p = self.params
+        if p['resolve_threshold'] is None:
+            return True
+        change = np.abs(self.grid.at_node['topographic__elevation'] - self._z_solved)
+        change *= self._is_core
+        if p['resolve_scope'] == 'global':
+            mean_change = change.sum() / max(self._is_core.sum(), 1)
+        else:
+            mean_change = np.max(np.add.reduceat(change, self._tile_starts) / self._core_per_tile)
+        return mean_change > p['resolve_threshold']
+
+    def next_morfac(self, ero):
+        """Morphological acceleration factor of a step whose half-tide bed lowering is ero."""
+        p = self.params
+        if p['max_bed_change'] is None:
+            return p['morfac']
+        high_tide_depth = self.grid.at_node['mean_water__depth'] + p['tidal_range']/2
+        relative = np.max(np.abs(ero) / high_tide_depth)
+        limit = min(self.morfac * p['morfac_growth'], p['morfac_max'])
+        if relative > 0:
+            limit = min(limit, p['max_bed_change'] / relative)
+        return max(limit, p['morfac_min'])
+
+    def update_fields(self):
+        """Refresh (or, if lazy, invalidate) the derived fields after the bed and flow changed."""
+        if self.fields is not None:
+            self.fields.changed('topographic__elevation')
+            self.fields.flow_solved()
+        else:
+            tec.updategrids(self.grid, self.tfc, inplace=self.inplace, tiler=self.tiler,
+                            active=self._active())
+
+    def run(self, nsteps, callback=None, checkpoint=None, checkpoint_every=10):
+        """Run nsteps steps, calling callback(model, ero) after each one.
+
+        If checkpoint is a file name, save_checkpoint(checkpoint) is called
+        every checkpoint_every steps and after the last step.
+        """
+        for n in range(nsteps):
+            ero = self.run_one_step()
+            self._end_step(n, n + 1 == nsteps, ero, callback, checkpoint, checkpoint_every)
+
+    def run_until(self, end_time, callback=None, checkpoint=None, checkpoint_every=10):
+        """Run steps until the morphological time self.time reaches end_time (s).
+
+        The last step is shortened to end exactly at end_time; callback and
+        checkpoint are as in run(). Returns the number of steps (flow solves).
+        """
+        n = 0
+        # tolerance for the rounding of self.time
+        while self.time < end_time * (1 - 1e-12):
+            ero = self.run_one_step(max_time=end_time - self.time)
+            done = self.time >= end_time * (1 - 1e-12)
+            self._end_step(n, done, ero, callback, checkpoint, checkpoint_every)
+            n += 1
+        return n
+
+    def _end_step(self, n, last, ero, callback, checkpoint, checkpoint_every):
+        prof = self.profiler
+        if callback is not None:
+            with prof.stage('callback'):
+                callback(self, ero)
+        if checkpoint is not None and ((n + 1) % checkpoint_every == 0 or last):
+            with prof.stage('checkpoint'):
+                self.save_checkpoint(checkpoint)
+        prof.next_step()
+
+    def save_checkpoint(self, fname):
+        """Save the state the loop depends on to the binary file fname (.npz format).
+
+        Stores the CHECKPOINT_FIELDS, the node status, the flow calculator
+        outputs and warm-start state, the parameters, the step count, time
+        and morfac; the file is written under a temporary name and then
+        renamed, so an interrupted save leaves the previous checkpoint intact.
+        """
+        grid = self.grid
+        tfc = self.tfc
+        meta = {
+            'version': CHECKPOINT_VERSION,
+            'step_count': self.step_count,
+            'time': self.time,
+            'morfac': self.morfac,
+            'flow_solves': self.flow_solves,
+            'skipped_solves': self.skipped_solves,
+            'params': self.params,
+            'flow_calculator': type(tfc).__name__,
+            'flow_kwds': self.flow_kwds,
+            'shape': list(grid.shape),
+            'xy_spacing': [float(grid.dx), float(grid.dy)],
+            'xy_of_lower_left': [float(v) for v in grid.xy_of_lower_left],
+        }
+        arrays = {'meta': np.array(json.dumps(meta)),
+                  'status_at_node': grid.status_at_node,
+                  'tfc_water_depth_at_links': tfc._water_depth_at_links}
+        for at, names in CHECKPOINT_FIELDS.items():
+            for name in names:
+                arrays[at + '/' + name] = getattr(grid, 'at_' + at)[name]
+        if hasattr(tfc, 'get_state'):
+            for key, values in tfc.get_state().items():
+                arrays['tfc/' + key] = values
+        if self._z_solved is not None:
+            arrays['z_solved'] = self._z_solved
+
+        def save(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, **arrays)
+
+        write_atomic(fname, save)
+
+    @classmethod
+    def from_checkpoint(cls, fname, flow_calculator=None, inplace=True, tiler=None, lazy=False,
+                        flow_kwds=None, active_nodes=False, jit=False, profiler=None):
+        """Rebuild a model (and its grid) from save_checkpoint(fname).
+
+        The restored model continues bit-for-bit: the saved flow solution and
+        warm-start state are put back and the derived fields are recomputed
+        from them. flow_calculator and flow_kwds default to the ones of the
+        saved model.
+        """
+        with np.load(fname) as f:
+            data = dict(f)
+        meta = json.loads(str(data['meta']))
+        if meta.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('unsupported checkpoint version in ' + str(fname))
+
+        grid = RasterModelGrid(tuple(meta['shape']), xy_spacing=tuple(meta['xy_spacing']),
+                               xy_of_lower_left=tuple(meta['xy_of_lower_left']))
+        for at, names in CHECKPOINT_FIELDS.items():
+            for name in names:
+                if name != 'tau_cr_node':
+                    grid.add_field(name, data[at + '/' + name], at=at, copy=True)
+        grid.status_at_node[:] = data['status_at_node']
+
+        if flow_calculator is None:
+            flow_calculator = FLOW_CALCULATORS[meta['flow_calculator']]
+        model = cls.__new__(cls)
+        model._setup(grid, flow_calculator, inplace, tiler,
+                     meta['flow_kwds'] if flow_kwds is None else flow_kwds, profiler, meta['params'],
+                     active_nodes, jit)
+        model.step_count = meta['step_count']
+        model.time = meta['time']
+        model.morfac = meta['morfac']
+        model.flow_solves = meta['flow_solves']
+        model.skipped_solves = meta['skipped_solves']
+        model._init_fields(lazy)
+
+        # populateGrids re-solves the flow, so the saved solution and solver
+        # state are put back afterwards and the derived fields updated from them
+        if lazy:
+            model.fields.require('tau_cr_node')
+        for at, names in CHECKPOINT_FIELDS.items():
+            for name in names:
+                getattr(grid, 'at_' + at)[name][:] = data[at + '/' + name]
+        tfc = model.tfc
+        tfc._water_depth_at_links[:] = data['tfc_water_depth_at_links']
+        state = {key[4:]: values for key, values in data.items() if key.startswith('tfc/')}
+        if state and hasattr(tfc, 'set_state'):
+            tfc.set_state(state)
+        if model._z_solved is None or 'z_solved' not in data:
+            model.update_fields()
+            return model
+
+        # the cached fields were derived from the bed of the last flow solve
+        z = grid.at_node['topographic__elevation']
+        model._z_solved[:] = data['z_solved']
+        z[:] = model._z_solved
+        model.update_fields()
+        if lazy:
+            model.fields.require(*tec.EROSION_FIELDS)
+        z[:] = data['node/topographic__elevation']
+        return model
@@ -0,0 +1,28 @@
+"""Atomic file writes.
+
+A file is written under a temporary name in the same folder and then renamed
+over the target, so readers (and a run interrupted while writing) never see
+a partially written file. Used by the walk storage, the field cache, the DEM
+sidecars and the ErosionModel checkpoints.
+"""
+import os
+
+
+def write_atomic(path, write):
+    """Call write(tmp) with a temporary file name, then rename tmp to path.
+
+    Inputs :
+        path : `str`
+            Path of the file to write
+
+        write : `function`
+            Writes the complete file to the name it is given
+
+    """
+    tmp = path + '.tmp' + str(os.getpid())
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,265 @@
+"""Ensembles of random-field particle experiments.
+
+Every realization runs the pipeline of demo_RandField2D.py: a gstools
+binary random roughness field for one seed and length scale, the landlab
+TidalFlowCalculator, the gridded variables and the tidal particle routing
+(with the vectorized particle_engine.ParticleEngine). Realizations run on a
+process pool and only compact summary statistics (dispersion per half-tide,
+residence times) are sent back, streamed as they complete.
+"""
+import argparse
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from landlab import RasterModelGrid
+from landlab.components import TidalFlowCalculator
+from landlab.grid.mappers import map_max_of_link_nodes_to_link
+try:
+    import gstools as gs
+except Exception:
+    raise ImportError('Required library could not be found: \n'
+                      'gstools')
+try:
+    from .map_fun import compact_gridded_vars
+    from .particle_engine import ParticleEngine
+    from .field_cache import FieldCache
+except ImportError:
+    from map_fun import compact_gridded_vars
+    from particle_engine import ParticleEngine
+    from field_cache import FieldCache
+
+# entries of the config that determine the roughness field and flow solution (the field cache key)
+FIELD_PARAMETERS = ('nrows', 'ncols', 'grid_spacing', 'tidal_range', 'roughness_low',
+                    'roughness_high', 'tide_period')
+
+# set-up of demo_RandField2D.py
+DEFAULT_CONFIG = {
+    'nrows': 250,
+    'ncols': 250,
+    'grid_spacing': 1.0,  # m
+    'tidal_range': 0.5,  # m
+    'roughness_low': 0.01,  # s/m^1/3, i.e., Manning's n
+    'roughness_high': 0.1,  # s/m^1/3, i.e., Manning's n
+    'tide_period': 2*60*60,  # tidal period of the flow solve in seconds
+    'particle_tide_period': 2*60*60/10,  # tidal period of the particle routing in seconds
+    'n_tide_periods': 50,  # number of tidal periods to move particles around for
+    'seed_xloc': list(range(100, 125)),
+    'seed_yloc': list(range(100, 125)),
+    'Np_tracer': 100,
+}
+
+
+def random_roughness(nrows, ncols, seed, len_scale, roughness_low, roughness_high):
+    """Binary gstools random field of Manning's n at the nodes of a (nrows, ncols) grid."""
+    x = range(nrows)
+    y = range(ncols)
+    model = gs.Gaussian(dim=2, var=1, len_scale=len_scale)
+    srf = gs.SRF(model, seed=seed)
+    srf.structured([x, y])
+    gs.transform.binary(srf)
+    field = srf.field.flatten()
+    roughness_at_nodes = np.zeros(field.size)
+    roughness_at_nodes[field > 0] = roughness_high
+    roughness_at_nodes[field < 0] = roughness_low
+    return roughness_at_nodes
+
+
+def realization_grid(seed, len_scale, config=None, cache=None):
+    """Grid with the random roughness field and flow solution of one realization.
+
+    With a field_cache.FieldCache as cache, a field and flow already computed
+    for the same parameters are read from it instead of being generated and
+    solved again (and new ones are stored). Returns (grid, roughness_at_nodes).
+    """
+    c = dict(DEFAULT_CONFIG, **(config or {}))
+    nrows, ncols, dx = c['nrows'], c['ncols'], c['grid_spacing']
+
+    # create and set up the grid
+    grid = RasterModelGrid((nrows, ncols), xy_spacing=dx)
+    grid.add_zeros('topographic__elevation', at='node')
+    grid.set_closed_boundaries_at_grid_edges(True, False, True, False)
+
+    key = None
+    if cache is not None:
+        key = dict(((name, c[name]) for name in FIELD_PARAMETERS), seed=seed, len_scale=len_scale)
+        entry = cache.get(key)
+        if entry is not None:
+            roughness_at_nodes = np.where(entry['rough'], c['roughness_high'], c['roughness_low'])
+            grid.add_field('mean_water__depth', entry['mean_water__depth'], at='node')
+            grid.add_field('ebb_tide_flow__velocity', entry['ebb_tide_flow__velocity'], at='link')
+            return grid, roughness_at_nodes
+
+    roughness_at_nodes = random_roughness(nrows, ncols, seed, len_scale,
+                                          c['roughness_low'], c['roughness_high'])
+    roughness = grid.add_zeros('roughness', at='link')
+    map_max_of_link_nodes_to_link(grid, roughness_at_nodes, out=roughness)
+
+    # solve the flow
+    tfc = TidalFlowCalculator(grid, tidal_range=c['tidal_range'],
+                              tidal_period=c['tide_period'], roughness='roughness')
+    tfc.run_one_step()
+    if cache is not None:
+        cache.put(key, roughness_at_nodes == c['roughness_high'],
+                  grid.at_link['ebb_tide_flow__velocity'], grid.at_node['mean_water__depth'])
+    return grid, roughness_at_nodes
+
+
+def run_realization(seed, len_scale, config=None, cache_dir=None, cache_bytes=2*1024**3):
+    """Run one realization and summarise its particle routing.
+
+    Inputs :
+        seed : `int`
+            seed of the random field and of the particle routing
+
+        len_scale : `float` or `list`
+            length scale of the random field (a list is anisotropic)
+
+        config : `dict` (Optional)
+            entries overriding DEFAULT_CONFIG
+
+        cache_dir : `str` (Optional)
+            folder of a field_cache.FieldCache holding the roughness fields
+            and flow solutions, so repeated realizations skip to the routing
+
+        cache_bytes : `int`
+            size limit of the cache
+
+    Returns :
+        summary : `dict`
+            seed and len_scale, the high roughness fraction and mean flow
+            speed, and float32 arrays over the half-tides of: times (s),
+            msd (mean squared displacement from the seed locations, m2),
+            var_x and var_y (variance of the particle locations, m2) and
+            exited (fraction of particles that left the domain); plus the
+            mean and median residence time (s) of the exited particles
+
+    """
+    c = dict(DEFAULT_CONFIG, **(config or {}))
+    dx = c['grid_spacing']
+    cache = None if cache_dir is None else FieldCache(cache_dir, cache_bytes)
+    grid, roughness_at_nodes = realization_grid(seed, len_scale, c, cache)
+
+    # route the particles
+    gvals = compact_gridded_vars(grid)
+    engine = ParticleEngine(gvals.depth, gvals.elev, gvals.ex, gvals.ey, dx, seed=seed)
+    engine.seed(c['seed_xloc'], c['seed_yloc'], c['Np_tracer'])
+    x0 = engine.x.copy()
+    y0 = engine.y.copy()
+
+    n = int(2*c['n_tide_periods'])
+    stats = {name: np.zeros(n, dtype=np.float32)
+             for name in ('times', 'msd', 'var_x', 'var_y', 'exited')}
+
+    def record(engine, i):
+        stats['times'][i] = c['particle_tide_period']/2*(i+1)
+        dxs = (engine.x - x0)*dx
+        dys = (engine.y - y0)*dx
+        stats['msd'][i] = np.mean(dxs**2 + dys**2)
+        stats['var_x'][i] = np.var(engine.x*dx)
+        stats['var_y'][i] = np.var(engine.y*dx)
+        stats['exited'][i] = np.mean(engine.exited)
+
+    engine.run_tides(c['particle_tide_period'], c['n_tide_periods'], callback=record)
+
+    exit_time = engine.exit_time[engine.exited]
+    speed = np.abs(grid.at_link['ebb_tide_flow__velocity'])
+    summary = {
+        'seed': seed,
+        'len_scale': len_scale,
+        'rough_fraction': float(np.mean(roughness_at_nodes == c['roughness_high'])),
+        'mean_speed': float(speed[grid.active_links].mean()),
+        'residence_time_mean': float(exit_time.mean()) if exit_time.size else float('nan'),
+        'residence_time_median': float(np.median(exit_time)) if exit_time.size else float('nan'),
+    }
+    summary.update(stats)
+    return summary
+
+
+def _run_one(args):
+    return run_realization(*args)
+
+
+def run_ensemble(seeds, len_scales, config=None, processes=None, cache_dir=None, cache_bytes=2*1024**3):
+    """Run every (seed, len_scale) combination on a process pool.
+
+    A generator: the summaries of run_realization() are yielded as the
+    realizations complete (not in order), so nothing but the summaries is
+    kept in memory. cache_dir and cache_bytes are passed to run_realization().
+    """
+    jobs = [(seed, len_scale, config, cache_dir, cache_bytes)
+            for seed, len_scale in itertools.product(seeds, len_scales)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_run_one, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _to_json(summary):
+    return json.dumps({k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in summary.items()})
+
+
+def write_summaries(fname, summaries):
+    """Append each summary to fname (one JSON object per line) as it arrives; returns the count."""
+    count = 0
+    with open(fname, 'a') as f:
+        for summary in summaries:
+            f.write(_to_json(summary) + '\n')
+            f.flush()
+            count += 1
+    return count
+
+
+def read_summaries(fname):
+    """Summaries written by write_summaries, with the per half-tide entries as arrays."""
+    summaries = []
+    with open(fname) as f:
+        for line in f:
+            s = json.loads(line)
+            summaries.append({k: np.array(v, dtype=np.float32) if isinstance(v, list) and k != 'len_scale'
+                              else v for k, v in s.items()})
+    return summaries
+
+
+def ensemble_statistics(summaries, key='len_scale'):
+    """Mean and standard deviation over realizations, grouped by key.
+
+    Returns a dict {key value: {'count': n, 'msd_mean': ..., 'msd_std': ...,
+    ...}} for msd, var_x, var_y, exited and the residence times.
+    """
+    groups = {}
+    for s in summaries:
+        value = s[key]
+        groups.setdefault(tuple(value) if isinstance(value, list) else value, []).append(s)
+    out = {}
+    for value, group in groups.items():
+        stats = {'count': len(group), 'times': group[0]['times']}
+        for name in ('msd', 'var_x', 'var_y', 'exited', 'residence_time_mean', 'residence_time_median'):
+            values = np.array([s[name] for s in group], dtype=float)
+            stats[name + '_mean'] = np.nanmean(values, axis=0) if np.isfinite(values).any() else np.nan
+            stats[name + '_std'] = np.nanstd(values, axis=0) if np.isfinite(values).any() else np.nan
+        out[value] = stats
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ensemble of random-field particle experiments.')
+    parser.add_argument('--seeds', type=int, default=10, help='number of seeds (0, 1, ...)')
+    parser.add_argument('--len-scales', type=float, nargs='+', default=[10.0], help='field length scales')
+    parser.add_argument('--particles', type=int, default=DEFAULT_CONFIG['Np_tracer'], help='particles per run')
+    parser.add_argument('--tides', type=float, default=DEFAULT_CONFIG['n_tide_periods'], help='tidal periods')
+    parser.add_argument('--processes', type=int, default=None, help='size of the process pool')
+    parser.add_argument('--cache-dir', default=None, help='folder of the roughness field and flow cache')
+    parser.add_argument('--cache-mb', type=float, default=2048, help='size limit of the cache in MB')
+    parser.add_argument('--out', default='ensemble.jsonl', help='output file (JSON lines, appended)')
+    args = parser.parse_args(argv)
+
+    config = {'Np_tracer': args.particles, 'n_tide_periods': args.tides}
+    count = write_summaries(args.out, run_ensemble(range(args.seeds), args.len_scales, config,
+                                                   args.processes, args.cache_dir,
+                                                   int(args.cache_mb*1024**2)))
+    print('saved ' + str(count) + ' realizations to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Gridded particle exposure maps accumulated during the routing.
+
+Visit counts, time spent, mean travel time on arrival and first exit time
+are updated per cell with np.bincount on the flat cell indices of the
+particle steps, so the memory is a few arrays of the grid size, whatever the
+number of particles and the length of the run. Steps are buffered until
+about one grid size of them has arrived, so the many small batches at the
+end of each half-tide do not each cost a pass over the grid.
+"""
+import numpy as np
+
+
+class ExposureMaps:
+    """Per-cell accumulators of particle visits, residence and exit times.
+
+    Inputs :
+        shape : `tuple`
+            Shape of the routing grid (as the arrays of gridded_vars)
+
+        edge : `numpy.ndarray` (Optional)
+            2D boolean mask of the cells where particles leave the domain;
+            without it no exits are recorded
+
+    Use add_steps() for every batch of steps (ParticleEngine does this when
+    given the maps as its exposure attribute) or add_walk_data() for dorado
+    walk_data, then maps() for the gridded results.
+    """
+
+    def __init__(self, shape, edge=None):
+        self.shape = tuple(shape)
+        size = self.shape[0]*self.shape[1]
+        self.edge = None if edge is None else np.asarray(edge, dtype=bool).ravel()
+        self.visits = np.zeros(size, dtype=np.int64)  # arrivals
+        self.time_spent = np.zeros(size)  # travel time of the steps leaving each cell
+        self.arrival_time_sum = np.zeros(size)  # sum of the travel times on arrival
+        self.exits = np.zeros(size, dtype=np.int64)
+        self.first_exit_time = np.full(size, np.inf)
+        self._seen = None
+        self._pending = []
+        self._npending = 0
+
+    def add_steps(self, cell, new_cell, dt, travel_time):
+        """Add steps of particles from flat cells cell to new_cell taking dt, arriving at travel_time."""
+        if self.edge is not None:
+            out = self.edge[new_cell] & ~self.edge[cell]
+            if out.any():
+                np.add.at(self.exits, new_cell[out], 1)
+                np.minimum.at(self.first_exit_time, new_cell[out], travel_time[out])
+        self._pending.append((np.array(cell), np.array(new_cell), np.array(dt, dtype=float),
+                              np.array(travel_time, dtype=float)))
+        self._npending += len(cell)
+        if self._npending >= self.visits.size:
+            self.flush()
+
+    def flush(self):
+        """Bin the buffered steps into the maps."""
+        if not self._pending:
+            return
+        cell, new_cell, dt, travel_time = (np.concatenate(a) for a in zip(*self._pending))
+        self._pending = []
+        self._npending = 0
+        size = self.visits.size
+        self.visits += np.bincount(new_cell, minlength=size)
+        self.time_spent += np.bincount(cell, weights=dt, minlength=size)
+        self.arrival_time_sum += np.bincount(new_cell, weights=travel_time, minlength=size)
+
+    def add_walk_data(self, walk_data):
+        """Add the steps of dorado walk_data made since the previous call (or rebase())."""
+        W = self.shape[1]
+        n = len(walk_data['xinds'])
+        if self._seen is None:
+            self._seen = np.ones(n, dtype=int)
+        cells, new_cells, dts, times = [], [], [], []
+        for p in range(n):
+            start = self._seen[p] - 1
+            x = np.asarray(walk_data['xinds'][p][start:])
+            if x.size < 2:
+                continue
+            y = np.asarray(walk_data['yinds'][p][start:])
+            t = np.asarray(walk_data['travel_times'][p][start:], dtype=float)
+            flat = x*W + y
+            cells.append(flat[:-1])
+            new_cells.append(flat[1:])
+            dts.append(np.diff(t))
+            times.append(t[1:])
+            self._seen[p] = len(walk_data['xinds'][p])
+        if cells:
+            self.add_steps(np.concatenate(cells), np.concatenate(new_cells),
+                           np.concatenate(dts), np.concatenate(times))
+
+    def rebase(self, walk_data):
+        """Mark all of walk_data as added, e.g. after walk_io.trim_walk_data shortened it."""
+        self._seen = np.array([len(w) for w in walk_data['xinds']], dtype=int)
+
+    def maps(self):
+        """Gridded results (2D arrays of shape).
+
+        visits : number of particle arrivals in each cell
+        time_spent : total particle time spent in each cell (s)
+        mean_residence_time : time_spent per visit (s), nan where never visited
+        mean_travel_time : mean travel time of the particles on arrival (s)
+        exits : number of particles that left the domain from each cell
+        first_exit_time : earliest travel time of those exits (s), nan if none
+        """
+        self.flush()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            visits = self.visits.astype(float)
+            visited = np.where(visits > 0, visits, np.nan)
+            out = {
+                'visits': self.visits,
+                'time_spent': self.time_spent,
+                'mean_residence_time': self.time_spent / visited,
+                'mean_travel_time': self.arrival_time_sum / visited,
+                'exits': self.exits,
+                'first_exit_time': np.where(np.isinf(self.first_exit_time), np.nan, self.first_exit_time),
+            }
+        return {name: values.reshape(self.shape) for name, values in out.items()}
@@ -0,0 +1,118 @@
+"""Content-addressed on-disk cache of random roughness fields and their flow.
+
+Every entry is one .npz file named after the SHA-256 hash of its parameters
+(seed, length scale, grid size, roughness values, tidal set-up): the binary
+roughness field as a boolean mask plus the ebb_tide_flow__velocity and
+mean_water__depth of the flow solve. Reading an entry refreshes its
+modification time and the least recently used entries are removed once the
+cache grows beyond max_bytes.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+try:
+    from .atomic_io import write_atomic
+except ImportError:
+    from atomic_io import write_atomic
+
+FIELD_CACHE_VERSION = 1
+
+# arrays of an entry besides the metadata
+CACHED_ARRAYS = ('rough', 'ebb_tide_flow__velocity', 'mean_water__depth')
+
+
+def cache_key(params):
+    """Hex SHA-256 of the parameters (a JSON-serialisable dict), independent of key order."""
+    text = json.dumps(dict(params, version=FIELD_CACHE_VERSION), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class FieldCache:
+    """Folder of cached random fields and flow solutions with LRU eviction.
+
+    Inputs :
+        path : `str`
+            Cache folder, created if needed
+
+        max_bytes : `int`
+            Size the cache is trimmed to after every put()
+
+    """
+
+    def __init__(self, path, max_bytes=2*1024**3):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _fname(self, params):
+        return os.path.join(self.path, cache_key(params) + '.npz')
+
+    def get(self, params):
+        """Arrays (a dict) cached for params, or None."""
+        fname = self._fname(params)
+        try:
+            with np.load(fname) as data:
+                entry = {name: data[name] for name in CACHED_ARRAYS}
+                meta = json.loads(str(data['meta']))
+            os.utime(fname)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        if meta != dict(params, version=FIELD_CACHE_VERSION):
+            # hash collision or foreign file
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, params, rough, ebb_tide_flow__velocity, mean_water__depth):
+        """Store the roughness mask (True where rough) and flow arrays for params, then trim."""
+        arrays = {'rough': np.asarray(rough, dtype=bool),
+                  'ebb_tide_flow__velocity': np.asarray(ebb_tide_flow__velocity),
+                  'mean_water__depth': np.asarray(mean_water__depth),
+                  'meta': np.array(json.dumps(dict(params, version=FIELD_CACHE_VERSION)))}
+
+        def save(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+
+        write_atomic(self._fname(params), save)
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, path) of every entry, least recently used first."""
+        out = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.npz'):
+                continue
+            fname = os.path.join(self.path, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue  # removed by another process
+            out.append((st.st_mtime_ns, st.st_size, fname))
+        return sorted(out)
+
+    def size(self):
+        """Total size of the entries in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, fname in self.entries():
+            os.remove(fname)
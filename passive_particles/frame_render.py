@@ -0,0 +1,108 @@
+"""Rendering of the half-tide particle frames outside the routing loop.
+
+Frames are drawn with the object-oriented matplotlib API on an Agg canvas,
+so they can be rendered in worker processes while the particles keep moving.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+
+# plot grid of a worker process, set once by _init_worker
+_worker_grid = None
+
+
+def tide_title(i, tide_period):
+    """Title of the frame of half-tide i."""
+    if i % 2 != 0:
+        return 'Ebb Tide, Time = ' + str(tide_period/2*(i+1)) + 's'
+    return 'Flood Tide, Time = ' + str(tide_period/2*(i+1)) + 's'
+
+
+def draw_tide_frame(plot_grid, xinds, yinds, i, tide_period):
+    """Figure (Agg canvas) of the particle locations of half-tide i over plot_grid."""
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    im = ax.imshow(plot_grid)
+    ax.scatter(yinds, xinds, c='r')
+    fig.colorbar(im, ax=ax)
+    ax.set_title(tide_title(i, tide_period))
+    fig.tight_layout()
+    return fig
+
+
+def render_tide_frame(plot_grid, xinds, yinds, i, tide_period, fname=None):
+    """Draw the particle locations of half-tide i over plot_grid and save to fname.
+
+    Same frame as particletransport.save_tide_plot (dorado's plot_state with
+    a colorbar and title), default file name str(i) + '.png'.
+    """
+    fig = draw_tide_frame(plot_grid, xinds, yinds, i, tide_period)
+    fig.savefig(str(i) + '.png' if fname is None else fname)
+
+
+def _init_worker(plot_grid):
+    global _worker_grid
+    _worker_grid = plot_grid
+
+
+def _render_in_worker(args):
+    render_tide_frame(_worker_grid, *args)
+
+
+class FrameRenderer:
+    """Queue of half-tide frames rendered in the background.
+
+    Inputs :
+        plot_grid : `numpy.ndarray`
+            grid on which to plot the particles (e.g. depth)
+
+        tide_period : `int`
+            tidal period in seconds
+
+        workers : `int`
+            number of rendering processes, 0 renders in the calling process
+
+        max_pending : `int` (Optional)
+            frames allowed in the queue before submit() waits for the oldest,
+            defaults to 4 per worker (bounds the memory held by snapshots)
+
+    """
+
+    def __init__(self, plot_grid, tide_period, workers=1, max_pending=None):
+        self.plot_grid = plot_grid
+        self.tide_period = tide_period
+        self.max_pending = max_pending or 4*max(workers, 1)
+        self._pending = []
+        self._pool = None
+        if workers > 0:
+            # the plot grid is sent to every worker once, not with every frame
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(np.asarray(plot_grid),))
+
+    def submit(self, i, xinds, yinds):
+        """Render the frame of half-tide i from a copy of the particle locations."""
+        args = (np.array(xinds), np.array(yinds), i, self.tide_period)
+        if self._pool is None:
+            render_tide_frame(self.plot_grid, *args)
+            return
+        while len(self._pending) >= self.max_pending:
+            self._pending.pop(0).result()
+        self._pending.append(self._pool.submit(_render_in_worker, args))
+
+    def close(self):
+        """Wait for the queued frames (re-raising rendering errors) and stop the workers."""
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._pending = []
+            if self._pool is not None:
+                self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,163 @@
+"""
+Per-stage timers and counters for the erosion and particle loops
+A Profiler records the wall time (and optionally the tracemalloc allocation peak) of every
+stage of every step, plus counters and per-step values such as solver iterations
+It can be switched on and off at runtime; when off, stage() returns a shared no-op context
+manager so the instrumented loops pay only a method call per stage
+Records export to CSV or to a Chrome/Perfetto trace (chrome://tracing, ui.perfetto.dev)
+"""
+
+# imports
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    """Context manager timing one stage of a Profiler."""
+
+    __slots__ = ('profiler', 'name', 'start', 'mem0')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.mem0 = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        peak = None
+        if self.profiler.memory:
+            peak = tracemalloc.get_traced_memory()[1] - self.mem0
+        p = self.profiler
+        p.events.append((p.step, self.name, self.start - p.t0, end - self.start, peak))
+
+
+class Profiler:
+    """Stage timers, counters and per-step values of a run.
+
+    Inputs :
+        enabled : `bool`
+            Record anything at all (can be changed at any time)
+
+        memory : `bool`
+            Also record the tracemalloc allocation peak of every stage (bytes
+            above the memory in use when the stage started); slows numpy code
+            down a little and should not be used with nested stages
+
+    Use as:
+        prof = Profiler()
+        with prof.stage('flow'):
+            tfc.run_one_step()
+        prof.record('solver_iterations', tfc.last_iterations)
+        prof.next_step()
+    """
+
+    def __init__(self, enabled=True, memory=False):
+        self.enabled = enabled
+        self.memory = memory
+        self.t0 = time.perf_counter()
+        self.step = 0
+        self.events = []  # (step, stage, start (s), duration (s), allocation peak (bytes) or None)
+        self.values = []  # (step, name, value)
+        self.counters = {}
+
+    def stage(self, name):
+        """Context manager timing the stage name of the current step."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        """Add n to the counter name."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name, value):
+        """Record a value (e.g. solver iterations) for the current step."""
+        if self.enabled:
+            self.values.append((self.step, name, value))
+
+    def next_step(self):
+        """Start the next step."""
+        if self.enabled:
+            self.step += 1
+
+    def reset(self):
+        self.t0 = time.perf_counter()
+        self.step = 0
+        self.events = []
+        self.values = []
+        self.counters = {}
+
+    def summary(self):
+        """Per stage: number of calls, total, mean and max time (s) and max allocation peak."""
+        out = {}
+        for _, name, _, duration, peak in self.events:
+            s = out.setdefault(name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'peak_bytes': None})
+            s['calls'] += 1
+            s['total_s'] += duration
+            s['max_s'] = max(s['max_s'], duration)
+            if peak is not None:
+                s['peak_bytes'] = max(s['peak_bytes'] or 0, peak)
+        for s in out.values():
+            s['mean_s'] = s['total_s'] / s['calls']
+        return out
+
+    def report(self):
+        """Text table of summary(), slowest stage first."""
+        lines = ['%-20s %8s %12s %12s %12s' % ('stage', 'calls', 'total (s)', 'mean (s)', 'peak (MB)')]
+        summary = self.summary()
+        for name in sorted(summary, key=lambda n: -summary[n]['total_s']):
+            s = summary[name]
+            peak = '-' if s['peak_bytes'] is None else '%.2f' % (s['peak_bytes'] / 1e6)
+            lines.append('%-20s %8d %12.4f %12.4f %12s' % (name, s['calls'], s['total_s'], s['mean_s'], peak))
+        for name, n in sorted(self.counters.items()):
+            lines.append('%-20s %8s' % (name, n))
+        return '\n'.join(lines)
+
+    def to_csv(self, fname):
+        """Write one row per stage call and per recorded value."""
+        with open(fname, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['step', 'kind', 'name', 'start_s', 'duration_s', 'peak_bytes', 'value'])
+            for step, name, start, duration, peak in self.events:
+                writer.writerow([step, 'stage', name, start, duration, '' if peak is None else peak, ''])
+            for step, name, value in self.values:
+                writer.writerow([step, 'value', name, '', '', '', value])
+            for name, n in self.counters.items():
+                writer.writerow(['', 'counter', name, '', '', '', n])
+
+    def to_trace(self, fname):
+        """Write a Chrome trace-event JSON file (stages as complete events, values as counters)."""
+        events = []
+        for step, name, start, duration, peak in self.events:
+            args = {'step': step}
+            if peak is not None:
+                args['peak_bytes'] = peak
+            events.append({'name': name, 'ph': 'X', 'ts': start*1e6, 'dur': duration*1e6,
+                           'pid': 0, 'tid': 0, 'args': args})
+        # values are placed at the end of the last stage of their step
+        step_end = {}
+        for step, _, start, duration, _ in self.events:
+            step_end[step] = max(step_end.get(step, 0.0), start + duration)
+        for step, name, value in self.values:
+            events.append({'name': name, 'ph': 'C', 'ts': step_end.get(step, 0.0)*1e6,
+                           'pid': 0, 'args': {name: value}})
+        with open(fname, 'w') as f:
+            json.dump({'traceEvents': events, 'otherData': {'counters': self.counters}}, f)
+
+
+# shared disabled profiler, the default of the instrumented loops
+NULL_PROFILER = Profiler(enabled=False)
@@ -1,18 +1,111 @@
-"""Make gif from images."""
+"""Make gif from images.
+
+The animation is encoded in one streaming pass, one frame in memory at a
+time. Frames can be image files, RGB arrays, matplotlib figures, or be
+rendered straight from particle snapshots or 2D fields, so no intermediate
+PNG files are needed.
+
+Run as a script to make demo.gif from the numbered images (0.png, 1.png, ...)
+of the current folder.
+"""
+import glob
+import os
 try:
     import imageio
-    from pygifsicle import optimize
 except Exception:
-    raise ImportError('Required libraries could not be found: \n'
-                      'imageio and pygifsicle')
+    raise ImportError('Required library could not be found: \n'
+                      'imageio')
+import numpy as np
+import matplotlib
+from matplotlib import colors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+try:
+    from .frame_render import draw_tide_frame
+except ImportError:
+    from frame_render import draw_tide_frame
+
+
+def figure_to_array(fig):
+    """RGB array of a matplotlib figure, drawn on an Agg canvas."""
+    canvas = fig.canvas
+    if not isinstance(canvas, FigureCanvasAgg):
+        canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+
+def _as_frame(frame):
+    if isinstance(frame, str):
+        return imageio.imread(frame)
+    if hasattr(frame, 'canvas'):
+        return figure_to_array(frame)
+    return np.asarray(frame)
+
+
+def write_animation(fname, frames, duration=0.25, optimize_gif=False):
+    """Encode the frames into an animation (e.g. a .gif) in one pass.
+
+    Inputs :
+        fname : `str`
+            Output file, the format follows the extension
+
+        frames : `iterable`
+            Image file names, RGB(A) arrays or matplotlib figures; a generator
+            keeps only one frame in memory
+
+        duration : `float`
+            Display time of each frame (as for imageio.mimsave)
+
+        optimize_gif : `bool`
+            Optimize the gif with pygifsicle afterwards (if installed)
+
+    Returns :
+        nframes : `int`
+            Number of frames written
+
+    """
+    nframes = 0
+    with imageio.get_writer(fname, mode='I', duration=duration) as writer:
+        for frame in frames:
+            writer.append_data(_as_frame(frame))
+            nframes += 1
+    if optimize_gif:
+        from pygifsicle import optimize
+        optimize(fname)
+    return nframes
+
+
+def particle_frames(plot_grid, snapshots, tide_period):
+    """Frames of particle snapshots, as collected by tidal_particles(snapshots=...).
+
+    snapshots is an iterable of (time, xinds, yinds); a walk_io.WalkReader can
+    be used through ((t, s['xinds'], s['yinds']) for t, s in reader).
+    """
+    for i, (_, xinds, yinds) in enumerate(snapshots):
+        yield figure_to_array(draw_tide_frame(plot_grid, xinds, yinds, i, tide_period))
+
+
+def field_frames(fields, cmap='viridis', vmin=None, vmax=None):
+    """Frames of 2D arrays (e.g. topography snapshots) mapped through a colormap.
+
+    Without vmin/vmax the range of the first field is used for all frames.
+    """
+    norm = None
+    cmap = matplotlib.colormaps[cmap] if isinstance(cmap, str) else cmap
+    for field in fields:
+        if norm is None:
+            norm = colors.Normalize(np.nanmin(field) if vmin is None else vmin,
+                                    np.nanmax(field) if vmax is None else vmax)
+        yield cmap(norm(field), bytes=True)[:, :, :3]
+
 
-# first make the gif - set range based on number of output images
-images = []
-for i in range(0, 30):
-    fname = str(i) + '.png'
-    images.append(imageio.imread(fname))
+def numbered_images(folder='.'):
+    """Image files 0.png, 1.png, ... of folder, in numerical order."""
+    files = glob.glob(os.path.join(folder, '*.png'))
+    numbered = [f for f in files if os.path.splitext(os.path.basename(f))[0].isdigit()]
+    return sorted(numbered, key=lambda f: int(os.path.splitext(os.path.basename(f))[0]))
 
-imageio.mimsave('demo.gif', images, duration=0.25)
 
-# then optimize it
-optimize('demo.gif')
+if __name__ == '__main__':
+    # make the gif of all numbered images, then optimize it
+    write_animation('demo.gif', numbered_images(), duration=0.25, optimize_gif=True)
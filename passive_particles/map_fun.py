@@ -1,7 +1,10 @@
 """Mapping functions."""
+import weakref
 from landlab.grid.mappers import map_link_vector_components_to_node as mln
 import numpy as np
 
+_PRODUCTS = weakref.WeakKeyDictionary()
+
 
 def map_velocity_components_to_nodes(grid):
     """Map the velocity components from the links to the nodes.
@@ -30,6 +33,121 @@ def map_velocity_components_to_nodes(grid):
     return (ebb_vel_x, ebb_vel_y, flood_vel_x, flood_vel_y)
 
 
+class VelocityProducts:
+    """Node velocity products of one flow state of a grid.
+
+    Inputs :
+        grid : `obj`
+            A landlab grid object
+
+    The ebb components are mapped to the nodes once; the flood components,
+    the magnitude and the down-sampled quiver views are derived from them
+    on first use and kept. All arrays are read-only, copy them before
+    modifying. Use velocity_products() to get the products shared by the
+    plotting functions.
+    """
+
+    def __init__(self, grid):
+        velocity = grid.at_link['ebb_tide_flow__velocity']
+        self._grid = weakref.ref(grid)  # not a strong reference: the cache is keyed by the grid
+        self._velocity = weakref.ref(velocity)
+        self.ebb_x, self.ebb_y = mln(grid, velocity)
+        self._derived = {}
+        self._lock(self.ebb_x, self.ebb_y)
+
+    @property
+    def grid(self):
+        """The grid of the products (None once it has been deleted)."""
+        return self._grid()
+
+    def is_current(self, grid):
+        """False once ebb_tide_flow__velocity has been replaced by a new array."""
+        return self._velocity() is grid.at_link['ebb_tide_flow__velocity']
+
+    @staticmethod
+    def _lock(*arrays):
+        for a in arrays:
+            a.flags.writeable = False
+
+    def _get(self, key, make):
+        try:
+            return self._derived[key]
+        except KeyError:
+            value = self._derived[key] = make()
+            self._lock(*(value if isinstance(value, tuple) else (value,)))
+            return value
+
+    @property
+    def flood_x(self):
+        """Flood x component of flow velocity."""
+        return self._get('flood_x', lambda: -self.ebb_x)
+
+    @property
+    def flood_y(self):
+        """Flood y component of flow velocity."""
+        return self._get('flood_y', lambda: -self.ebb_y)
+
+    @property
+    def magnitude(self):
+        """Velocity magnitude at the nodes (the same for ebb and flood)."""
+        return self._get('magnitude', lambda: np.sqrt(self.ebb_x * self.ebb_x + self.ebb_y * self.ebb_y))
+
+    def components(self):
+        """(ebb_x, ebb_y, flood_x, flood_y), as map_velocity_components_to_nodes."""
+        return (self.ebb_x, self.ebb_y, self.flood_x, self.flood_y)
+
+    def quiver(self, resample=1, tide='ebb'):
+        """Node coordinates and velocity components down-sampled for a quiver plot.
+
+        Inputs :
+            resample : `int`
+                Downsampling value
+
+            tide : `str`
+                'ebb' or 'flood'
+
+        Returns :
+            (xr, yr, ur, vr) : `tuple` of `numpy.ndarray`
+        """
+        if tide not in ('ebb', 'flood'):
+            raise ValueError("tide must be 'ebb' or 'flood'")
+
+        def make():
+            u = getattr(self, tide + '_x')
+            v = getattr(self, tide + '_y')
+            grid = self._grid()
+            x = grid.x_of_node
+            y = grid.y_of_node
+            if resample == 1:
+                return (x, y, u, v)
+            shape = (grid.number_of_node_rows, grid.number_of_node_columns)
+            return tuple(np.ascontiguousarray(a.reshape(shape)[::resample, ::resample])
+                         for a in (x, y, u, v))
+
+        return self._get(('quiver', tide, resample), make)
+
+
+def velocity_products(grid):
+    """Return the VelocityProducts of a grid, mapped on the first call after a flow solve.
+
+    The products are kept per grid until invalidate_velocity_products(grid)
+    is called or ebb_tide_flow__velocity is replaced by a new array, so
+    repeated plots of the same flow share a single link to node mapping.
+    tec.populateGrids, tec.updategrids and DerivedFieldRegistry.flow_solved
+    invalidate them; call invalidate_velocity_products after any other
+    tfc.run_one_step() that writes the velocities in place.
+    """
+    products = _PRODUCTS.get(grid)
+    if products is None or not products.is_current(grid):
+        products = _PRODUCTS[grid] = VelocityProducts(grid)
+    return products
+
+
+def invalidate_velocity_products(grid):
+    """Drop the VelocityProducts of a grid after a new flow solution."""
+    _PRODUCTS.pop(grid, None)
+
+
 class gridded_vars:
     """Class to hold the gridded variable data."""
 
@@ -41,7 +159,8 @@ class gridded_vars:
                 A landlab grid object.
 
         """
-        # get velocity components
+        # get velocity components (mapped here rather than taken from
+        # velocity_products: the particle routing modifies them in place)
         (eb_x, eb_y, fl_x, fl_y) = map_velocity_components_to_nodes(grid)
 
         # convert components to attributes of the class
@@ -53,3 +172,60 @@ class gridded_vars:
                                grid.shape))
         self.depth = np.flipud(np.reshape(grid.at_node['mean_water__depth'],
                                 grid.shape))
+
+
+def _flipped(values, shape):
+    """Row-flipped 2D view of a node array."""
+    return np.flipud(np.reshape(values, shape))
+
+
+class compact_gridded_vars:
+    """Memory-lean version of gridded_vars.
+
+    Same attributes as gridded_vars, but only the ebb components are kept:
+    the flood components are derived from them with a sign flip on first
+    access, and elev and depth are views of the grid fields. With a dtype
+    such as np.float32 the ebb components are stored in it; elev and depth
+    stay views (a cast would be a new array on top of the grid fields).
+
+    """
+
+    __slots__ = ('ex', 'ey', 'elev', 'depth', '_fx', '_fy')
+
+    def __init__(self, grid, dtype=None):
+        """Initialize the class.
+
+        Inputs :
+            grid : `obj`
+                A landlab grid object.
+
+            dtype : `numpy.dtype` (Optional)
+                dtype of the velocity components (e.g. np.float32),
+                defaults to that of the link velocity field
+
+        """
+        # mapped here rather than taken from velocity_products, so no
+        # float64 copy of the components is kept alive by the shared cache
+        eb_x, eb_y = mln(grid, grid.at_link['ebb_tide_flow__velocity'])
+        if dtype is not None:
+            eb_x = eb_x.astype(dtype, copy=False)
+            eb_y = eb_y.astype(dtype, copy=False)
+        self.ex = _flipped(eb_x, grid.shape)  # ebb x
+        self.ey = _flipped(eb_y, grid.shape)  # ebb y
+        self.elev = _flipped(grid.at_node['topographic__elevation'], grid.shape)
+        self.depth = _flipped(grid.at_node['mean_water__depth'], grid.shape)
+        self._fx = self._fy = None
+
+    @property
+    def fx(self):
+        """Flood x component of flow velocity (computed on first access)."""
+        if self._fx is None:
+            self._fx = -self.ex
+        return self._fx
+
+    @property
+    def fy(self):
+        """Flood y component of flow velocity (computed on first access)."""
+        if self._fy is None:
+            self._fy = -self.ey
+        return self._fy
@@ -0,0 +1,340 @@
+"""Vectorized tidal particle routing.
+
+All particles are held as flat NumPy arrays (struct-of-arrays) and advanced
+together with the weighted random walk of dorado: D8 routing weights from
+the water surface slope and the discharge direction, depth weighting with
+theta, and travel times from the inverse velocity along the flow direction.
+The routing weights of the ebb and flood tides are built once; the flood
+tide is the ebb one with the sign of the velocities flipped, so switching
+tides does not rebuild anything.
+"""
+import numpy as np
+try:
+    from .exposure import ExposureMaps
+    from .instrumentation import NULL_PROFILER
+except ImportError:
+    from exposure import ExposureMaps
+    from instrumentation import NULL_PROFILER
+
+# tides
+EBB = 0
+FLOOD = 1
+
+# D8 stencil in the order of dorado: [NW, N, NE, W, 0, E, SW, S, SE]
+_DI = np.array([-1, -1, -1, 0, 0, 0, 1, 1, 1])  # row step
+_DJ = np.array([-1, 0, 1, -1, 0, 1, -1, 0, 1])  # column step
+_SQRT2 = np.sqrt(2)
+_SQRT05 = np.sqrt(0.5)
+_DISTANCES = np.array([_SQRT2, 1, _SQRT2, 1, 1, 1, _SQRT2, 1, _SQRT2])
+_IVEC = np.array([-_SQRT05, 0, _SQRT05, -1, 0, 1, -_SQRT05, 0, _SQRT05])
+_JVEC = np.array([-_SQRT05, -1, -_SQRT05, 0, 0, 0, _SQRT05, 1, _SQRT05])
+_ANGLES = np.array([3*np.pi/4, np.pi/2, np.pi/4, np.pi, 0, 0,
+                    5*np.pi/4, 3*np.pi/2, 7*np.pi/4])
+_STAY = 4
+
+
+def _neighbours(raster):
+    """D8 neighbours of every cell along a third axis, zero on the border."""
+    L, W = raster.shape
+    out = np.zeros((L, W, 9))
+    for k in range(9):
+        out[1:-1, 1:-1, k] = raster[1+_DI[k]:L-1+_DI[k], 1+_DJ[k]:W-1+_DJ[k]]
+    return out
+
+
+def _clear_borders(weights):
+    weights[0, :, :] = 0
+    weights[-1, :, :] = 0
+    weights[:, 0, :] = 0
+    weights[:, -1, :] = 0
+
+
+def _normalize(weights):
+    norm = np.nansum(weights, axis=2)
+    pos = norm > 0
+    weights[pos] /= norm[pos][:, None]
+
+
+def default_cell_type(depth, dry_depth=0.1):
+    """Cell types as estimated by dorado: 2 = land, 0 = water, -1 = edge."""
+    cell_type = np.zeros(depth.shape, dtype=int)
+    cell_type[depth < dry_depth] = 2
+    return np.pad(cell_type[1:-1, 1:-1], 1, 'constant', constant_values=-1)
+
+
+def edge_cells(cell_type):
+    """Mask of the cells where particles leave the domain (next to an edge cell, or on the border)."""
+    edge = _neighbours((cell_type == -1).astype(float)).max(axis=2) > 0
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    return edge
+
+
+class ParticleEngine:
+    """Weighted random walk of many particles on fixed ebb/flood fields.
+
+    Inputs :
+        depth : `numpy.ndarray`
+            2D array of water depth
+
+        topography : `numpy.ndarray`
+            2D array of bed elevation
+
+        ex, ey : `numpy.ndarray`
+            2D arrays of the ebb velocity components (as in map_fun.gridded_vars),
+            the flood ones are -ex and -ey
+
+        dx : `float`
+            Size of the raster grid cells
+
+        theta, gamma, diff_coeff, dry_depth : `float`
+            Routing parameters of dorado (same defaults)
+
+        cell_type : `numpy.ndarray` (Optional)
+            2D array of dorado cell types, estimated from the depth if not given
+
+        dtype : `numpy.dtype`
+            dtype of the routing weight tables, np.float32 halves their memory
+
+        seed : `int` (Optional)
+            Seed of the random number generator
+
+    """
+
+    def __init__(self, depth, topography, ex, ey, dx, theta=1.0, gamma=0.05,
+                 diff_coeff=0.2, dry_depth=0.1, cell_type=None,
+                 dtype=np.float64, seed=None):
+        depth = np.array(depth, dtype=float)
+        depth[np.isnan(depth)] = 0
+        self.shape = depth.shape
+        self.dx = float(dx)
+        self.diff_coeff = float(diff_coeff)
+        self.rng = np.random.default_rng(seed)
+        if cell_type is None:
+            cell_type = default_cell_type(depth, dry_depth)
+
+        # velocities and discharges in the rotated frame used by dorado
+        u = -np.asarray(ey, dtype=float)
+        v = np.asarray(ex, dtype=float)
+        velocity = np.sqrt(u**2 + v**2)
+        velocity[velocity < 1e-8] = 1e-8
+        qx = u*depth
+        qy = v*depth
+        u = np.where(np.abs(u) < 1e-8, 1e-8, u)
+        v = np.where(np.abs(v) < 1e-8, 1e-8, v)
+        angle = np.arctan2(-u, v)
+        self._inv_velocity = (1/velocity).ravel()
+        self._cos_angle = np.cos(angle).ravel()
+        self._sin_angle = np.sin(angle).ravel()
+
+        # flat index offsets and step geometry of the D8 neighbours
+        W = self.shape[1]
+        self._offsets = _DI*W + _DJ
+        self._step_length = _DISTANCES*self.dx
+        self._cos_step = np.cos(_ANGLES)
+        self._sin_step = np.sin(_ANGLES)
+
+        # particles next to an edge cell stop (they have left the domain)
+        self._edge = edge_cells(cell_type).ravel()
+
+        stage = np.asarray(topography, dtype=float) + depth
+        stage[depth == 0] = np.nan
+        self._cum_weights = self._routing_tables(stage, depth, qx, qy, cell_type, theta,
+                                                 gamma, dry_depth, dtype)
+
+        # particle state, filled by seed()
+        self.x = np.empty(0, dtype=np.int32)
+        self.y = np.empty(0, dtype=np.int32)
+        self.travel_time = np.empty(0)
+        self.last_dt = np.empty(0)
+        self.exit_time = np.empty(0)
+        # number of moves of all particles; a dorado walk also holds the start
+        # position, so its length is one more than the moves of that particle
+        self.steps = 0
+        # exposure.ExposureMaps updated with every step, see track_exposure()
+        self.exposure = None
+
+    @classmethod
+    def from_params(cls, params, **kwds):
+        """Build the engine from the params of particletransport.init_particles()."""
+        for name in ('theta', 'gamma', 'diff_coeff', 'dry_depth', 'cell_type'):
+            if getattr(params, name, None) is not None:
+                kwds.setdefault(name, getattr(params, name))
+        engine = cls(params.depth, params.topography, params.ex, params.ey, params.dx, **kwds)
+        engine.seed(params.seed_xloc, params.seed_yloc, params.Np_tracer)
+        return engine
+
+    @staticmethod
+    def _routing_tables(stage, depth, qx, qy, cell_type, theta, gamma, dry_depth, dtype):
+        """Cumulative D8 routing weights of the ebb and flood tides, shape (2, ncells, 9)."""
+        L, W = stage.shape
+        depth_nb = _neighbours(depth)
+        invalid = (depth_nb <= dry_depth) | (_neighbours(cell_type) == 2)
+
+        # surface slope component, the same for both tides
+        weight_sfc = (stage[:, :, None] - _neighbours(stage)) / _DISTANCES
+        weight_sfc[weight_sfc <= 0] = 0
+        _clear_borders(weight_sfc)
+        weight_sfc[invalid] = 0
+        _normalize(weight_sfc)
+
+        # inertial component, its sign flips with the tide
+        projection = (qx[:, :, None]*_JVEC + qy[:, :, None]*_IVEC) / _DISTANCES
+        deepest = depth_nb == depth_nb.max(axis=2)[:, :, None]
+
+        tables = np.empty((2, L*W, 9), dtype=dtype)
+        for tide, sign in ((EBB, 1), (FLOOD, -1)):
+            weight_int = np.maximum(sign*projection, 0)
+            _clear_borders(weight_int)
+            weight_int[invalid] = 0
+            _normalize(weight_int)
+
+            weight = gamma*weight_sfc + (1 - gamma)*weight_int
+            weight *= depth_nb**theta
+            weight[invalid] = 0
+            # dead ends with only nans and zeros go to the deepest cell
+            dead_end = np.nansum(weight, axis=2) <= 0
+            weight[dead_end[:, :, None] & deepest] = 1.0
+            _clear_borders(weight)
+            weight[np.isnan(weight)] = 0
+            np.cumsum(weight.reshape(L*W, 9), axis=1, out=tables[tide])
+        return tables
+
+    def seed(self, seed_xloc, seed_yloc, Np_tracer, seed_time=0, method='random'):
+        """Add Np_tracer particles at the seed locations (row and column indices).
+
+        method 'random' picks rows and columns independently from the seed
+        lists, 'exact' cycles through the (row, column) pairs, as in dorado.
+        """
+        seed_xloc = np.asarray(seed_xloc, dtype=np.int32)
+        seed_yloc = np.asarray(seed_yloc, dtype=np.int32)
+        if method == 'random':
+            x = seed_xloc[self.rng.integers(len(seed_xloc), size=Np_tracer)]
+            y = seed_yloc[self.rng.integers(len(seed_yloc), size=Np_tracer)]
+        elif method == 'exact':
+            x = np.resize(seed_xloc, Np_tracer)
+            y = np.resize(seed_yloc, Np_tracer)
+        else:
+            raise ValueError("method must be 'random' or 'exact'")
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self.travel_time = np.concatenate([self.travel_time, np.full(Np_tracer, float(seed_time))])
+        self.last_dt = np.concatenate([self.last_dt, np.full(Np_tracer, 0.1)])
+        exit_time = np.full(Np_tracer, np.nan)
+        at_edge = self._edge[x*self.shape[1] + y]
+        exit_time[at_edge] = seed_time
+        self.exit_time = np.concatenate([self.exit_time, exit_time])
+
+    @property
+    def Np_tracer(self):
+        return self.x.size
+
+    @property
+    def exited(self):
+        """Mask of the particles that reached the domain edge."""
+        return ~np.isnan(self.exit_time)
+
+    def _step(self, idx, tide):
+        """Move particles idx one step; returns the mask of those that moved."""
+        W = self.shape[1]
+        cell = self.x[idx]*W + self.y[idx]
+        cum = self._cum_weights[tide][cell]
+        pick = self.rng.random(idx.size)*cum[:, -1]
+        k = np.minimum((cum < pick[:, None]).sum(axis=1), 8)
+        moved = k != _STAY
+        idx, cell, k = idx[moved], cell[moved], k[moved]
+        new_cell = cell + self._offsets[k]
+
+        # travel time from the inverse velocity along the mean flow direction
+        sign = 1 if tide == EBB else -1
+        along = sign*(self._cos_step[k]*self._cos_angle[cell] + self._sin_step[k]*self._sin_angle[cell])
+        dt = 0.5*self._step_length[k]*np.maximum(along, 0) \
+            * (self._inv_velocity[cell] + self._inv_velocity[new_cell])
+        if self.diff_coeff > 0:
+            dt *= 1 + (0.5 - self.rng.random(idx.size))*self.diff_coeff
+
+        self.x[idx] = new_cell // W
+        self.y[idx] = new_cell % W
+        self.travel_time[idx] += dt
+        self.last_dt[idx] = dt
+        out = self._edge[new_cell]
+        self.exit_time[idx[out]] = self.travel_time[idx[out]]
+        self.steps += idx.size
+        if self.exposure is not None:
+            self.exposure.add_steps(cell, new_cell, dt, self.travel_time[idx])
+        return moved
+
+    def track_exposure(self, exposure=None):
+        """Accumulate the visits, residence and exit times of every later step.
+
+        Returns the exposure.ExposureMaps used (a new one if not given).
+        """
+        if exposure is None:
+            exposure = ExposureMaps(self.shape)
+        if exposure.edge is None:
+            exposure.edge = self._edge
+        self.exposure = exposure
+        return exposure
+
+    def step(self, tide=EBB):
+        """Move every particle that has not left the domain one step."""
+        idx = np.flatnonzero(~self.exited)
+        self._step(idx, tide)
+
+    def run_until(self, target_time, tide=EBB, max_iter=10000):
+        """Step the particles until their travel times are closest to target_time.
+
+        As in dorado, a particle stops when another step (estimated from its
+        last one) would take it further from target_time, when it stays in
+        place (dead end) or reaches the domain edge, or after max_iter steps.
+        Only moves are counted in steps: for the same target_time the dorado
+        walk lists are one entry longer, as they start with the seed location.
+        """
+        idx = np.flatnonzero(~self.exited)
+        est = self.last_dt[idx]
+        count = 0
+        while idx.size:
+            t = self.travel_time[idx]
+            keep = np.abs(t - target_time) >= np.abs(t + est - target_time)
+            idx = idx[keep]
+            if not idx.size:
+                break
+            moved = self._step(idx, tide)
+            idx = idx[moved]
+            idx = idx[np.isnan(self.exit_time[idx])]
+            est = np.maximum(0.1, self.last_dt[idx])
+            count += 1
+            if count >= max_iter:
+                break
+
+    def run_tides(self, tide_period, n_tide_periods, callback=None, max_iter=10000,
+                  profiler=None):
+        """Route the particles over n_tide_periods tides, as particletransport.tidal_particles.
+
+        The first half-tide is a single ebb step, then ebb and flood alternate,
+        each run until tide_period/2*(i+1). callback(engine, i) is called after
+        each half-tide i. An instrumentation.Profiler passed as profiler times
+        the 'routing' and 'output' (callback) stages of every half-tide and
+        counts the 'particle_steps'.
+        """
+        if profiler is None:
+            profiler = NULL_PROFILER
+        for i in range(0, int(2*n_tide_periods)):
+            steps = self.steps
+            with profiler.stage('routing'):
+                if i == 0:
+                    self.step(EBB)
+                else:
+                    tide = EBB if i % 2 != 0 else FLOOD
+                    self.run_until(tide_period/2*(i+1), tide, max_iter)
+            profiler.count('particle_steps', self.steps - steps)
+            if callback is not None:
+                with profiler.stage('output'):
+                    callback(self, i)
+            profiler.next_step()
+
+    def walk_data(self):
+        """Current state as dorado walk_data (one entry per particle), e.g. for plot_state."""
+        return {'xinds': self.x[:, None].tolist(),
+                'yinds': self.y[:, None].tolist(),
+                'travel_times': self.travel_time[:, None].tolist()}
@@ -2,6 +2,17 @@
 from dorado import particle_track as pt
 from dorado.routines import plot_state
 import matplotlib.pyplot as plt
+import numpy as np
+try:
+    from .particle_engine import ParticleEngine, default_cell_type, edge_cells
+    from .instrumentation import NULL_PROFILER
+    from .walk_io import WalkWriter, last_state
+    from .frame_render import FrameRenderer, tide_title
+except ImportError:
+    from particle_engine import ParticleEngine, default_cell_type, edge_cells
+    from instrumentation import NULL_PROFILER
+    from walk_io import WalkWriter, last_state
+    from frame_render import FrameRenderer, tide_title
 
 
 def init_particles(init_x, init_y, Np_tracer, grid_spacing, gridded_vals):
@@ -21,15 +32,15 @@ def init_particles(init_x, init_y, Np_tracer, grid_spacing, gridded_vals):
             Size of the raster grid cells
 
         gridded_vals : `obj`
-            gridded_vals object from map_fun.py
+            gridded_vars or compact_gridded_vars object from map_fun.py
 
     Outputs :
         params : `obj`
             an initialized params class
 
     """
-    # create class
-    params = pt.params()
+    # create class (dorado 2 names it modelParams)
+    params = pt.params() if hasattr(pt, 'params') else pt.modelParams()
     # populate with required parameters
     params.seed_xloc = init_y
     params.seed_yloc = init_x
@@ -39,16 +50,17 @@ def init_particles(init_x, init_y, Np_tracer, grid_spacing, gridded_vals):
     params.topography = gridded_vals.elev
     params.Np_tracer = Np_tracer
     params.dx = grid_spacing
-    # hold ebb and flood velocity components in the class too
+    # hold ebb velocity components in the class too, the flood ones are
+    # the ebb ones with the sign flipped (taken when the tide turns)
     params.ex = gridded_vals.ex
     params.ey = gridded_vals.ey
-    params.fx = gridded_vals.fx
-    params.fy = gridded_vals.fy
 
     return params
 
 
-def tidal_particles(params, tide_period, n_tide_periods, plot_grid=None):
+def tidal_particles(params, tide_period, n_tide_periods, plot_grid=None,
+                    native=False, seed=None, out_dir=None, render='sync',
+                    render_workers=1, snapshots=None, profiler=None, exposure=None):
     """Route the particles in tides.
 
     Inputs :
@@ -64,6 +76,39 @@ def tidal_particles(params, tide_period, n_tide_periods, plot_grid=None):
         plot_grid : `numpy.ndarray` (Optional)
             grid on which to plot the particles (e.g. depth)
 
+        native : `bool` (Optional)
+            route with the vectorized particle_engine.ParticleEngine instead
+            of rebuilding a dorado Particle every half-tide; walk_data then
+            only holds the final location and travel time of each particle
+
+        seed : `int` (Optional)
+            random seed of the native engine
+
+        out_dir : `str` (Optional)
+            folder to stream the particle states of every half-tide to with
+            walk_io.WalkWriter; only the last two steps of each particle are
+            then kept in walk_data (read the full run with walk_io.WalkReader)
+
+        render : `str` (Optional)
+            'sync' saves the image of each half-tide in the routing loop,
+            'async' hands the particle locations to frame_render.FrameRenderer
+            so the images are drawn in background processes, None saves no images
+
+        render_workers : `int` (Optional)
+            number of rendering processes with render='async'
+
+        snapshots : `list` (Optional)
+            list to append (time, xinds, yinds) of every half-tide to
+
+        profiler : `obj` (Optional)
+            instrumentation.Profiler timing the 'routing' and 'output'
+            (streaming, snapshots and plotting) stages of every half-tide
+
+        exposure : `obj` (Optional)
+            exposure.ExposureMaps of the grid to accumulate the per-cell
+            visits, residence and exit times of the particles in as they
+            move (get the maps with exposure.maps())
+
     Returns :
         walk_data : `list`
             history of particle locations and travel times
@@ -71,45 +116,102 @@ def tidal_particles(params, tide_period, n_tide_periods, plot_grid=None):
         Also saves image of particle locations to disk for each flood/ebb tide.
 
     """
-    # define the particle
-    particle = pt.Particle(params)
-    # record each 1/2 tidal cycle so each ebb and flood
-    for i in range(0, int(2*n_tide_periods)):
-        if i == 0:
-            # start with ebb tide
-            walk_data = particle.run_iteration()
-        else:
-            if i % 2 != 0:
-                # ebb tide
-                params.u = params.ex
-                params.v = params.ey
-                particle = pt.Particle(params)
-                walk_data = particle.run_iteration(previous_walk_data=walk_data,
-                                                   target_time=tide_period/2*(i+1))
-            else:
-                # flood tide
-                params.u = params.fx
-                params.v = params.fy
-                particle = pt.Particle(params)
-                walk_data = particle.run_iteration(previous_walk_data=walk_data,
-                                                   target_time=tide_period/2*(i+1))
-
-        # plot and save particle locations
-        if plot_grid is None:
-            plot_state(particle.depth, walk_data, -1, None, 'r')
-        else:
-            plot_state(plot_grid, walk_data, -1, None, 'r')
-
-        # set colorbar
-        plt.colorbar()
-
-        if i % 2 != 0:
-            plt.title('Ebb Tide, Time = ' + str(tide_period/2*(i+1)) + 's')
-        else:
-            plt.title('Flood Tide, Time = ' + str(tide_period/2*(i+1)) + 's')
-
-        plt.tight_layout()
-        plt.savefig(str(i) + '.png')
-        plt.close()
-
-    return walk_data
+    if render not in ('sync', 'async', None):
+        raise ValueError("render must be 'sync', 'async' or None")
+    if profiler is None:
+        profiler = NULL_PROFILER
+    writer = None if out_dir is None else WalkWriter(out_dir)
+    renderer = None
+    if render == 'async':
+        renderer = FrameRenderer(params.depth if plot_grid is None else plot_grid,
+                                 tide_period, workers=render_workers)
+
+    def output(i, walk_data, depth, state=None):
+        # snapshot, stream and plot the particle locations of half-tide i
+        if state is None and (renderer is not None or snapshots is not None):
+            state = last_state(walk_data)
+        if snapshots is not None:
+            snapshots.append((tide_period/2*(i+1), np.array(state[0]), np.array(state[1])))
+        if render == 'sync':
+            save_tide_plot(depth if plot_grid is None else plot_grid, walk_data, i, tide_period)
+        elif renderer is not None:
+            renderer.submit(i, state[0], state[1])
+
+    try:
+        if native:
+            engine = ParticleEngine.from_params(params, seed=seed)
+            if exposure is not None:
+                engine.track_exposure(exposure)
+
+            def save(engine, i):
+                if writer is not None:
+                    writer.write_engine(engine, tide_period/2*(i+1))
+                walk_data = engine.walk_data() if render == 'sync' else None
+                output(i, walk_data, params.depth, (engine.x, engine.y))
+
+            engine.run_tides(tide_period, n_tide_periods, callback=save, profiler=profiler)
+            return engine.walk_data()
+
+        if exposure is not None and exposure.edge is None:
+            cell_type = getattr(params, 'cell_type', None)
+            if cell_type is None:
+                dry_depth = getattr(params, 'dry_depth', None) or 0.1
+                cell_type = default_cell_type(np.nan_to_num(params.depth), dry_depth)
+            exposure.edge = edge_cells(cell_type)
+
+        # define the particle
+        particle = pt.Particle(params)
+        # record each 1/2 tidal cycle so each ebb and flood
+        for i in range(0, int(2*n_tide_periods)):
+            with profiler.stage('routing'):
+                if i == 0:
+                    # start with ebb tide
+                    walk_data = particle.run_iteration()
+                else:
+                    if i % 2 != 0:
+                        # ebb tide
+                        params.u = params.ex
+                        params.v = params.ey
+                        particle = pt.Particle(params)
+                        walk_data = particle.run_iteration(previous_walk_data=walk_data,
+                                                           target_time=tide_period/2*(i+1))
+                    else:
+                        # flood tide
+                        params.u = -params.ex
+                        params.v = -params.ey
+                        particle = pt.Particle(params)
+                        walk_data = particle.run_iteration(previous_walk_data=walk_data,
+                                                           target_time=tide_period/2*(i+1))
+
+            with profiler.stage('output'):
+                if exposure is not None:
+                    exposure.add_walk_data(walk_data)
+
+                # stream the locations to disk and drop the history
+                if writer is not None:
+                    writer.write_walk_data(walk_data, tide_period/2*(i+1))
+                    if exposure is not None:
+                        exposure.rebase(walk_data)
+
+                # plot and save particle locations
+                output(i, walk_data, particle.depth)
+            profiler.next_step()
+
+        return walk_data
+    finally:
+        if renderer is not None:
+            renderer.close()
+
+
+def save_tide_plot(plot_grid, walk_data, i, tide_period):
+    """Plot the particle locations after half-tide i and save them to i.png."""
+    plot_state(plot_grid, walk_data, -1, None, 'r')
+
+    # set colorbar
+    plt.colorbar()
+
+    plt.title(tide_title(i, tide_period))
+
+    plt.tight_layout()
+    plt.savefig(str(i) + '.png')
+    plt.close()
@@ -43,27 +43,8 @@ def plot_ebb_quiver(grid, resample=1):
     Returns :
         Draws a figure that can be rendered with plt.show()
     """
-    (ebb_x, ebb_y, _, _) = mf.map_velocity_components_to_nodes(grid)
-
-    # down-sample for legible quiver plots if needed
-    if resample != 1:
-        xr = grid.x_of_node.reshape((grid.number_of_node_rows,
-                                     grid.number_of_node_columns))[::resample,
-                                                                   ::resample]
-        yr = grid.y_of_node.reshape((grid.number_of_node_rows,
-                                     grid.number_of_node_columns))[::resample,
-                                                                   ::resample]
-        ebb_xr = ebb_x.reshape((grid.number_of_node_rows,
-                                grid.number_of_node_columns))[::resample,
-                                                              ::resample]
-        ebb_yr = ebb_y.reshape((grid.number_of_node_rows,
-                                grid.number_of_node_columns))[::resample,
-                                                              ::resample]
-    else:
-        xr = grid.x_of_node
-        yr = grid.y_of_node
-        ebb_xr = ebb_x
-        ebb_yr = ebb_y
+    # down-sampled for legible quiver plots if needed
+    (xr, yr, ebb_xr, ebb_yr) = mf.velocity_products(grid).quiver(resample, 'ebb')
 
     # ebb tide
     plt.figure()
@@ -87,27 +68,8 @@ def plot_flood_quiver(grid, resample=1):
     Returns :
         Draws a figure that can be rendered with plt.show()
     """
-    (_, _, flood_x, flood_y) = mvcn(grid)
-
-    # down-sample for legible quiver plots if needed
-    if resample != 1:
-        xr = grid.x_of_node.reshape((grid.number_of_node_rows,
-                                     grid.number_of_node_columns))[::resample,
-                                                                   ::resample]
-        yr = grid.y_of_node.reshape((grid.number_of_node_rows,
-                                     grid.number_of_node_columns))[::resample,
-                                                                   ::resample]
-        fld_xr = flood_x.reshape((grid.number_of_node_rows,
-                                  grid.number_of_node_columns))[::resample,
-                                                                ::resample]
-        fld_yr = flood_y.reshape((grid.number_of_node_rows,
-                                  grid.number_of_node_columns))[::resample,
-                                                                ::resample]
-    else:
-        xr = grid.x_of_node
-        yr = grid.y_of_node
-        fld_xr = flood_x
-        fld_yr = flood_y
+    # down-sampled for legible quiver plots if needed
+    (xr, yr, fld_xr, fld_yr) = mf.velocity_products(grid).quiver(resample, 'flood')
 
     # flood tide
     plt.figure()
@@ -131,9 +93,7 @@ def plot_ebb_magnitudes(grid, resample=1):
     Returns :
         Draws a figure that can be rendered with plt.show()
     """
-    (ebb_x, ebb_y, _, _) = mf.map_velocity_components_to_nodes(grid)
-
-    ebb_vel_magnitude = np.sqrt(ebb_x * ebb_x + ebb_y * ebb_y)
+    ebb_vel_magnitude = mf.velocity_products(grid).magnitude
     plt.figure()
     imshow_grid(grid, ebb_vel_magnitude, cmap='magma', color_for_closed='g')
     plt.title('Ebb Tide Velocity Magnitude (m/s)')
@@ -154,9 +114,8 @@ def plot_flood_magnitudes(grid, resample=1):
     Returns :
         Draws a figure that can be rendered with plt.show()
     """
-    (_, _, flood_x, flood_y) = mf.map_velocity_components_to_nodes(grid)
     plt.figure()
-    flood_vel_magnitude = np.sqrt(flood_x * flood_x + flood_y * flood_y)
+    flood_vel_magnitude = mf.velocity_products(grid).magnitude
     imshow_grid(grid, flood_vel_magnitude, cmap='magma', color_for_closed='g')
     plt.title('Flood Tide Velocity Magnitude (m/s)')
     plt.xlabel('Distance (m)')
@@ -0,0 +1,178 @@
+"""Streaming on-disk storage of particle walks.
+
+The particle locations and travel times are written once per half-tide to a
+folder of compressed .npz files (one per half-tide, particles split in chunks)
+plus a small JSON index, so only the current state has to be kept in memory.
+WalkReader reads them back lazily, by half-tide, time or particle.
+"""
+import json
+import os
+import numpy as np
+try:
+    from .atomic_io import write_atomic
+except ImportError:
+    from atomic_io import write_atomic
+
+WALK_VERSION = 1
+_INDEX = 'index.json'
+_FIELDS = ('xinds', 'yinds', 'travel_times')
+
+
+def last_state(walk_data):
+    """Current (last) xinds, yinds and travel_times of dorado walk_data as arrays."""
+    return tuple(np.array([w[-1] for w in walk_data[f]]) for f in _FIELDS)
+
+
+def trim_walk_data(walk_data, keep=2):
+    """Drop all but the last keep entries of every particle of dorado walk_data (in place).
+
+    dorado estimates the next step from the last two travel times, so keep=2
+    leaves the routing unchanged.
+    """
+    for f in walk_data:
+        for w in walk_data[f]:
+            del w[:-keep]
+    return walk_data
+
+
+class WalkWriter:
+    """Write particle states to path (a folder), one compressed file per half-tide.
+
+    Inputs :
+        path : `str`
+            Output folder, created if needed
+
+        chunk_size : `int`
+            Number of particles per chunk, the unit read by WalkReader
+
+        compress : `bool`
+            Use np.savez_compressed (True) or np.savez
+
+    Each half-tide file and then the index are replaced atomically, so a
+    WalkReader opened during (or after an interrupted) run sees every
+    completed half-tide and never a partial file.
+    """
+
+    def __init__(self, path, chunk_size=100000, compress=True):
+        self.path = path
+        self.chunk_size = int(chunk_size)
+        self.compress = compress
+        os.makedirs(path, exist_ok=True)
+        self.index = {'version': WALK_VERSION, 'Np_tracer': None,
+                      'chunk_size': self.chunk_size, 'halftides': []}
+
+    def write(self, xinds, yinds, travel_times, time, **extra):
+        """Append the state of all particles at the given (target) time.
+
+        extra arrays with one value per particle (e.g. exit_time) are stored too.
+        """
+        fields = dict(zip(_FIELDS, (np.asarray(xinds, dtype=np.int32),
+                                    np.asarray(yinds, dtype=np.int32),
+                                    np.asarray(travel_times, dtype=float))))
+        fields.update((k, np.asarray(v)) for k, v in extra.items())
+        n = fields['xinds'].size
+        if self.index['Np_tracer'] is None:
+            self.index['Np_tracer'] = n
+        elif n != self.index['Np_tracer']:
+            raise ValueError('number of particles changed from ' + str(self.index['Np_tracer'])
+                             + ' to ' + str(n))
+
+        arrays = {}
+        for c, start in enumerate(range(0, n, self.chunk_size)):
+            for name, values in fields.items():
+                arrays[name + '_' + str(c)] = values[start:start + self.chunk_size]
+
+        i = len(self.index['halftides'])
+        fname = 'halftide_' + str(i).zfill(5) + '.npz'
+        save = np.savez_compressed if self.compress else np.savez
+
+        def save_arrays(tmp):
+            with open(tmp, 'wb') as f:
+                save(f, **arrays)
+
+        def save_index(tmp):
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f)
+
+        write_atomic(os.path.join(self.path, fname), save_arrays)
+        self.index['halftides'].append({'file': fname, 'time': float(time),
+                                        'fields': list(fields)})
+        write_atomic(os.path.join(self.path, _INDEX), save_index)
+
+    def write_walk_data(self, walk_data, time, trim=True):
+        """Append the last state of dorado walk_data, trimming its history if trim."""
+        self.write(*last_state(walk_data), time)
+        if trim:
+            trim_walk_data(walk_data)
+
+    def write_engine(self, engine, time):
+        """Append the state of a particle_engine.ParticleEngine."""
+        self.write(engine.x, engine.y, engine.travel_time, time, exit_time=engine.exit_time)
+
+
+class WalkReader:
+    """Lazy reader of a folder written by WalkWriter.
+
+    reader[i] is the state of half-tide i (a dict of arrays), iterating gives
+    (time, state) pairs, and particles= arguments (an index, slice or array of
+    particle numbers) only load the chunks that hold those particles.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _INDEX)) as f:
+            self.index = json.load(f)
+        if self.index.get('version') != WALK_VERSION:
+            raise ValueError('unsupported walk data version in ' + path)
+        self.Np_tracer = self.index['Np_tracer'] or 0
+        self.chunk_size = self.index['chunk_size']
+        self.times = np.array([h['time'] for h in self.index['halftides']])
+
+    def __len__(self):
+        return len(self.index['halftides'])
+
+    def __getitem__(self, i):
+        return self.state(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.times[i], self.state(i)
+
+    def _particles(self, particles):
+        if particles is None:
+            return np.arange(self.Np_tracer)
+        return np.arange(self.Np_tracer)[particles]
+
+    def state(self, i, particles=None, fields=None):
+        """Arrays of the given fields (default all) of half-tide i for the given particles."""
+        entry = self.index['halftides'][i]
+        fields = entry['fields'] if fields is None else fields
+        ids = self._particles(particles)
+        chunks = np.unique(ids // self.chunk_size)
+        if particles is not None:
+            # position of each particle in the concatenated chunks
+            lengths = np.minimum(self.chunk_size, self.Np_tracer - chunks*self.chunk_size)
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            local = starts[np.searchsorted(chunks, ids // self.chunk_size)] + ids % self.chunk_size
+        out = {}
+        with np.load(os.path.join(self.path, entry['file'])) as data:
+            for name in fields:
+                values = np.concatenate([data[name + '_' + str(c)] for c in chunks])
+                out[name] = values if particles is None else values[local]
+        return out
+
+    def at_time(self, time, particles=None, fields=None):
+        """State of the half-tide whose time is closest to time."""
+        return self.state(int(np.argmin(np.abs(self.times - time))), particles, fields)
+
+    def history(self, particles=None, field='travel_times', start=None, stop=None):
+        """Array (half-tides, particles) of one field over half-tides start:stop."""
+        rows = range(len(self))[start:stop]
+        return np.stack([self.state(i, particles, [field])[field] for i in rows])
+
+    def to_walk_data(self, particles=None, start=None, stop=None):
+        """dorado walk_data of the stored half-tides, e.g. for dorado.routines plots."""
+        walk_data = {}
+        for f in _FIELDS:
+            walk_data[f] = self.history(particles, f, start, stop).T.tolist()
+        return walk_data
@@ -0,0 +1,55 @@
+"""Put the root modules and passive_particles on the path, as the notebooks and demos do."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'passive_particles')]
+
+import numpy as np
+import pytest
+from landlab import RasterModelGrid
+from landlab.components import TidalFlowCalculator
+from morphodynamics import DEFAULT_PARAMETERS, setup_marsh_grid
+
+
+def make_marsh():
+    """Small marsh set-up of TidalFlowErosion.ipynb: (grid, tfc), with closed nodata and high nodes."""
+    grid = RasterModelGrid((30, 40), xy_spacing=5.0)
+    z = grid.add_zeros('topographic__elevation', at='node')
+    z[:] = 1.5 - 0.1*grid.y_of_node/5.0
+    z[np.abs(grid.x_of_node - 100.0) < 12.0] -= 2.0  # channel
+    z[(grid.x_of_node < 30.0) & (grid.y_of_node > 100.0)] = 999  # nodata
+    z[(grid.x_of_node > 170.0) & (grid.y_of_node > 110.0)] = 2.0  # above high tide
+    setup_marsh_grid(grid, z)
+    p = DEFAULT_PARAMETERS
+    tfc = TidalFlowCalculator(grid, tidal_period=p['tidal_period'], tidal_range=p['tidal_range'],
+                              roughness='roughness', mean_sea_level=p['mean_sea_level'],
+                              min_water_depth=p['mwd'])
+    tfc.run_one_step()
+    return grid, tfc
+
+
+def make_channel(L=16, W=40):
+    """Raster fields (depth, topography, ex, ey) of a wet channel along the columns, dry banks."""
+    depth = np.full((L, W), 0.05)
+    depth[4:12, :] = 1.0 + 0.1*np.sin(np.arange(W))
+    ex = np.zeros((L, W))
+    ey = np.zeros((L, W))
+    ey[4:12, :] = 0.5
+    ex[4:12, :] = 0.05*np.cos(np.arange(8))[:, None]
+    return depth, -depth, ex, ey
+
+
+@pytest.fixture
+def marsh():
+    return make_marsh()
+
+
+@pytest.fixture
+def marsh_factory():
+    return make_marsh
+
+
+@pytest.fixture
+def channel():
+    return make_channel()
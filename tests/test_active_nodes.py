@@ -0,0 +1,53 @@
+"""Tests of the active node index and the active-node field updates."""
+import gc
+import numpy as np
+from landlab import RasterModelGrid
+import active_nodes
+import tidal_erosion_calculator as tec
+from derived_fields import DerivedFieldRegistry
+from morphodynamics import DEFAULT_PARAMETERS as P
+
+
+def test_index_does_not_keep_the_grid_alive():
+    grid = RasterModelGrid((10, 12))
+    grid.status_at_node[:12] = grid.BC_NODE_IS_CLOSED
+    gc.collect()
+    count = len(active_nodes._ACTIVE)
+    active = active_nodes.get_active_nodes(grid)
+    assert active.grid is grid
+    assert len(active_nodes._ACTIVE) == count + 1
+    del grid
+    gc.collect()
+    assert len(active_nodes._ACTIVE) == count
+    assert active.grid is None
+
+
+def full_erosion(grid, tfc):
+    """Erosion of the full (not active) in-place fields."""
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'], inplace=True)
+    return tec.totalsedimenterosion_mudsine(grid, P['mud_erodability'], P['tidal_range'], P['tcrgradeint']).copy()
+
+
+def test_plain_erosion_after_active_fields(marsh_factory):
+    expected = full_erosion(*marsh_factory())
+    grid, tfc = marsh_factory()
+    active = active_nodes.get_active_nodes(grid)
+    assert active.size < grid.number_of_nodes
+
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'], active=active)
+    tec.updategrids(grid, tfc, active=active)
+    E = tec.totalsedimenterosion_mudsine(grid, P['mud_erodability'], P['tidal_range'], P['tcrgradeint'])
+    assert np.isfinite(E).all()
+    np.testing.assert_array_equal(E, expected)
+
+
+def test_plain_erosion_after_active_registry(marsh_factory):
+    expected = full_erosion(*marsh_factory())
+    grid, tfc = marsh_factory()
+    fields = DerivedFieldRegistry(grid, tfc, P['tau_cr'], P['tau_crv'], active=True)
+    fields.require(*tec.EROSION_FIELDS)
+    fields.flow_solved()
+    fields.require(*tec.EROSION_FIELDS)
+    E = tec.totalsedimenterosion_mudsine(grid, P['mud_erodability'], P['tidal_range'], P['tcrgradeint'])
+    assert np.isfinite(E).all()
+    np.testing.assert_array_equal(E, expected)
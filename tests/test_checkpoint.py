@@ -0,0 +1,38 @@
+"""Checkpoint round trips of morphodynamics.ErosionModel."""
+import numpy as np
+import pytest
+from morphodynamics import ErosionModel
+from tidal_flow_solver import WarmStartTidalFlowCalculator
+
+SETUPS = {
+    'default': {},
+    'warm start': {'flow_calculator': WarmStartTidalFlowCalculator},
+    'lazy': {'lazy': True},
+    'active nodes': {'active_nodes': True},
+    'lazy active nodes': {'lazy': True, 'active_nodes': True},
+    'adaptive, skipped solves': {'params': {'max_bed_change': 0.002, 'morfac_max': 50,
+                                            'resolve_threshold': 1e-7}},
+}
+
+
+@pytest.mark.parametrize('setup', SETUPS.values(), ids=list(SETUPS))
+def test_restored_model_continues_bit_for_bit(marsh, tmp_path, setup):
+    setup = dict(setup)
+    params = setup.pop('params', {})
+    restore = {k: v for k, v in setup.items() if k in ('lazy', 'active_nodes')}
+    grid, _ = marsh
+    model = ErosionModel(grid, **setup, **params)
+    model.run(2)
+    fname = str(tmp_path / 'model.npz')
+    model.save_checkpoint(fname)
+    restored = ErosionModel.from_checkpoint(fname, **restore)
+    assert type(restored.tfc) is type(model.tfc)
+
+    for m in (model, restored):
+        m.run(3)
+    for name in ('topographic__elevation', 'mean_water__depth', 'erosion'):
+        np.testing.assert_array_equal(restored.grid.at_node[name], model.grid.at_node[name])
+    np.testing.assert_array_equal(restored.grid.at_link['ebb_tide_flow__velocity'],
+                                  model.grid.at_link['ebb_tide_flow__velocity'])
+    for name in ('step_count', 'time', 'morfac', 'flow_solves', 'skipped_solves'):
+        assert getattr(restored, name) == getattr(model, name)
@@ -0,0 +1,77 @@
+"""Tests of the binary sidecar cache of dem_cache.read_esri_ascii_cached."""
+import os
+import numpy as np
+import pytest
+from landlab.io import read_esri_ascii
+import dem_cache
+
+# the reference parses use read_esri_ascii, as dem_cache does
+pytestmark = pytest.mark.filterwarnings('ignore:landlab.io:DeprecationWarning')
+
+
+def write_asc(path, values, cellsize=5.0):
+    rows = '\n'.join(' '.join('%g' % v for v in row) for row in values)
+    with open(path, 'w') as f:
+        f.write('ncols %d\nnrows %d\nxllcorner 10\nyllcorner 20\ncellsize %g\nNODATA_value -9999\n%s\n'
+                % (values.shape[1], values.shape[0], cellsize, rows))
+
+
+@pytest.fixture
+def dem(tmp_path):
+    path = str(tmp_path / 'dem.asc')
+    write_asc(path, np.arange(12.0).reshape(3, 4))
+    return path
+
+
+def parse_forbidden(monkeypatch):
+    def fail(*args, **kwds):
+        raise AssertionError('the ASCII grid was parsed again')
+    monkeypatch.setattr(dem_cache, 'read_esri_ascii', fail)
+
+
+def assert_same_grid(cached, parsed):
+    (grid, values), (ref_grid, ref_values) = cached, parsed
+    assert grid.shape == ref_grid.shape
+    assert (grid.dx, grid.dy) == (ref_grid.dx, ref_grid.dy)
+    np.testing.assert_array_equal(grid.xy_of_lower_left, ref_grid.xy_of_lower_left)
+    np.testing.assert_array_equal(values, ref_values)
+    assert grid.at_node['topographic__elevation'] is values
+
+
+def test_second_read_uses_the_sidecar(dem, monkeypatch):
+    first = dem_cache.read_esri_ascii_cached(dem)
+    assert all(os.path.exists(p) for p in dem_cache._sidecar_paths(dem))
+    parse_forbidden(monkeypatch)
+    second = dem_cache.read_esri_ascii_cached(dem)
+    assert isinstance(second[1].base, np.memmap) or isinstance(second[1], np.memmap)
+    assert_same_grid(second, first)
+
+
+@pytest.mark.parametrize('change', ['size', 'mtime'])
+def test_changed_source_invalidates_the_sidecar(dem, change):
+    dem_cache.read_esri_ascii_cached(dem)
+    if change == 'size':
+        write_asc(dem, np.arange(20.0).reshape(4, 5))
+    else:
+        write_asc(dem, np.arange(12.0).reshape(3, 4)[::-1])  # same size, new values
+        st = os.stat(dem)
+        os.utime(dem, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert_same_grid(dem_cache.read_esri_ascii_cached(dem), read_esri_ascii(dem, name='topographic__elevation'))
+
+
+@pytest.mark.parametrize('damage', ['header', 'array', 'missing array'])
+def test_damaged_sidecar_falls_back_to_parsing(dem, damage):
+    dem_cache.read_esri_ascii_cached(dem)
+    header_path, array_path = dem_cache._sidecar_paths(dem)
+    if damage == 'header':
+        with open(header_path, 'w') as f:
+            f.write('{"version": 1, "sour')
+    elif damage == 'array':
+        with open(array_path, 'r+b') as f:
+            f.truncate(os.path.getsize(array_path) - 16)
+    else:
+        os.remove(array_path)
+    assert dem_cache.read_dem_cache(dem) is None
+    assert_same_grid(dem_cache.read_esri_ascii_cached(dem), read_esri_ascii(dem, name='topographic__elevation'))
+    # the sidecar is rewritten by the fallback
+    assert dem_cache.read_dem_cache(dem) is not None
@@ -0,0 +1,67 @@
+"""Tests of the tidally averaged erosion of tec.totalsedimenterosion_mudsine_cycles."""
+import numpy as np
+import pytest
+import tidal_erosion_calculator as tec
+from morphodynamics import DEFAULT_PARAMETERS as P
+
+
+def phase_loop(grid, mud_erodability, nsub, cycle_scale):
+    """Average of the baseline erosion expression over an explicit phase loop."""
+    taucr = grid.at_node['tau_cr_node']
+    upeak = grid.at_node['flood_tide_flow__velocity_node']
+    rough = grid.at_node['roughness_node']
+    h = grid.at_node['mean_water__depth']
+    E = np.zeros(taucr.size)
+    for scale in cycle_scale:
+        for k in range(nsub):
+            utide = upeak*np.pi/2*np.sin((k + 0.5)*np.pi/nsub)*scale
+            tauC = 1025*9.81*rough**2*utide**2*h**(-1/3)
+            E += mud_erodability*(np.sqrt(1 + (tauC/taucr)**2) - 1)
+    return E/(nsub*len(cycle_scale))
+
+
+@pytest.fixture
+def populated(marsh):
+    grid, tfc = marsh
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'], inplace=True)
+    return grid
+
+
+@pytest.mark.parametrize('cycle_scale', [None, [1.0, 0.6, 1.3, 0.6]])
+def test_cycles_match_an_explicit_phase_loop(populated, cycle_scale):
+    grid = populated
+    wet = grid.at_node['mean_water__depth'] > 0
+    assert wet.any()
+    E = tec.totalsedimenterosion_mudsine_cycles(grid, P['mud_erodability'], P['tidal_range'],
+                                                P['tcrgradeint'], nsub=7, cycle_scale=cycle_scale)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = phase_loop(grid, P['mud_erodability'], 7, [1.0] if cycle_scale is None else cycle_scale)
+    np.testing.assert_allclose(E[wet], expected[wet], rtol=1e-12, atol=0)
+
+
+def test_single_phase_is_the_peak_erosion(populated):
+    grid = populated
+    args = (grid, P['mud_erodability'], P['tidal_range'], P['tcrgradeint'])
+    peak = tec.totalsedimenterosion_mudsine(*args).copy()
+    np.testing.assert_allclose(tec.totalsedimenterosion_mudsine_cycles(*args, nsub=1), peak, rtol=1e-12)
+
+
+def test_dry_nodes_do_not_erode(populated):
+    grid = populated
+    h = grid.at_node['mean_water__depth']
+    dry = np.zeros(h.size, dtype=bool)
+    dry[grid.core_nodes[::5]] = True
+    h[dry] = 0.0
+    E = tec.totalsedimenterosion_mudsine_cycles(grid, P['mud_erodability'], P['tidal_range'],
+                                                P['tcrgradeint'], nsub=5, cycle_scale=[1.0, 0.5])
+    assert np.isfinite(E).all()
+    np.testing.assert_array_equal(E[dry], 0.0)
+    raised = tec.totalsedimenterosion_mudsine_cycles(grid, P['mud_erodability'], P['tidal_range'],
+                                                     P['tcrgradeint'], nsub=5, min_depth=0.1)
+    assert np.isfinite(raised).all()
+
+
+def test_cycle_scale_is_checked(populated):
+    with pytest.raises(ValueError):
+        tec.totalsedimenterosion_mudsine_cycles(populated, P['mud_erodability'], P['tidal_range'],
+                                                P['tcrgradeint'], cycle_scale=[])
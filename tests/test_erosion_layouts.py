@@ -0,0 +1,25 @@
+"""Tests of the link and cell layouts of tec.totalsedimenterosion_mudsine_link."""
+import numpy as np
+import tidal_erosion_calculator as tec
+from erosion_kernel import RHO_G
+from morphodynamics import DEFAULT_PARAMETERS as P
+
+
+def test_link_and_cell_layouts_after_eager_populate(marsh):
+    grid, tfc = marsh
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'])
+    E_cell = tec.totalsedimenterosion_mudsine_link(grid, P['mud_erodability'], at='cell').copy()
+    E_link = tec.totalsedimenterosion_mudsine_link(grid, P['mud_erodability'], at='link').copy()
+    assert np.isfinite(E_cell).all()
+    assert np.isfinite(E_link).all()
+
+    # the link layout uses the thresholds of the vegetation, as the cell layout does
+    taucr = np.where(grid.at_link['veg_atlink'] == 1, P['tau_crv'], P['tau_cr'])
+    utide = grid.at_link['flood_tide_flow__velocity']*np.pi/2
+    tau = RHO_G*grid.at_link['roughness']**2*utide**2*grid.at_link['water_depth_at_link']**(-1/3)
+    np.testing.assert_allclose(E_link, P['mud_erodability']*(np.sqrt(1 + (tau/taucr)**2) - 1), rtol=1e-12)
+
+    # and both match the in-place populateGrids
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'], inplace=True)
+    np.testing.assert_array_equal(tec.totalsedimenterosion_mudsine_link(grid, P['mud_erodability'], at='cell'), E_cell)
+    np.testing.assert_array_equal(tec.totalsedimenterosion_mudsine_link(grid, P['mud_erodability'], at='link'), E_link)
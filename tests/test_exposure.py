@@ -0,0 +1,98 @@
+"""Tests of the buffered exposure maps of exposure.ExposureMaps against direct accumulation."""
+import numpy as np
+from dorado import particle_track as pt
+from exposure import ExposureMaps
+from particle_engine import ParticleEngine, default_cell_type, edge_cells
+from walk_io import trim_walk_data
+
+
+class RecordedMaps(ExposureMaps):
+    """ExposureMaps keeping a copy of every batch of steps."""
+
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        self.steps = []
+
+    def add_steps(self, cell, new_cell, dt, travel_time):
+        self.steps.append(tuple(np.array(a) for a in (cell, new_cell, dt, travel_time)))
+        super().add_steps(cell, new_cell, dt, travel_time)
+
+
+def direct_maps(shape, edge, cell, new_cell, dt, travel_time):
+    """The maps of ExposureMaps accumulated step by step with np.add.at."""
+    size = shape[0]*shape[1]
+    visits = np.zeros(size, dtype=np.int64)
+    time_spent = np.zeros(size)
+    arrival = np.zeros(size)
+    exits = np.zeros(size, dtype=np.int64)
+    first_exit = np.full(size, np.inf)
+    np.add.at(visits, new_cell, 1)
+    np.add.at(time_spent, cell, dt)
+    np.add.at(arrival, new_cell, travel_time)
+    out = edge[new_cell] & ~edge[cell]
+    np.add.at(exits, new_cell[out], 1)
+    np.minimum.at(first_exit, new_cell[out], travel_time[out])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        visited = np.where(visits > 0, visits, np.nan)
+        maps = {'visits': visits, 'time_spent': time_spent,
+                'mean_residence_time': time_spent/visited, 'mean_travel_time': arrival/visited,
+                'exits': exits, 'first_exit_time': np.where(np.isinf(first_exit), np.nan, first_exit)}
+    return {name: values.reshape(shape) for name, values in maps.items()}
+
+
+def assert_same_maps(maps, expected):
+    assert maps.keys() == expected.keys()
+    for name in ('visits', 'exits'):
+        np.testing.assert_array_equal(maps[name], expected[name])
+    for name in ('time_spent', 'mean_residence_time', 'mean_travel_time', 'first_exit_time'):
+        np.testing.assert_allclose(maps[name], expected[name], rtol=1e-12, equal_nan=True)
+
+
+def test_engine_maps_match_direct_accumulation(channel):
+    depth, topography, ex, ey = channel
+    engine = ParticleEngine(depth, topography, ex, ey, 10.0, seed=2)
+    engine.seed([6, 8, 10], [3, 20], 300)
+    exposure = engine.track_exposure(RecordedMaps(depth.shape))
+    engine.run_tides(600, 3)
+    steps = [np.concatenate(a) for a in zip(*exposure.steps)]
+    assert len(exposure.steps) > 10 and exposure.exits.sum() > 0
+    assert_same_maps(exposure.maps(), direct_maps(depth.shape, exposure.edge, *steps))
+    assert exposure.maps()['visits'].sum() == engine.steps
+
+
+def test_walk_data_maps_with_trimming(channel):
+    depth, topography, ex, ey = channel
+    edge = edge_cells(default_cell_type(depth))
+
+    def route(exposure=None):
+        params = pt.modelParams()
+        params.depth = depth.copy()
+        params.topography = topography.copy()
+        params.u = ex.copy()
+        params.v = ey.copy()
+        params.dx = 10.0
+        particles = pt.Particles(params)
+        np.random.seed(7)
+        particles.generate_particles(60, [6, 8, 10], [3, 20])
+        for target_time in (20.0, 40.0, 80.0):
+            walk_data = particles.run_iteration(target_time=target_time)
+            if exposure is not None:
+                exposure.add_walk_data(walk_data)
+                trim_walk_data(walk_data)
+                exposure.rebase(walk_data)
+        return walk_data
+
+    exposure = ExposureMaps(depth.shape, edge=edge)
+    route(exposure)
+    walk_data = route()  # the same walks, untrimmed
+    W = depth.shape[1]
+    cell, new_cell, dt, travel_time = [], [], [], []
+    for x, y, t in zip(walk_data['xinds'], walk_data['yinds'], walk_data['travel_times']):
+        flat = np.asarray(x)*W + np.asarray(y)
+        cell.append(flat[:-1])
+        new_cell.append(flat[1:])
+        dt.append(np.diff(t))
+        travel_time.append(np.asarray(t[1:], dtype=float))
+    steps = [np.concatenate(a) for a in (cell, new_cell, dt, travel_time)]
+    assert steps[0].size > 60
+    assert_same_maps(exposure.maps(), direct_maps(depth.shape, edge.ravel(), *steps))
@@ -0,0 +1,68 @@
+"""Tests of the on-disk roughness field and flow cache of field_cache."""
+import os
+import numpy as np
+from ensemble import realization_grid
+from field_cache import FieldCache, cache_key
+
+SMALL = {'nrows': 12, 'ncols': 14, 'grid_spacing': 1.0}
+
+
+def arrays(seed, size=50):
+    rng = np.random.default_rng(seed)
+    return rng.random(size) > 0.5, rng.random(size), rng.random(size)
+
+
+def test_round_trip(tmp_path):
+    cache = FieldCache(str(tmp_path))
+    assert cache.get({'seed': 1}) is None
+    rough, velocity, depth = arrays(1)
+    cache.put({'seed': 1, 'len_scale': 3}, rough, velocity, depth)
+    entry = cache.get({'len_scale': 3, 'seed': 1})
+    np.testing.assert_array_equal(entry['rough'], rough)
+    np.testing.assert_array_equal(entry['ebb_tide_flow__velocity'], velocity)
+    np.testing.assert_array_equal(entry['mean_water__depth'], depth)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = FieldCache(str(tmp_path), max_bytes=10**9)
+    for seed in range(3):
+        cache.put({'seed': seed}, *arrays(seed, 2000))
+        fname = cache._fname({'seed': seed})
+        os.utime(fname, ns=(10**18 + seed*10**9,)*2)  # put order, a second apart
+    cache.get({'seed': 0})  # refreshes the oldest entry
+    entry_size = cache.entries()[0][1]
+    cache.max_bytes = 3*entry_size + entry_size//2
+    cache.put({'seed': 3}, *arrays(3, 2000))
+    kept = [seed for seed in range(4) if os.path.exists(cache._fname({'seed': seed}))]
+    assert kept == [0, 2, 3]
+    assert cache.size() <= cache.max_bytes
+
+
+def test_key_collision_is_a_miss(tmp_path):
+    cache = FieldCache(str(tmp_path))
+    cache.put({'seed': 1}, *arrays(1))
+    # an entry of other parameters stored under the name of {'seed': 2}
+    os.replace(cache._fname({'seed': 1}), cache._fname({'seed': 2}))
+    assert cache.get({'seed': 2}) is None
+    assert cache.misses == 1 and cache.hits == 0
+
+
+def test_changed_inputs_miss_the_cache(tmp_path):
+    cache = FieldCache(str(tmp_path))
+    grid, rough = realization_grid(4, 3.0, SMALL, cache)
+    cached, cached_rough = realization_grid(4, 3.0, SMALL, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(cached_rough, rough)
+    np.testing.assert_array_equal(cached.at_link['ebb_tide_flow__velocity'],
+                                  grid.at_link['ebb_tide_flow__velocity'])
+    for seed, len_scale, config in ((5, 3.0, SMALL), (4, 4.0, SMALL),
+                                    (4, 3.0, dict(SMALL, roughness_high=0.2)),
+                                    (4, 3.0, dict(SMALL, tidal_range=0.6))):
+        realization_grid(seed, len_scale, config, cache)
+    assert (cache.hits, cache.misses) == (1, 5)
+    assert len(cache.entries()) == 5
+    # the particle routing settings are not part of the key
+    realization_grid(4, 3.0, dict(SMALL, Np_tracer=10, n_tide_periods=2), cache)
+    assert (cache.hits, cache.misses) == (2, 5)
+    assert cache_key({'a': 1, 'b': 2}) == cache_key({'b': 2, 'a': 1})
@@ -0,0 +1,58 @@
+"""Agreement of tidal_flow_solver.WarmStartTidalFlowCalculator with landlab's TidalFlowCalculator."""
+import numpy as np
+import pytest
+from landlab.components import TidalFlowCalculator
+from morphodynamics import DEFAULT_PARAMETERS as P
+from tidal_flow_solver import WarmStartTidalFlowCalculator
+
+OUTPUTS = (('link', 'ebb_tide_flow__velocity'), ('node', 'mean_water__depth'))
+
+
+def flow_calculator(grid, cls, **kwds):
+    return cls(grid, tidal_period=P['tidal_period'], tidal_range=P['tidal_range'], roughness='roughness',
+               mean_sea_level=P['mean_sea_level'], min_water_depth=P['mwd'], **kwds)
+
+
+def assert_same_flow(grid, reference):
+    for at, name in OUTPUTS:
+        values = getattr(grid, 'at_' + at)[name]
+        expected = getattr(reference, 'at_' + at)[name]
+        np.testing.assert_allclose(values, expected, rtol=0, atol=1e-9*np.abs(expected).max())
+
+
+def solve_twice(grid, tfc):
+    """The first solve and one after lowering the channel bed (a warm-started solve)."""
+    tfc.run_one_step()
+    yield
+    z = grid.at_node['topographic__elevation']
+    z[grid.core_nodes] -= 0.01*np.sin(grid.x_of_node[grid.core_nodes]/20.0)**2
+    tfc.run_one_step()
+    yield
+
+
+@pytest.mark.parametrize('kwds', [{'solver': 'cg'}, {'solver': 'bicgstab'}, {'solver': 'gmres'},
+                                  {'solver': 'direct'}, {'solver': 'cg', 'preconditioner': 'jacobi'},
+                                  {'solver': 'cg', 'preconditioner': None}],
+                         ids=['cg', 'bicgstab', 'gmres', 'direct', 'cg jacobi', 'cg unpreconditioned'])
+def test_solvers_match_landlab(marsh_factory, kwds):
+    grid, _ = marsh_factory()
+    reference, _ = marsh_factory()
+    tfc = flow_calculator(grid, WarmStartTidalFlowCalculator, **kwds)
+    reference_steps = solve_twice(reference, flow_calculator(reference, TidalFlowCalculator))
+    for _ in zip(solve_twice(grid, tfc), reference_steps):
+        assert_same_flow(grid, reference)
+    # the iterative solves converged, without the direct fallback
+    assert tfc.direct_solves == 0
+    assert (tfc.last_iterations > 0) == (kwds['solver'] != 'direct')
+
+
+@pytest.mark.parametrize('coarsen', [(2,), (4, 2), (3,)], ids=['2', '4,2', '3'])
+def test_coarse_to_fine_start_matches_landlab(marsh_factory, coarsen):
+    grid, _ = marsh_factory()
+    reference, _ = marsh_factory()
+    tfc = flow_calculator(grid, WarmStartTidalFlowCalculator, solver='cg', coarsen=coarsen)
+    reference_steps = solve_twice(reference, flow_calculator(reference, TidalFlowCalculator))
+    for _ in zip(solve_twice(grid, tfc), reference_steps):
+        assert_same_flow(grid, reference)
+    assert len(tfc.coarse_iterations) == len(coarsen)
+    assert tfc.direct_solves == 0
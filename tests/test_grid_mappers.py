@@ -0,0 +1,40 @@
+"""Tests of the precompiled mappers of grid_mappers."""
+import numpy as np
+import pytest
+from landlab import RasterModelGrid
+from active_nodes import get_active_nodes
+from grid_mappers import get_mappers
+
+
+@pytest.fixture
+def grid():
+    grid = RasterModelGrid((5, 6))
+    grid.status_at_node[[7, 8]] = grid.BC_NODE_IS_CLOSED
+    return grid
+
+
+def test_mappers_match_landlab(grid):
+    m = get_mappers(grid)
+    at_node = np.sin(np.arange(grid.number_of_nodes))
+    at_link = np.cos(np.arange(grid.number_of_links))
+    np.testing.assert_array_equal(m.node_to_cell(at_node), grid.map_node_to_cell(at_node))
+    np.testing.assert_array_equal(m.min_of_node_links_to_node(at_link),
+                                  grid.map_min_of_node_links_to_node(at_link))
+    np.testing.assert_array_equal(m.mean_of_link_nodes_to_link(at_node),
+                                  grid.map_mean_of_link_nodes_to_link(at_node))
+
+
+def test_wrong_sizes_raise_instead_of_clipping(grid):
+    m = get_mappers(grid)
+    short_node = np.ones(grid.number_of_nodes - 1)
+    with pytest.raises(ValueError):
+        m.node_to_cell(short_node)
+    with pytest.raises(ValueError):
+        m.mean_of_link_nodes_to_link(short_node)
+    with pytest.raises(ValueError):
+        get_active_nodes(grid).pack(short_node)
+    for values in (np.ones(grid.number_of_links - 1), np.ones(1)):
+        with pytest.raises(ValueError):
+            m.min_of_node_links_to_node(values)
+        with pytest.raises(ValueError):
+            m.min_of_node_links_to_cell(values)
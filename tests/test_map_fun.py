@@ -0,0 +1,93 @@
+"""Tests of the shared velocity products of map_fun."""
+import gc
+import tracemalloc
+import numpy as np
+from landlab import RasterModelGrid
+import map_fun as mf
+
+
+def flow_grid():
+    grid = RasterModelGrid((20, 30))
+    grid.add_zeros('topographic__elevation', at='node')
+    grid.add_ones('mean_water__depth', at='node')
+    velocity = grid.add_zeros('ebb_tide_flow__velocity', at='link')
+    velocity[:] = np.sin(np.arange(velocity.size))
+    return grid
+
+
+def test_products_do_not_keep_the_grid_alive():
+    gc.collect()
+    grid = flow_grid()
+    mf.gridded_vars(grid)
+    mf.compact_gridded_vars(grid)
+    mf.velocity_products(grid).quiver(3, 'flood')
+    assert len(mf._PRODUCTS) == 1
+    del grid
+    gc.collect()
+    assert len(mf._PRODUCTS) == 0
+
+
+def test_products_follow_the_velocity_field():
+    grid = flow_grid()
+    products = mf.velocity_products(grid)
+    assert mf.velocity_products(grid) is products
+    expected = mf.map_velocity_components_to_nodes(grid)
+    for cached, values in zip(products.components(), expected):
+        np.testing.assert_array_equal(cached, values)
+    grid.at_link['ebb_tide_flow__velocity'][5] += 1.0
+    assert mf.velocity_products(grid) is products
+    mf.invalidate_velocity_products(grid)
+    products = mf.velocity_products(grid)
+    np.testing.assert_array_equal(products.ebb_x, mf.map_velocity_components_to_nodes(grid)[0])
+    grid.add_ones('ebb_tide_flow__velocity', at='link', clobber=True)
+    assert mf.velocity_products(grid) is not products
+
+
+def test_flow_updates_invalidate_products(marsh):
+    import tidal_erosion_calculator as tec
+    from derived_fields import DerivedFieldRegistry
+    grid, tfc = marsh
+    products = mf.velocity_products(grid)
+    tec.updategrids(grid, tfc)
+    assert mf.velocity_products(grid) is not products
+    products = mf.velocity_products(grid)
+    DerivedFieldRegistry(grid, tfc, 0.2, 0.5).flow_solved()
+    assert mf.velocity_products(grid) is not products
+
+
+def test_gridded_vars_do_not_use_the_shared_products():
+    grid = flow_grid()
+    gvals = mf.gridded_vars(grid)
+    assert grid not in mf._PRODUCTS
+    gvals.ex[0, 0] = 10.0
+    assert gvals.ex.flags.writeable
+
+
+def retained_bytes(make, grid):
+    """Bytes still allocated while the object made from grid is alive."""
+    mf.map_velocity_components_to_nodes(grid)  # landlab caches its link/node connectivity
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = make(grid)
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0], obj
+    finally:
+        tracemalloc.stop()
+
+
+def test_compact_gridded_vars_retain_only_the_ebb_components():
+    grid = flow_grid()
+    nodes = grid.number_of_nodes
+    slack = 4096
+    full, _ = retained_bytes(mf.gridded_vars, grid)
+    compact, _ = retained_bytes(mf.compact_gridded_vars, grid)
+    single, gvals = retained_bytes(lambda g: mf.compact_gridded_vars(g, np.float32), grid)
+    assert full <= 4*nodes*8 + slack
+    assert compact <= 2*nodes*8 + slack
+    assert single <= 2*nodes*4 + slack
+    assert grid not in mf._PRODUCTS
+    assert gvals.ex.dtype == np.float32
+    assert np.shares_memory(gvals.elev, grid.at_node['topographic__elevation'])
+    assert gvals.fx is gvals.fx
+    np.testing.assert_array_equal(gvals.fy, -gvals.ey)
@@ -0,0 +1,106 @@
+"""ErosionModel morfac, adaptive steps and skipped flow solves against an explicit erosion loop."""
+import numpy as np
+import pytest
+import tidal_erosion_calculator as tec
+from morphodynamics import DEFAULT_PARAMETERS, RESOLVE_TILE_ROWS, ErosionModel
+from tiling import row_tiles
+
+
+def eager_loop(grid, tfc, nsteps, **params):
+    """The erode -> run_one_step -> updategrids loop of TidalFlowErosion.ipynb, with the
+    morfac, adaptive step and skipped solve rules written out; returns (morfacs, solves)."""
+    p = dict(DEFAULT_PARAMETERS, **params)
+    tec.populateGrids(grid, tfc, p['tau_cr'], p['tau_crv'], grid.at_link['veg_atlink'])
+    z = grid.at_node['topographic__elevation']
+    z_solved = z.copy()
+    core = grid.status_at_node == grid.BC_NODE_IS_CORE
+    tiles = row_tiles(grid, RESOLVE_TILE_ROWS)
+    morfac = p['morfac']
+    morfacs, solves = [], 0
+    for _ in range(nsteps):
+        ero = tec.totalsedimenterosion_mudsine(grid, p['mud_erodability'], p['tidal_range'], p['tcrgradeint'])
+        ero *= p['tidal_period']/2 * 1/2650
+        if p['max_bed_change'] is not None:
+            relative = np.max(np.abs(ero) / (grid.at_node['mean_water__depth'] + p['tidal_range']/2))
+            limit = min(morfac*p['morfac_growth'], p['morfac_max'])
+            if relative > 0:
+                limit = min(limit, p['max_bed_change']/relative)
+            morfac = max(limit, p['morfac_min'])
+        if morfac != 1.0:
+            ero *= morfac
+        z -= ero
+        morfacs.append(morfac)
+
+        change = np.abs(z - z_solved)*core
+        if p['resolve_scope'] == 'global':
+            mean_change = change.sum()/core.sum()
+        else:
+            mean_change = max(change[t].sum()/max(core[t].sum(), 1) for t in tiles)
+        if p['resolve_threshold'] is None or mean_change > p['resolve_threshold']:
+            tfc.run_one_step()
+            tec.updategrids(grid, tfc)
+            z_solved[:] = z
+            solves += 1
+    return morfacs, solves
+
+
+def run_model(grid, nsteps, **params):
+    morfacs = []
+    model = ErosionModel(grid, inplace=False, **params)
+    model.run(nsteps, callback=lambda m, ero: morfacs.append(m.morfac))
+    return model, morfacs
+
+
+CASES = {
+    'morfac': {'morfac': 20.0},
+    'adaptive': {'max_bed_change': 0.001, 'morfac_max': 200.0, 'morfac_growth': 1.5},
+    'adaptive capped': {'max_bed_change': 0.001, 'morfac_min': 80.0, 'morfac_max': 100.0},
+    'skip global': {'morfac': 20.0, 'resolve_threshold': 2e-7, 'resolve_scope': 'global'},
+    'skip tile': {'morfac': 20.0, 'resolve_threshold': 2e-7, 'resolve_scope': 'tile'},
+}
+
+
+@pytest.mark.parametrize('params', CASES.values(), ids=list(CASES))
+def test_model_matches_the_explicit_loop(marsh_factory, params):
+    nsteps = 6
+    grid, _ = marsh_factory()
+    model, morfacs = run_model(grid, nsteps, **params)
+    reference, tfc = marsh_factory()
+    expected_morfacs, solves = eager_loop(reference, tfc, nsteps, **params)
+
+    np.testing.assert_array_equal(morfacs, expected_morfacs)
+    assert model.flow_solves == solves
+    assert model.skipped_solves == nsteps - solves
+    assert model.time == pytest.approx(sum(expected_morfacs)*DEFAULT_PARAMETERS['tidal_period']/2, rel=1e-12)
+    np.testing.assert_allclose(grid.at_node['topographic__elevation'],
+                               reference.at_node['topographic__elevation'], rtol=0, atol=1e-12)
+    np.testing.assert_allclose(grid.at_link['ebb_tide_flow__velocity'],
+                               reference.at_link['ebb_tide_flow__velocity'], rtol=0, atol=1e-12)
+
+
+def test_rules_are_exercised(marsh_factory):
+    grid, _ = marsh_factory()
+    _, morfacs = run_model(grid, 6, **CASES['adaptive'])
+    # limited by the bed change at first, then by the growth factor
+    assert morfacs[0] < 200.0 and len(set(morfacs)) > 2
+    assert all(b <= 1.5*a*(1 + 1e-12) for a, b in zip(morfacs, morfacs[1:]))
+    grid, _ = marsh_factory()
+    model, morfacs = run_model(grid, 6, **CASES['adaptive capped'])
+    assert all(80.0 <= m <= 100.0 for m in morfacs)
+    solves = []
+    for case in ('skip global', 'skip tile'):
+        grid, _ = marsh_factory()
+        model, _ = run_model(grid, 6, **CASES[case])
+        solves.append(model.flow_solves)
+    # a single tile over the threshold triggers a solve before the global mean does
+    assert 0 < solves[0] < solves[1] < 6
+
+
+def test_run_until_ends_at_the_end_time(marsh_factory):
+    grid, _ = marsh_factory()
+    model = ErosionModel(grid, morfac=20.0)
+    half_tide = DEFAULT_PARAMETERS['tidal_period']/2
+    steps = model.run_until(50.5*half_tide)
+    assert steps == 3
+    assert model.time == pytest.approx(50.5*half_tide, rel=1e-12)
+    assert model.morfac == pytest.approx(10.5)
@@ -0,0 +1,68 @@
+"""Tests of the vectorized particle routing of particle_engine against dorado."""
+import numpy as np
+import pytest
+from dorado import particle_track as pt
+import particle_engine as pe
+
+DX = 10.0
+
+
+def dorado_particles(depth, topography, ex, ey):
+    """dorado Particles on the fields, with the velocities as particletransport passes them."""
+    params = pt.modelParams()
+    params.depth = depth.copy()
+    params.topography = topography.copy()
+    params.u = ex.copy()  # dorado modifies u and v in place
+    params.v = ey.copy()
+    params.dx = DX
+    return pt.Particles(params)
+
+
+def weight_table(engine, tide):
+    """Per-cell D8 weights of the engine, undoing the cumulative sum."""
+    return np.diff(engine._cum_weights[tide], axis=1, prepend=0)
+
+
+@pytest.mark.parametrize('tide, sign', [(pe.EBB, 1), (pe.FLOOD, -1)])
+def test_weight_tables_match_dorado(channel, tide, sign):
+    depth, topography, ex, ey = channel
+    engine = pe.ParticleEngine(depth, topography, ex, ey, DX)
+    expected = dorado_particles(depth, topography, sign*ex, sign*ey).weight
+    expected = np.nan_to_num(expected).reshape(-1, 9)
+    np.testing.assert_allclose(weight_table(engine, tide), expected, rtol=0, atol=1e-12)
+
+
+def test_weight_table_of_a_uniform_channel():
+    depth = np.ones((5, 5))
+    engine = pe.ParticleEngine(depth, -depth, np.zeros((5, 5)), np.ones((5, 5)), DX, gamma=0.0)
+    # flat water surface and ey > 0 (northwards, row 0 is the top of gridded_vars): the
+    # discharge projected on N is 1 and on NW, NE 1/sqrt(2)/sqrt(2) per unit distance
+    tables = [weight_table(engine, tide).reshape(5, 5, 9) for tide in (pe.EBB, pe.FLOOD)]
+    np.testing.assert_allclose(tables[0][2, 2], [0.25, 0.5, 0.25, 0, 0, 0, 0, 0, 0])
+    np.testing.assert_allclose(tables[1][2, 2], [0, 0, 0, 0, 0, 0, 0.25, 0.5, 0.25])
+    # border cells do not route
+    for table in tables:
+        assert not table[[0, -1]].any() and not table[:, [0, -1]].any()
+
+
+def test_walk_statistics_match_dorado(channel):
+    depth, topography, ex, ey = channel
+    n, target_time = 2000, 60.0
+    np.random.seed(3)
+    particles = dorado_particles(depth, topography, ex, ey)
+    particles.generate_particles(n, [8], [3], method='exact')
+    walk = particles.run_iteration(target_time=target_time)
+    x = np.array([w[-1] for w in walk['xinds']])
+    y = np.array([w[-1] for w in walk['yinds']])
+    t = np.array([w[-1] for w in walk['travel_times']])
+    # dorado walks also hold the start position, so they are one longer than the steps taken
+    steps = np.array([len(w) for w in walk['xinds']]) - 1
+
+    engine = pe.ParticleEngine(depth, topography, ex, ey, DX, seed=3)
+    engine.seed([8], [3], n, method='exact')
+    engine.run_until(target_time)
+
+    for ours, theirs in ((engine.x, x), (engine.y, y), (engine.travel_time, t)):
+        sem = np.sqrt((np.var(ours) + np.var(theirs))/n)
+        assert abs(np.mean(ours) - np.mean(theirs)) < 4*sem + 1e-9
+    assert abs(engine.steps/n - steps.mean()) < 0.2
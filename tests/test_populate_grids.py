@@ -0,0 +1,16 @@
+"""Tests of the eager and in-place modes of tec.populateGrids."""
+import numpy as np
+import tidal_erosion_calculator as tec
+from morphodynamics import DEFAULT_PARAMETERS as P
+
+
+def test_inplace_matches_eager(marsh):
+    grid, tfc = marsh
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'])
+    eager = {(at, name): getattr(grid, 'at_' + at)[name].copy()
+             for at in ('node', 'link', 'cell') for name in getattr(grid, 'at_' + at)}
+    tec.populateGrids(grid, tfc, P['tau_cr'], P['tau_crv'], grid.at_link['veg_atlink'], inplace=True)
+    for (at, name), values in eager.items():
+        np.testing.assert_array_equal(getattr(grid, 'at_' + at)[name], values, err_msg=name)
+    taucr = grid.at_link['tau_cr']
+    assert set(np.unique(taucr)) == {P['tau_cr'], P['tau_crv']}
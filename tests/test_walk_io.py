@@ -0,0 +1,78 @@
+"""Round trips of the streamed particle walks of walk_io."""
+import os
+from types import SimpleNamespace
+import numpy as np
+from dorado import particle_track as pt
+from particletransport import tidal_particles
+from walk_io import WalkReader, WalkWriter, last_state, trim_walk_data
+
+
+def channel_params(channel, Np_tracer=50):
+    """The params of particletransport.init_particles, without dorado's params class."""
+    depth, topography, ex, ey = channel
+    return SimpleNamespace(seed_xloc=[8, 9], seed_yloc=[3, 4], Np_tracer=Np_tracer, dx=10.0,
+                           depth=depth, topography=topography, u=ex, v=ey, ex=ex, ey=ey)
+
+
+def test_native_run_round_trip(channel, tmp_path):
+    out = str(tmp_path / 'walk')
+    snapshots = []
+    walk_data = tidal_particles(channel_params(channel), 600, 2, native=True, seed=4, out_dir=out,
+                                render=None, snapshots=snapshots)
+    reader = WalkReader(out)
+    assert len(reader) == len(snapshots) == 4
+    np.testing.assert_allclose(reader.times, [300, 600, 900, 1200])
+    for (time, state), (snap_time, x, y) in zip(reader, snapshots):
+        assert time == snap_time
+        np.testing.assert_array_equal(state['xinds'], x)
+        np.testing.assert_array_equal(state['yinds'], y)
+    final = reader[-1]
+    for name, values in zip(('xinds', 'yinds', 'travel_times'), last_state(walk_data)):
+        np.testing.assert_array_equal(final[name], values)
+    assert 'exit_time' in final
+    # every half-tide file is in the index and no temporary file is left behind
+    files = sorted(os.listdir(out))
+    assert files == sorted(['index.json'] + [h['file'] for h in reader.index['halftides']])
+
+
+def test_chunked_particle_selection(tmp_path):
+    rng = np.random.default_rng(0)
+    writer = WalkWriter(str(tmp_path), chunk_size=7, compress=False)
+    states = []
+    for i in range(3):
+        state = (rng.integers(0, 50, 23), rng.integers(0, 50, 23), rng.random(23))
+        states.append(state)
+        writer.write(*state, time=10.0*i)
+        # the index is rewritten (atomically) after every half-tide
+        assert len(WalkReader(str(tmp_path))) == i + 1
+    reader = WalkReader(str(tmp_path))
+    pick = np.array([22, 0, 8, 7, 15])
+    np.testing.assert_array_equal(reader.state(1, particles=pick)['xinds'], states[1][0][pick])
+    np.testing.assert_array_equal(reader.at_time(19.0, particles=slice(5, 9))['yinds'], states[2][1][5:9])
+    np.testing.assert_array_equal(reader.history(pick, start=1), np.stack([s[2][pick] for s in states[1:]]))
+    walk_data = reader.to_walk_data(particles=[3])
+    assert walk_data['xinds'] == [[s[0][3] for s in states]]
+
+
+def test_trimmed_walk_data_continue_unchanged(channel):
+    depth, topography, ex, ey = channel
+
+    def route(trim):
+        params = pt.modelParams()
+        params.depth = depth.copy()
+        params.topography = topography.copy()
+        params.u = ex.copy()
+        params.v = ey.copy()
+        params.dx = 10.0
+        particles = pt.Particles(params)
+        np.random.seed(5)
+        particles.generate_particles(40, [8, 9], [3, 4])
+        walk_data = particles.run_iteration(target_time=30.0)
+        assert max(len(w) for w in walk_data['travel_times']) > 2
+        if trim:
+            trim_walk_data(walk_data)  # the walk_data of particles, trimmed in place
+            assert all(len(w) <= 2 for w in walk_data['travel_times'])
+        return particles.run_iteration(target_time=60.0)  # continues from particles.walk_data
+
+    for full, trimmed in zip(last_state(route(False)), last_state(route(True))):
+        np.testing.assert_array_equal(full, trimmed)
@@ -2,7 +2,8 @@
 Total sediment erosion (assumes limitless supply)
 Based on totalsedimenterosionmudsine.m by Giulio Mariotti 
 Includes some code based on G. Tucker tidal_flow_calculator.py in landlab component
-Does not incorporate averaging over multiple tidal cycles or linear increase in critical shear stress with depth
+Averaging over multiple tidal cycles is done by totalsedimenterosion_mudsine_cycles
+Does not incorporate linear increase in critical shear stress with depth
 """
 
 # imports
@@ -12,6 +13,15 @@ from landlab import RasterModelGrid, imshow_grid
 from landlab.components import TidalFlowCalculator
 from landlab.io import read_esri_ascii
 from landlab.grid.mappers import map_mean_of_link_nodes_to_link, map_node_to_cell, map_link_vector_components_to_node, map_min_of_node_links_to_node
+from grid_mappers import get_mappers
+from erosion_kernel import LAYOUTS, get_workspace, mud_erosion
+try:
+    from map_fun import invalidate_velocity_products, velocity_products
+except ImportError:
+    from passive_particles.map_fun import invalidate_velocity_products, velocity_products
+
+# node fields read by totalsedimenterosion_mudsine
+EROSION_FIELDS = ('tau_cr_node', 'flood_tide_flow__velocity_node', 'roughness_node', 'mean_water__depth')
 
 
 def map_velocity_components_to_nodes(grid):
@@ -24,7 +34,10 @@ def map_velocity_components_to_nodes(grid):
     return (ebb_vel_x, ebb_vel_y, flood_vel_x, flood_vel_y, ebb_vel, flood_vel)
 
 def plot_tidal_flow(grid, resample=1):
-    (ebb_x, ebb_y, flood_x, flood_y, ebb, flood) = map_velocity_components_to_nodes(grid)
+    # node velocities shared with the passive_particles plots, mapped once per flow solution
+    products = velocity_products(grid)
+    ebb = products.magnitude
+    flood = -products.magnitude
 
     # depth
     plt.figure()
@@ -34,20 +47,8 @@ def plot_tidal_flow(grid, resample=1):
     plt.ylabel('Distance (m)')
 
     # down-sample for legible quiver plots if needed
-    if resample != 1:
-        xr = grid.x_of_node.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-        yr = grid.y_of_node.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-        ebb_xr = ebb_x.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-        ebb_yr = ebb_y.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-        fld_xr = flood_x.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-        fld_yr = flood_y.reshape((grid.number_of_node_rows, grid.number_of_node_columns))[::resample, ::resample]
-    else:
-        xr = grid.x_of_node
-        yr = grid.y_of_node
-        ebb_xr = ebb_x
-        ebb_yr = ebb_y
-        fld_xr = flood_x
-        fld_yr = flood_y
+    (xr, yr, ebb_xr, ebb_yr) = products.quiver(resample, 'ebb')
+    (_, _, fld_xr, fld_yr) = products.quiver(resample, 'flood')
         
     # ebb tide
     plt.figure()
@@ -80,15 +81,36 @@ def plot_tidal_flow(grid, resample=1):
     plt.ylabel('Distance (m)')
     
 def map_node2cell_addGrid(grid,var1,var2): #takes a grid, plus the variable you want to map to cell, and the string name
-    a = grid.map_node_to_cell(var1)
+    a = get_mappers(grid).node_to_cell(var1)
     return grid.add_field(var2, a, at='cell',clobber=True)
     
 def map_link2cell_addGrid(grid,var1,var2): #takes a grid, plus the variable you want to map to cell, and the string name
-    a = grid.map_min_of_node_links_to_node(var1)
-    b = grid.map_node_to_cell(a)
+    b = get_mappers(grid).min_of_node_links_to_cell(var1)
     return grid.add_field(var2, b, at='cell',clobber=True)
     
-def populateGrids(grid, tfc, tau_cr, tau_crv, veg):
+def _field_buffer(grid, name, at, units='-'):
+    """Return the array of field name at the given location, adding it as zeros the first time."""
+    fields = getattr(grid, 'at_' + at)
+    if name in fields:
+        return fields[name]
+    return grid.add_zeros(name, at=at, units=units)
+
+def populateGrids(grid, tfc, tau_cr, tau_crv, veg, inplace=False, tiler=None, active=None):
+    """Populate the node, link and cell fields used in the erosion calculations.
+
+    With inplace=True every derived field is allocated on the first call and
+    overwritten in place (out= buffers) on later calls, instead of being replaced
+    with add_field(..., clobber=True). Passing a tiling.TiledExecutor as tiler
+    implies inplace and runs the link to node mappings on its thread pool.
+    Passing an active_nodes.ActiveNodes as active implies inplace; the fields are
+    still mapped at every node here, so the closed nodes hold the same values as
+    with the full mappings, and updategrids with the same active then refreshes
+    the active nodes only.
+    """
+    if inplace or tiler is not None or active is not None:
+        return _populate_grids_inplace(grid, tfc, tau_cr, tau_crv, tiler, active)
+
+    mappers = get_mappers(grid)
     rate = tfc.calc_tidal_inundation_rate()
     grid.add_field('tidal_innundation_rate',rate,at = 'node',units='m/s',clobber=True)
     map_node2cell_addGrid(grid,rate,'tidal_innundation_rate_cell')
@@ -98,6 +120,7 @@ def populateGrids(grid, tfc, tau_cr, tau_crv, veg):
     map_node2cell_addGrid(grid,tfc._water_depth,'effective_water_depth_cell')
     
     tfc.run_one_step()
+    invalidate_velocity_products(grid)
 
     topo = grid.at_node['topographic__elevation']
     map_node2cell_addGrid(grid,topo,'topographic_elevation_cell')
@@ -115,42 +138,57 @@ def populateGrids(grid, tfc, tau_cr, tau_crv, veg):
     
     lev_an = -topo-msl #water depth with respect to MSL
     grid.add_field('lev_at_node',lev_an,at = 'node',clobber=True)
-    lev_atlink = grid.map_mean_of_link_nodes_to_link('lev_at_node')
+    lev_atlink = mappers.mean_of_link_nodes_to_link(lev_an)
     map_node2cell_addGrid(grid,lev_an,'lev_at_cell')
 
-    taucr = grid.add_zeros('tau_cr',at='link') + tau_cr
+    taucr = _field_buffer(grid,'tau_cr','link')
+    taucr[:] = tau_cr
     v = grid.at_link['veg_atlink'] 
     taucr[v==1] = tau_crv
-    taucr_node = grid.map_min_of_node_links_to_node(taucr)
+    taucr_node = mappers.min_of_node_links_to_node(taucr)
     grid.add_field('tau_cr_node',taucr_node,at='node',clobber=True)
     map_link2cell_addGrid(grid,taucr,'tau_cr_cell')
     
     ebb = grid.at_link['ebb_tide_flow__velocity']
-    ebb_node = grid.map_min_of_node_links_to_node(ebb)
+    ebb_node = mappers.min_of_node_links_to_node(ebb)
     grid.add_field('ebb_tide_flow__velocity_node',ebb_node,at='node',clobber=True)
     grid.add_field('flood_tide_flow__velocity_node',-ebb_node,at='node',clobber=True)
-    map_node2cell_addGrid(grid,ebb,'ebb_tide_flow__velocity_cell')
-    map_node2cell_addGrid(grid,-ebb,'flood_tide_flow__velocity_cell')
+    # the link velocities are indexed by the node of each cell (the first number_of_nodes links)
+    map_node2cell_addGrid(grid,ebb[:grid.number_of_nodes],'ebb_tide_flow__velocity_cell')
+    map_node2cell_addGrid(grid,-ebb[:grid.number_of_nodes],'flood_tide_flow__velocity_cell')
     
     rough = grid.at_link['roughness']
-    rough_node = grid.map_min_of_node_links_to_node(rough)
+    rough_node = mappers.min_of_node_links_to_node(rough)
     grid.add_field('roughness_node',rough_node,at='node',clobber=True)
     map_link2cell_addGrid(grid,rough,'roughness_cell')
     
     grid.add_field('water_depth_at_link',tfc._water_depth_at_links,at = 'link',units='m',clobber=True)
     wd = tfc._water_depth_at_links
-    wd_node = grid.map_min_of_node_links_to_node(wd)
+    wd_node = mappers.min_of_node_links_to_node(wd)
     grid.add_field('water_depth_at_node',wd_node,at='node',clobber=True)
     map_link2cell_addGrid(grid,tfc._water_depth_at_links,'water_depth_at_cell')
     
 
-def totalsedimenterosion_mudsine(grid, mud_erodability,tr,tcg):
+def totalsedimenterosion_mudsine(grid, mud_erodability,tr,tcg, tiler=None, active=None, min_depth=0.0, jit=False):
+    """Erosion rate at nodes for the peak intra-tidal velocity.
+
+    The stress and erosion are evaluated by the fused erosion_kernel.mud_erosion
+    (numba loop if jit, see there; nodes with depth <= min_depth are dry).
+    With a tiling.TiledExecutor as tiler the nodes are processed in row tiles on
+    its thread pool, writing into the existing erosion/utide/tauC fields (the
+    returned array is then reused by later calls). With an
+    active_nodes.ActiveNodes as active only the active nodes are evaluated, on
+    packed arrays, and the closed nodes (no flow, no erosion) are set to zero.
+    """
+    if active is not None:
+        return _totalsedimenterosion_mudsine_active(grid, mud_erodability, active, min_depth, jit)
+    if tiler is not None:
+        return _totalsedimenterosion_mudsine_tiled(grid, mud_erodability, tiler, min_depth, jit)
 
     fupeak = np.pi/2
     #total sed erosion for loop
     ntdcy = 10 #number of tidal cycles
     taucr = grid.at_node['tau_cr_node']
-    E = np.zeros(taucr.size)
     
     # lev = grid.at_node['lev_at_node']
     # xi = -lev-tr/2
@@ -162,43 +200,250 @@ def totalsedimenterosion_mudsine(grid, mud_erodability,tr,tcg):
     #h = grid.at_node['water_depth_at_node']
     h = grid.at_node['mean_water__depth']
     
-    tauC = 1025*9.81* (rough**2) * (utide**2) * (h**(-1/3))
-    E += mud_erodability*(np.sqrt(1+(tauC/taucr)**2)-1)
+    tauC = np.empty(taucr.size)
+    E = mud_erosion(rough, utide, h, taucr, mud_erodability, tauC=tauC, min_depth=min_depth, jit=jit,
+                    workspace=get_workspace(grid, 'node', taucr.size))
     
     grid.add_field('erosion',E,at='node',clobber=True)
     grid.add_field('utide',utide,at='node',clobber=True)
     grid.add_field('tauC',tauC,at='node',clobber=True)
     return E
     
-def totalsedimenterosion_mudsine_link(grid, mud_erodability):
+def _totalsedimenterosion_mudsine_tiled(grid, mud_erodability, tiler, min_depth=0.0, jit=False):
+    """totalsedimenterosion_mudsine evaluated tile by tile."""
+    fupeak = np.pi/2
+    taucr = grid.at_node['tau_cr_node']
+    flood = grid.at_node['flood_tide_flow__velocity_node']
+    rough = grid.at_node['roughness_node']
+    h = grid.at_node['mean_water__depth']
+    E = _field_buffer(grid,'erosion','node')
+    utide = _field_buffer(grid,'utide','node')
+    tauC = _field_buffer(grid,'tauC','node')
+
+    def kernel(sl):
+        np.multiply(flood[sl], fupeak, out=utide[sl])
+        utide[sl] *= np.sin(np.pi/2)
+        # one workspace per tile, as the tiles run concurrently
+        ws = get_workspace(tiler, sl.start, sl.stop - sl.start)
+        mud_erosion(rough[sl], utide[sl], h[sl], taucr[sl], mud_erodability, out=E[sl], tauC=tauC[sl],
+                    workspace=ws, min_depth=min_depth, jit=jit)
 
+    tiler.map(kernel)
+    return E
+
+def _totalsedimenterosion_mudsine_active(grid, mud_erodability, active, min_depth=0.0, jit=False):
+    """totalsedimenterosion_mudsine evaluated on the packed active nodes."""
     fupeak = np.pi/2
-    #total sed erosion for loop
-    ntdcy = 10 #number of tidal cycles
-    E = grid.add_zeros('Erosion',at = 'cell')
-    taucr = grid.at_cell['tau_cr_cell']
-    
-    # get rid of for loop
-    #for i in range(ntdcy):
-    utide = grid.at_cell['flood_tide_flow__velocity_cell']*fupeak*np.sin(np.pi/2) #intra-tidal velocity
-    print(utide.mean())
-    tauC = 1025*9.81* grid.at_cell['roughness_cell']**2 * utide**2 * grid.at_cell['water_depth_at_cell']**(-1/3)
-    E += mud_erodability*(np.sqrt(1+(tauC/taucr)**2)-1)
-    #print(max(E))
-
-def updategrids(grid, tfc): #need to update grids used in totalsedimenterosion_mudsine that were changed by tidal_flow_calculator
+    # the kernel writes the erosion over the packed depth and the stress over
+    # the packed roughness, so five active-sized arrays are alive at most
+    utide = active.pack(grid.at_node['flood_tide_flow__velocity_node'])
+    utide *= fupeak
+    utide *= np.sin(np.pi/2)
+    tauC = active.pack(grid.at_node['roughness_node'])
+    E = active.pack(grid.at_node['mean_water__depth'])
+    taucr = active.pack(grid.at_node['tau_cr_node'])
+    mud_erosion(tauC, utide, E, taucr, mud_erodability, out=E, tauC=tauC, min_depth=min_depth, jit=jit,
+                workspace=get_workspace(active, 'node', active.size))
+    del taucr
+
+    for name, packed in (('erosion', E), ('utide', utide), ('tauC', tauC)):
+        out = _field_buffer(grid,name,'node')
+        out.fill(0)
+        active.scatter(packed, out)
+    return grid.at_node['erosion']
+
+def tidal_phase_factors(nsub=10, cycle_scale=None):
+    """Intra-tidal velocity factors for every sub-step of every tidal cycle.
+
+    The intra-tidal velocity is fupeak*sin(phase) times the node velocity, with the
+    phase sampled at the midpoints of nsub sub-steps of each half cycle (ebb and flood
+    are symmetric). cycle_scale optionally scales the velocity cycle by cycle (e.g. a
+    spring-neap modulation) and sets the number of cycles, one cycle without it.
+    Returns an array of length nsub*len(cycle_scale) to multiply the node velocity with.
+    """
+    fupeak = np.pi/2
+    phase = (np.arange(nsub) + 0.5) * np.pi/nsub
+    u = fupeak*np.sin(phase)
+    scale = np.ones(1) if cycle_scale is None else np.asarray(cycle_scale, dtype=float)
+    if scale.ndim != 1 or scale.size == 0:
+        raise ValueError('cycle_scale must be a non-empty 1D sequence')
+    return (scale[:, np.newaxis] * u).ravel()
+
+def totalsedimenterosion_mudsine_cycles(grid, mud_erodability, tr, tcg, nsub=10, cycle_scale=None, min_depth=0.0, jit=False):
+    """Tidally averaged erosion rate over nsub sub-steps of the tidal cycles of cycle_scale.
+
+    Averaged version of totalsedimenterosion_mudsine: every phase is evaluated by the
+    fused erosion_kernel.mud_erosion (nodes with depth <= min_depth are dry) and the
+    erosion rates are averaged over all phases. nsub=1 reproduces the single
+    peak-phase result. Without cycle_scale one cycle is evaluated (identical cycles
+    have the same average); phases with the same velocity factor, e.g. cycles with
+    the same scale, are evaluated once and weighted by their count.
+    Uses the same grid fields as totalsedimenterosion_mudsine.
+    """
+    taucr = grid.at_node['tau_cr_node']
+    upeak = grid.at_node['flood_tide_flow__velocity_node']
+    rough = grid.at_node['roughness_node']
+    h = grid.at_node['mean_water__depth']
+
+    factors, counts = np.unique(tidal_phase_factors(nsub, cycle_scale), return_counts=True)
+    workspace = get_workspace(grid, 'node', taucr.size)
+    utide = np.empty(taucr.size)
+    tauC = np.empty(taucr.size)
+    Ephase = np.empty(taucr.size)
+    E = np.zeros(taucr.size)
+    for f, count in zip(factors, counts):
+        np.multiply(upeak, f, out=utide)
+        mud_erosion(rough, utide, h, taucr, mud_erodability, out=Ephase, tauC=tauC,
+                    workspace=workspace, min_depth=min_depth, jit=jit)
+        Ephase *= count
+        E += Ephase
+    E /= counts.sum()
+
+    grid.add_field('erosion',E,at='node',clobber=True)
+    return E
+
+def totalsedimenterosion_mudsine_link(grid, mud_erodability, at='cell', min_depth=0.0, jit=False):
+    """Erosion rate at cells (or links, at='link') for the peak intra-tidal velocity.
+
+    Same fused kernel as totalsedimenterosion_mudsine on the fields of
+    erosion_kernel.LAYOUTS[at] (the link layout reads the tau_cr link field of
+    populateGrids, eager or in place); writes the Erosion, utide and tauC
+    fields at that location in place and returns Erosion.
+    """
+    fupeak = np.pi/2
+    fields = getattr(grid, 'at_' + at)
+    rough, flood, h, taucr = (fields[name] for name in LAYOUTS[at])
+    E = _field_buffer(grid,'Erosion',at)
+    utide = _field_buffer(grid,'utide',at)
+    tauC = _field_buffer(grid,'tauC',at)
+    np.multiply(flood, fupeak, out=utide) #intra-tidal velocity
+    utide *= np.sin(np.pi/2)
+    return mud_erosion(rough, utide, h, taucr, mud_erodability, out=E, tauC=tauC, min_depth=min_depth, jit=jit,
+                       workspace=get_workspace(grid, at, E.size))
+
+def _link_to_node_min(grid, tiler, active):
+    """The link -> node minimum of the active nodes, the tiler or the grid mappers."""
+    if active is not None:
+        return active.min_of_node_links_to_node
+    if tiler is not None:
+        return tiler.min_of_node_links_to_node
+    return get_mappers(grid).min_of_node_links_to_node
+
+def _populate_grids_inplace(grid, tfc, tau_cr, tau_crv, tiler=None, active=None):
+    """populateGrids writing into preallocated field arrays."""
+    mappers = get_mappers(grid)
+    node2cell = mappers.node_to_cell
+    # every node, also with active: the closed nodes keep these values, which the
+    # plain erosion kernel reads (a zero tau_cr_node there would give 0/0)
+    min2node = _link_to_node_min(grid, tiler, None)
+
+    rate = _field_buffer(grid,'tidal_innundation_rate','node',units='m/s')
+    rate[:] = tfc.calc_tidal_inundation_rate()
+    node2cell(rate, out=_field_buffer(grid,'tidal_innundation_rate_cell','cell'))
+
+    # as in populateGrids these two fields share memory with the tfc arrays, so they
+    # follow every later flow solve without being copied
+    tfc._calc_effective_water_depth()
+    if 'effective_water_depth' not in grid.at_node:
+        grid.add_field('effective_water_depth',tfc._water_depth,at='node',units='m')
+    ewd = grid.at_node['effective_water_depth']
+    node2cell(ewd, out=_field_buffer(grid,'effective_water_depth_cell','cell'))
+
+    tfc.run_one_step()
+    invalidate_velocity_products(grid)
+
+    topo = grid.at_node['topographic__elevation']
+    node2cell(topo, out=_field_buffer(grid,'topographic_elevation_cell','cell'))
+
+    msl = tfc._mean_sea_level
+    dHW = _field_buffer(grid,'water_depth_at_MHW','node',units='m')
+    np.add(topo, msl, out=dHW)
+    dHW += tfc._tidal_half_range
+    np.maximum(dHW, 0, out=dHW)
+    dHW[topo==999] = 0
+
+    ftide = _field_buffer(grid,'hydroperiod','node',units='m')
+    np.divide(dHW, tfc._tidal_range, out=ftide)
+    np.maximum(ftide, 10^-3, out=ftide)
+    np.minimum(ftide, 1, out=ftide)
+    node2cell(ftide, out=_field_buffer(grid,'hydroperiod_cell','cell'))
+    node2cell(dHW, out=_field_buffer(grid,'water_depth_at_MHW_cell','cell'))
+
+    lev_an = _field_buffer(grid,'lev_at_node','node')
+    np.negative(topo, out=lev_an)
+    lev_an -= msl
+    node2cell(lev_an, out=_field_buffer(grid,'lev_at_cell','cell'))
+
+    taucr = _field_buffer(grid,'tau_cr','link')
+    taucr[:] = tau_cr
+    taucr[grid.at_link['veg_atlink']==1] = tau_crv
+    taucr_node = min2node(taucr, out=_field_buffer(grid,'tau_cr_node','node'))
+    node2cell(taucr_node, out=_field_buffer(grid,'tau_cr_cell','cell'))
+
+    ebb = grid.at_link['ebb_tide_flow__velocity']
+    ebb_node = min2node(ebb, out=_field_buffer(grid,'ebb_tide_flow__velocity_node','node'))
+    np.negative(ebb_node, out=_field_buffer(grid,'flood_tide_flow__velocity_node','node'))
+    # as in populateGrids, the link velocities are indexed by the node of each cell
+    ebb_cell = node2cell(ebb[:grid.number_of_nodes], out=_field_buffer(grid,'ebb_tide_flow__velocity_cell','cell'))
+    np.negative(ebb_cell, out=_field_buffer(grid,'flood_tide_flow__velocity_cell','cell'))
+
+    rough_node = min2node(grid.at_link['roughness'], out=_field_buffer(grid,'roughness_node','node'))
+    node2cell(rough_node, out=_field_buffer(grid,'roughness_cell','cell'))
+
+    if 'water_depth_at_link' not in grid.at_link:
+        grid.add_field('water_depth_at_link',tfc._water_depth_at_links,at='link',units='m')
+    wd = grid.at_link['water_depth_at_link']
+    wd_node = min2node(wd, out=_field_buffer(grid,'water_depth_at_node','node'))
+    node2cell(wd_node, out=_field_buffer(grid,'water_depth_at_cell','cell'))
+
+def _update_grids_inplace(grid, tfc, tiler=None, active=None):
+    """updategrids writing into the preallocated field arrays, no per-step allocation of fields."""
+    min2node = _link_to_node_min(grid, tiler, active)
+    if tiler is None:
+        def each_tile(kernel):
+            kernel(slice(None))
+    else:
+        each_tile = tiler.map
+
+    ebb_node = min2node(grid.at_link['ebb_tide_flow__velocity'], out=_field_buffer(grid,'ebb_tide_flow__velocity_node','node'))
+    flood_node = _field_buffer(grid,'flood_tide_flow__velocity_node','node')
+
+    min2node(grid.at_link['roughness'], out=_field_buffer(grid,'roughness_node','node'))
+
+    wd = _field_buffer(grid,'water_depth_at_link','link',units='m')
+    if wd is not tfc._water_depth_at_links:
+        wd[:] = tfc._water_depth_at_links
+    min2node(wd, out=_field_buffer(grid,'water_depth_at_node','node'))
+
+    topo = grid.at_node['topographic__elevation']
+    lev_an = _field_buffer(grid,'lev_at_node','node')
+    msl = tfc._mean_sea_level
+
+    def kernel(sl):
+        np.negative(ebb_node[sl], out=flood_node[sl])
+        np.negative(topo[sl], out=lev_an[sl])
+        lev_an[sl] -= msl
+
+    each_tile(kernel)
+
+def updategrids(grid, tfc, inplace=False, tiler=None, active=None): #need to update grids used in totalsedimenterosion_mudsine that were changed by tidal_flow_calculator
+    invalidate_velocity_products(grid)
+    if inplace or tiler is not None or active is not None:
+        return _update_grids_inplace(grid, tfc, tiler, active)
+
+    mappers = get_mappers(grid)
     ebb = grid.at_link['ebb_tide_flow__velocity']
-    ebb_node = grid.map_min_of_node_links_to_node(ebb)
+    ebb_node = mappers.min_of_node_links_to_node(ebb)
     grid.add_field('ebb_tide_flow__velocity_node',ebb_node,at='node',clobber=True)
     grid.add_field('flood_tide_flow__velocity_node',-ebb_node,at='node',clobber=True)
     
     rough = grid.at_link['roughness']
-    rough_node = grid.map_min_of_node_links_to_node(rough)
+    rough_node = mappers.min_of_node_links_to_node(rough)
     grid.add_field('roughness_node',rough_node,at='node',clobber=True)
     
     grid.add_field('water_depth_at_link',tfc._water_depth_at_links,at = 'link',units='m',clobber=True)
     wd = tfc._water_depth_at_links
-    wd_node = grid.map_min_of_node_links_to_node(wd)
+    wd_node = mappers.min_of_node_links_to_node(wd)
     grid.add_field('water_depth_at_node',wd_node,at='node',clobber=True)
     
     msl = tfc._mean_sea_level
@@ -0,0 +1,344 @@
+"""
+Warm-started tidal flow solve for the morphodynamic loop
+Based on G. Tucker tidal_flow_calculator.py in landlab component (Mariotti 2018 approach)
+Keeps the previous water-surface solution as the initial guess, assembles the core-node
+matrix into a fixed sparse structure and reuses the preconditioner while the diffusion
+coefficients change little between steps (the bed only moves millimetres per step)
+The first solve, which has no previous solution, can start from the solution of the same
+problem on coarsened copies of the grid (coarse-to-fine initialization)
+"""
+
+# imports
+import time
+import numpy as np
+from scipy.ndimage import distance_transform_edt, map_coordinates
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator, bicgstab, cg, gmres, spilu, spsolve
+from landlab import RasterModelGrid
+from landlab.components import TidalFlowCalculator
+from landlab.grid.mappers import map_mean_of_link_nodes_to_link, map_min_of_link_nodes_to_link
+
+_FOUR_THIRDS = 4.0 / 3.0
+
+
+def _scipy_solver(func):
+    """Wrap a scipy.sparse.linalg Krylov solver as solver(mat, rhs, x0, M, rtol, maxiter)."""
+    def solve(mat, rhs, x0, M, rtol, maxiter):
+        count = [0]
+
+        def callback(*args):
+            count[0] += 1
+
+        kwargs = {}
+        if func is gmres:
+            kwargs['callback_type'] = 'pr_norm'
+        x, info = func(mat, rhs, x0=x0, M=M, rtol=rtol, maxiter=maxiter, callback=callback, **kwargs)
+        return x, info, count[0]
+    return solve
+
+SOLVERS = {
+    'cg': _scipy_solver(cg),
+    'bicgstab': _scipy_solver(bicgstab),
+    'gmres': _scipy_solver(gmres),
+}
+
+
+def _blocks(values, shape, factor, fill):
+    """Node values as (rows, cols, factor*factor) blocks, padded with fill to whole blocks."""
+    nr, nc = shape
+    cr, cc = -(-nr // factor), -(-nc // factor)
+    padded = np.full((cr*factor, cc*factor), fill, dtype=np.asarray(values).dtype)
+    padded[:nr, :nc] = np.reshape(values, shape)
+    return padded.reshape(cr, factor, cc, factor).swapaxes(1, 2).reshape(cr, cc, factor*factor)
+
+
+def coarsen_grid(grid, factor, roughness):
+    """Raster grid coarsened factor times, with topographic__elevation and roughness.
+
+    Every coarse node covers a block of factor x factor nodes: it is closed if
+    all of them are, a fixed-value boundary if any of them is (or if it lies on
+    the perimeter and is not closed), and takes the mean elevation of their
+    open nodes and the roughness with their mean 1/n**2 (the flow conductance
+    of narrow smooth channels is not lost). Open fine paths stay connected on
+    the coarse grid, so the coarse system is as well posed as the fine one.
+    """
+    if not isinstance(grid, RasterModelGrid):
+        raise TypeError('Coarsening requires a raster grid')
+    closed = _blocks(grid.status_at_node == grid.BC_NODE_IS_CLOSED, grid.shape, factor, True)
+    fixed = _blocks(grid.status_at_node == grid.BC_NODE_IS_FIXED_VALUE, grid.shape, factor, False)
+    open_count = np.maximum((~closed).sum(axis=2), 1)
+
+    def open_mean(values):
+        return np.where(closed, 0.0, _blocks(values, grid.shape, factor, 0.0)).sum(axis=2) / open_count
+
+    coarse = RasterModelGrid(closed.shape[:2], xy_spacing=(grid.dx*factor, grid.dy*factor),
+                             xy_of_lower_left=grid.xy_of_lower_left)
+    coarse.add_field('topographic__elevation', open_mean(grid.at_node['topographic__elevation']).ravel(),
+                     at='node')
+    # node roughness: mean of the links at each node
+    nodes = grid.nodes_at_link.ravel()
+    link_sum = np.bincount(nodes, weights=np.repeat(np.broadcast_to(roughness, grid.number_of_links), 2),
+                           minlength=grid.number_of_nodes)
+    rough = link_sum / np.maximum(np.bincount(nodes, minlength=grid.number_of_nodes), 1)
+    rough = 1.0 / np.sqrt(np.maximum(open_mean(1.0 / np.maximum(rough, 1e-12)**2), 1e-24))
+    coarse.add_field('roughness', map_mean_of_link_nodes_to_link(coarse, rough.ravel()), at='link')
+
+    status = np.full(closed.shape[:2], coarse.BC_NODE_IS_CORE, dtype=coarse.status_at_node.dtype)
+    status[[0, -1], :] = coarse.BC_NODE_IS_FIXED_VALUE
+    status[:, [0, -1]] = coarse.BC_NODE_IS_FIXED_VALUE
+    status[fixed.any(axis=2)] = coarse.BC_NODE_IS_FIXED_VALUE
+    status[closed.all(axis=2)] = coarse.BC_NODE_IS_CLOSED
+    coarse.status_at_node = status.ravel()
+    return coarse
+
+
+def prolong(values, grid, factor, shape, to_factor=1):
+    """Bilinear interpolation of node values of a coarsen_grid(..., factor) grid to a finer level.
+
+    Inputs :
+        values : `numpy.ndarray`
+            values at the nodes of the coarse grid; those at its closed nodes
+            are replaced with the nearest open value first
+
+        grid : `obj`
+            the coarse grid
+
+        factor : `int`
+            its coarsening factor
+
+        shape : `tuple`
+            node shape of the target level
+
+        to_factor : `int`
+            coarsening factor of the target level (1: the original grid)
+
+    Returns :
+        values : `numpy.ndarray`
+            flat values at the nodes of the target level
+    """
+    values = np.reshape(values, grid.shape)
+    closed = np.reshape(grid.status_at_node == grid.BC_NODE_IS_CLOSED, grid.shape)
+    if closed.any() and not closed.all():
+        nearest = distance_transform_edt(closed, return_distances=False, return_indices=True)
+        values = values[tuple(nearest)]
+    # node k of a level with factor f sits at the centre of fine nodes k*f ... k*f + f - 1
+    rows, cols = (((np.arange(n)*to_factor + (to_factor - 1)/2) - (factor - 1)/2) / factor for n in shape)
+    coords = np.meshgrid(rows, cols, indexing='ij')
+    return map_coordinates(values, coords, order=1, mode='nearest').ravel()
+
+
+class WarmStartTidalFlowCalculator(TidalFlowCalculator):
+    """TidalFlowCalculator with a warm-started, structure-reusing iterative solve.
+
+    Drop-in replacement for the landlab component in the erode -> run_one_step ->
+    updategrids loop. Extra keyword arguments:
+
+    solver : 'cg', 'bicgstab', 'gmres', 'direct' or a callable
+        solver(mat, rhs, x0, M, rtol, maxiter) returning (x, info, iterations).
+        The matrix passed is the symmetric positive definite form of the
+        core-node system.
+    preconditioner : 'ilu', 'jacobi' or None
+    precond_rtol : float
+        Maximum relative change (2-norm) of the link diffusion coefficients
+        before the preconditioner is rebuilt.
+    rtol, maxiter : tolerance and iteration limit of the iterative solver. A
+        solve that does not converge falls back to a direct solve.
+    coarsen : sequence of int (optional)
+        Coarsening factors, e.g. (4, 2), of a coarse-to-fine initialization of
+        the first solve (raster grids): the flow is solved on the grid
+        coarsened by each factor in turn, largest first, every level starting
+        from the interpolated solution of the previous one, and the last
+        coarse solution is the initial guess of the fine solve. Later solves
+        start from the previous solution as usual. coarse_iterations holds
+        the iterations of the coarse levels and coarse_time the seconds they
+        took.
+    """
+
+    def __init__(self, grid, solver='cg', preconditioner='ilu', precond_rtol=0.1,
+                 rtol=1e-10, maxiter=1000, ilu_drop_tol=1e-6, ilu_fill_factor=20, coarsen=None, **kwds):
+        super().__init__(grid, **kwds)
+        self._kwds = kwds
+        if isinstance(solver, str) and solver != 'direct':
+            solver = SOLVERS[solver]
+        self._solver = solver
+        self._preconditioner = preconditioner
+        self._precond_rtol = precond_rtol
+        self._rtol = rtol
+        self._maxiter = maxiter
+        self._ilu_drop_tol = ilu_drop_tol
+        self._ilu_fill_factor = ilu_fill_factor
+        self._coarsen = sorted(set(int(f) for f in coarsen or ()) - {1}, reverse=True)
+        self._solved = False
+        self.coarse_iterations = []
+        self.coarse_time = 0.0
+
+        self._tidal_wse = np.zeros(grid.number_of_nodes)
+        self._tidal_wse_grad = np.zeros(grid.number_of_links)
+        self._status = None
+        self._precond = None
+        self._precond_coef = None
+        self.last_iterations = 0
+        self.total_iterations = 0
+        self.preconditioner_builds = 0
+        self.direct_solves = 0
+
+    def _build_structure(self):
+        """Index arrays and sparse pattern of the core-node matrix (rebuilt if boundaries change)."""
+        grid = self.grid
+        self._status = grid.status_at_node.copy()
+        ncore = grid.number_of_core_nodes
+        core_node_at_node = -np.ones(grid.number_of_nodes, dtype=int)
+        core_node_at_node[grid.core_nodes] = np.arange(ncore)
+
+        c2c = grid.link_with_node_status(status_at_tail=grid.BC_NODE_IS_CORE, status_at_head=grid.BC_NODE_IS_CORE)
+        c2fv = grid.link_with_node_status(status_at_tail=grid.BC_NODE_IS_CORE, status_at_head=grid.BC_NODE_IS_FIXED_VALUE)
+        fv2c = grid.link_with_node_status(status_at_tail=grid.BC_NODE_IS_FIXED_VALUE, status_at_head=grid.BC_NODE_IS_CORE)
+
+        self._c2c = c2c
+        self._cc = core_node_at_node[grid.nodes_at_link[c2c]]
+        self._bnd_links = np.concatenate((c2fv, fv2c))
+        self._bnd_core = core_node_at_node[np.concatenate((grid.node_at_link_tail[c2fv], grid.node_at_link_head[fv2c]))]
+        self._bnd_node = np.concatenate((grid.node_at_link_head[c2fv], grid.node_at_link_tail[fv2c]))
+        self._matrix_links = np.concatenate((c2c, self._bnd_links))
+
+        # label each entry (diagonal, upper, lower) and let scipy place it in CSR order
+        diag = np.arange(ncore)
+        rows = np.concatenate((diag, self._cc[:, 0], self._cc[:, 1]))
+        cols = np.concatenate((diag, self._cc[:, 1], self._cc[:, 0]))
+        labels = np.arange(1, rows.size + 1, dtype=float)
+        pattern = csr_matrix((labels, (rows, cols)), shape=(ncore, ncore))
+        pattern.sort_indices()
+        self._entry_order = pattern.data.astype(int) - 1
+        self._entries = np.zeros(rows.size)
+        self._mat = csr_matrix((np.zeros(rows.size), pattern.indices, pattern.indptr), shape=(ncore, ncore))
+
+        self._precond = None
+        self._precond_coef = None
+
+    def _assemble(self, coef):
+        """Fill the matrix values (positive definite form) for the link coefficients."""
+        ncore = self.grid.number_of_core_nodes
+        c_cc = coef[self._c2c]
+        diag = self._entries[:ncore]
+        diag[:] = np.bincount(self._cc[:, 0], weights=c_cc, minlength=ncore)
+        diag += np.bincount(self._cc[:, 1], weights=c_cc, minlength=ncore)
+        diag += np.bincount(self._bnd_core, weights=coef[self._bnd_links], minlength=ncore)
+        nc = c_cc.size
+        np.negative(c_cc, out=self._entries[ncore:ncore+nc])
+        np.negative(c_cc, out=self._entries[ncore+nc:])
+        np.take(self._entries, self._entry_order, out=self._mat.data)
+
+    def _update_preconditioner(self, coef):
+        """Rebuild the preconditioner only if the coefficients moved more than precond_rtol."""
+        if self._preconditioner is None:
+            return None
+        c = coef[self._matrix_links]
+        if self._precond is not None:
+            change = np.linalg.norm(c - self._precond_coef) / np.linalg.norm(self._precond_coef)
+            if change <= self._precond_rtol:
+                return self._precond
+        if self._preconditioner == 'ilu':
+            # symmetric ordering without pivoting keeps the factors close to an incomplete Cholesky
+            ilu = spilu(self._mat.tocsc(), drop_tol=self._ilu_drop_tol, fill_factor=self._ilu_fill_factor,
+                        permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0)
+            self._precond = LinearOperator(self._mat.shape, ilu.solve)
+        elif self._preconditioner == 'jacobi':
+            inv_diag = 1.0 / self._mat.diagonal()
+            self._precond = LinearOperator(self._mat.shape, lambda x: inv_diag * x)
+        else:
+            raise ValueError('Unknown preconditioner: ' + str(self._preconditioner))
+        self._precond_coef = c.copy()
+        self.preconditioner_builds += 1
+        return self._precond
+
+    def get_state(self):
+        """Arrays the next solve depends on (warm start and preconditioner), for checkpoints."""
+        state = {'tidal_wse': self._tidal_wse.copy()}
+        if self._precond_coef is not None:
+            state['precond_coef'] = self._precond_coef.copy()
+        return state
+
+    def set_state(self, state):
+        """Restore get_state(); the preconditioner is rebuilt from the same coefficients."""
+        self._tidal_wse[:] = state['tidal_wse']
+        self._solved = True
+        self._build_structure()
+        if 'precond_coef' in state:
+            coef = np.zeros(self.grid.number_of_links)
+            coef[self._matrix_links] = state['precond_coef']
+            self._assemble(coef)
+            self._update_preconditioner(coef)
+
+    def _coarse_initial_guess(self):
+        """Water surface interpolated from the solves on the coarsened grids."""
+        kwds = dict(self._kwds, roughness='roughness')
+        solver_kwds = dict(preconditioner=self._preconditioner, rtol=self._rtol,
+                           maxiter=self._maxiter, ilu_drop_tol=self._ilu_drop_tol,
+                           ilu_fill_factor=self._ilu_fill_factor)
+
+        def solution(tfc):
+            wse = tfc._tidal_wse.copy()
+            wse[tfc.grid.status_at_node == tfc.grid.BC_NODE_IS_FIXED_VALUE] = tfc._mean_sea_level
+            return wse
+
+        previous = None
+        for factor in self._coarsen:
+            coarse = coarsen_grid(self.grid, factor, self.roughness)
+            # the coarsest level is small enough for a direct solve
+            solver = 'direct' if previous is None else self._solver
+            tfc = WarmStartTidalFlowCalculator(coarse, solver=solver, **solver_kwds, **kwds)
+            if previous is not None:
+                tfc._tidal_wse[:] = prolong(solution(previous[0]), previous[0].grid, previous[1],
+                                            coarse.shape, factor)
+            tfc.run_one_step()
+            self.coarse_iterations.append(tfc.last_iterations)
+            previous = (tfc, factor)
+        return prolong(solution(previous[0]), previous[0].grid, previous[1], self.grid.shape)
+
+    def run_one_step(self):
+        """Calculate the tidal flow field and water-surface elevation (warm-started)."""
+        grid = self.grid
+        if not self._solved and self._coarsen and self._solver != 'direct':
+            start = time.perf_counter()
+            self._tidal_wse[:] = self._coarse_initial_guess()
+            self.coarse_time = time.perf_counter() - start
+        self._solved = True
+        if self._status is None or not np.array_equal(self._status, grid.status_at_node):
+            self._build_structure()
+
+        # same hydraulic set-up as TidalFlowCalculator.run_one_step
+        self._calc_effective_water_depth()
+        self._boundary_mean_water_surf_elev[:] = self._mean_sea_level
+        map_min_of_link_nodes_to_link(grid, self._water_depth, out=self._water_depth_at_links)
+        velocity_coef = self._water_depth_at_links**_FOUR_THIRDS / (
+            (self.roughness**2) * self._scale_velocity
+        )
+        self._diffusion_coef_at_links[:] = self._water_depth_at_links * velocity_coef
+        tidal_inundation_rate = self.calc_tidal_inundation_rate()
+
+        cores = grid.core_nodes
+        self._assemble(self._diffusion_coef_at_links)
+        rhs = np.bincount(self._bnd_core, weights=self._boundary_mean_water_surf_elev[self._bnd_node],
+                          minlength=cores.size)
+        rhs -= self._grid_multiplier * tidal_inundation_rate[cores]
+
+        # solve, starting from the previous water surface
+        x0 = self._tidal_wse[cores]
+        if self._solver == 'direct':
+            wse, info, niter = spsolve(self._mat.tocsc(), rhs), 0, 0
+        else:
+            M = self._update_preconditioner(self._diffusion_coef_at_links)
+            wse, info, niter = self._solver(self._mat, rhs, x0, M, self._rtol, self._maxiter)
+            if info != 0:
+                wse = spsolve(self._mat.tocsc(), rhs)
+                self.direct_solves += 1
+        self.last_iterations = niter
+        self.total_iterations += niter
+        self._tidal_wse[:] = 0.0
+        self._tidal_wse[cores] = wse
+
+        # velocity at links, as in TidalFlowCalculator.run_one_step
+        grid.calc_grad_at_link(self._tidal_wse, out=self._tidal_wse_grad)
+        active = grid.active_links
+        self._flood_tide_vel[active] = -velocity_coef[active] * self._tidal_wse_grad[active]
+        self._ebb_tide_vel[:] = -self._flood_tide_vel
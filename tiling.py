@@ -0,0 +1,77 @@
+"""
+Tiled multi-core execution for node kernels on large DEMs
+Node arrays of a raster grid are split into blocks of whole rows and processed on a thread
+pool (numpy releases the GIL in the element-wise and gather kernels)
+The link-based mappers need the links of the rows just above and below a tile (its halo);
+all tiles share the full link arrays read-only, so the halo is read in place and every tile
+writes a disjoint range of nodes
+"""
+
+# imports
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from grid_mappers import get_mappers
+
+
+def row_tiles(grid, rows_per_tile):
+    """Node slices covering blocks of rows_per_tile rows of a raster grid."""
+    ncols = grid.number_of_node_columns
+    nrows = grid.number_of_node_rows
+    return [slice(r*ncols, min(r + rows_per_tile, nrows)*ncols) for r in range(0, nrows, rows_per_tile)]
+
+
+class TiledExecutor:
+    """Thread pool plus row tiles of one grid.
+
+    Inputs :
+        grid : `obj`
+            A landlab RasterModelGrid
+
+        workers : `int` (Optional)
+            Number of threads, defaults to the number of cores
+
+        rows_per_tile : `int` (Optional)
+            Rows per tile, defaults to about two tiles per worker
+    """
+
+    def __init__(self, grid, workers=None, rows_per_tile=None):
+        self.workers = workers or os.cpu_count() or 1
+        if rows_per_tile is None:
+            rows_per_tile = max(1, -(-grid.number_of_node_rows // (2*self.workers)))
+        self.tiles = row_tiles(grid, rows_per_tile)
+        self._mappers = get_mappers(grid)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        # per-tile gather scratch for the link -> node reductions
+        links_at_node = self._mappers._links_at_node
+        self._gather = [np.empty((links_at_node.shape[0], t.stop - t.start)) for t in self.tiles]
+
+    def map(self, kernel):
+        """Call kernel(node_slice) for every tile on the pool and return the results."""
+        return list(self._pool.map(kernel, self.tiles))
+
+    def min_of_node_links_to_node(self, values_at_link, out=None):
+        """Tiled GridMappers.min_of_node_links_to_node."""
+        mappers = self._mappers
+        if out is None:
+            out = np.empty(mappers.number_of_nodes)
+        padded = mappers._padded(values_at_link)
+        links_at_node = mappers._links_at_node
+
+        def kernel(i):
+            sl = self.tiles[i]
+            gathered = self._gather[i]
+            np.take(padded, links_at_node[:, sl], out=gathered, mode='clip')
+            mappers._min_of_rows(gathered, out[sl])
+
+        list(self._pool.map(kernel, range(len(self.tiles))))
+        return out
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()